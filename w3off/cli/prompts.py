@@ -124,14 +124,14 @@ def confirmSendRawTx(signed_tx: str):
     # chosen_chain = next((k for k, v in config.chains.items() if v['id'] == chain_id), None)
     chosen_chain = getChainName(chain_id)
     print(f"Note: This transaction is intended for the **{chosen_chain.upper()}** blockchain.")
-    if getChainName(w3.eth.chain_id) != chosen_chain:
+    if config.chain_name != chosen_chain:
         if config.DEBUG:
             print(f"{bcolors.WARNING}You are in DEBUG mode, but connecting to a real chain.{bcolors.ENDC}")
             if not promptConfirm("Are you sure you want to proceed?"):
                 print("Exiting the application...")
                 exit(0)
         change_chain(chosen_chain)
-    assert chain_id == w3.eth.chain_id, "Mismatch between chain_id in transaction and the one in the provider after its initizaliation."
+    assert chain_id == config.chain_id, "Mismatch between chain_id in transaction and the one in the provider after its initizaliation."
 
     current_gas_price = w3.eth.gas_price
     print(f"Current network gas price: {round(current_gas_price / 10**9, 4)} gwei")
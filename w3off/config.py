@@ -1,13 +1,8 @@
 import glob
 import json
+import marshal
 import os
-
-from yaml import load
-
-try:
-    from yaml import CLoader as Loader
-except ImportError:
-    from yaml import Loader
+import sys
 
 # Enable debug mode to use eth_tester instead of connection to an actual RPC mode
 DEBUG = False
@@ -23,46 +18,219 @@ else:
     chains_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),"chains.yaml")
     chains_uses_home_path = False
     print(f'Loading chains.yaml from your installed package directory...')
-stream = open(chains_file_path)
-chains = load(stream, Loader)
-stream.close()
+abi_files_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test", "data", "*.abi")
+
+# Parsed chains.yaml together with predefined ABIs is kept in a binary snapshot, which is rebuilt only when any of its sources change
+SNAPSHOT_VERSION = 2
+snapshot_file_path = os.path.join(os.path.dirname(chains_file_path), "chains.snapshot")
+use_snapshot = not os.environ.get("W3OFF_NO_CONFIG_SNAPSHOT")
+
+
+def config_snapshot_sources():
+    """Identifies everything the snapshot is built from: source files (with their mtime and size), DEBUG flag and Python version (marshal format)."""
+    files = []
+    for file_path in [chains_file_path, *sorted(glob.glob(abi_files_path))]:
+        stat = os.stat(file_path)
+        files.append((file_path, stat.st_mtime_ns, stat.st_size))
+    return (SNAPSHOT_VERSION, DEBUG, tuple(sys.version_info[:2]), tuple(files))
+
+
+def load_config_snapshot(sources):
+    """Returns `chains` from the snapshot if it has been built from the same `sources`, otherwise None."""
+    try:
+        with open(snapshot_file_path, "rb") as f:
+            snapshot = marshal.load(f)
+        if snapshot["sources"] == sources:
+            return snapshot["chains"]
+    except Exception as e:
+        pass  # missing, outdated or corrupted snapshot - just parse the sources again
+    return None
+
+
+def save_config_snapshot(sources, chains):
+    tmp_file_path = f"{snapshot_file_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file_path, "wb") as f:
+            marshal.dump({"sources": sources, "chains": chains}, f)
+        os.replace(tmp_file_path, snapshot_file_path)  # atomic, so concurrent runs never read a partial snapshot
+    except (OSError, ValueError) as e:
+        # e.g. read-only installation directory - everything still works, just without the snapshot
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+
+
+class ContractEntry(dict):
+    """
+    Smart contract from chains.yaml. If its ABI comes from a file (`abi_file`), the file is only read on first access to "abi"
+    and then kept in the entry, so contracts which are never used cost nothing at startup.
+    """
+
+    def __missing__(self, key):
+        if key == "abi" and "abi_file" in self:
+            with open(dict.__getitem__(self, "abi_file")) as file:
+                self["abi"] = file.read()
+            return dict.__getitem__(self, "abi")
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (key == "abi" and dict.__contains__(self, "abi_file"))
+
+    def _lazy_abi(self):
+        return not dict.__contains__(self, "abi") and dict.__contains__(self, "abi_file")
+
+    def __iter__(self):
+        yield from dict.__iter__(self)
+        if self._lazy_abi():
+            yield "abi"
+
+    def __len__(self):
+        return dict.__len__(self) + self._lazy_abi()
+
+    def keys(self):
+        return list(self)  # with "abi" even if it is not read yet, so that {**entry} and dict(entry) read it
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def copy(self):
+        return ContractEntry(dict.items(self))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def parsed_abi(self):
+        """ABI as a list of dicts, parsed once per ABI string."""
+        abi = self["abi"]
+        if getattr(self, "_parsed_abi", (None,))[0] is not abi:
+            self._parsed_abi = (abi, json.loads(abi) if isinstance(abi, str) else abi)
+        return self._parsed_abi[1]
+
+
+# Add ABIs to the previously loaded YAML ration from test/data/*.abi
+def load_predefined_abis(smart_contracts):
+    """Indexes ABIs from test/data/*.abi in `smart_contracts` dictionary (as `abi_file`, read on first access, see ContractEntry)."""
+    _nPredefinedSmartContracts = len(smart_contracts)
+    if _nPredefinedSmartContracts == 0:
+        return
+    name_to_addr = {value["name"].lower(): addr for addr, value in smart_contracts.items()}
+    for file_path in glob.glob(abi_files_path):
+        file_name = os.path.splitext(os.path.basename(file_path))[0]
+        # Indexes ABI files from test/data/*.abi for ETH and DEBUG chains only
+        addr = name_to_addr.get(file_name)
+        if addr and "abi" not in smart_contracts[addr]:
+            smart_contracts[addr]["abi_file"] = file_path
+
+
+# Registry of all chains and their smart contracts, built once at load time (see build_registry)
+chain_names_by_id = {}  # chain id -> chain name
+contracts_by_address = {}  # (chain id, lowercase address) -> ContractEntry
+contracts_by_name = {}  # (chain id, name) -> ContractEntry
+smart_contracts_by_chain = {}  # chain name -> (smart contracts by name, smart contracts by address), shared by every chain switch
+
+
+def build_registry(chains):
+    """Indexes chains by id and smart contracts of every chain by address and by name."""
+    chain_names_by_id.clear()
+    contracts_by_address.clear()
+    contracts_by_name.clear()
+    smart_contracts_by_chain.clear()
+    for name, chain in chains.items():
+        chain_names_by_id.setdefault(chain["id"], name)  # first chain wins, as in chains.yaml order
+        by_name = chain.get("smart_contracts") or {}
+        smart_contracts_by_chain[name] = (by_name, {})
+        for contract in by_name.values():
+            if contract:
+                registerContract(chain["id"], contract, name)
+
+
+def registerContract(custom_chain_id: int, contract: dict, custom_chain_name: str = None):
+    """Adds `contract` (with "address" and "name") to the registry of a chain, e.g. an ERC20 token fetched online."""
+    contracts_by_address[(custom_chain_id, contract["address"].lower())] = contract
+    contracts_by_name.setdefault((custom_chain_id, contract["name"]), contract)
+    by_name, by_address = smart_contracts_by_chain.setdefault(custom_chain_name or chain_names_by_id.get(custom_chain_id), ({}, {}))
+    by_address[contract["address"]] = contract
+    return contract
+
+
+def getContract(custom_chain_id: int, address: str = None, name: str = None):
+    """Smart contract of any chain by its address (any case) or name, None if it is unknown."""
+    if address is not None:
+        return contracts_by_address.get((custom_chain_id, address.lower()))
+    return contracts_by_name.get((custom_chain_id, name))
+
+
+def getSmartContracts(chosen_chain: str):
+    """Smart contracts of `chosen_chain` indexed by name and by address (the same entries, no copies)."""
+    return smart_contracts_by_chain.setdefault(chosen_chain, ({}, {}))
+
+
+def make_contract_entries(chains):
+    """Wraps smart contracts of every chain into ContractEntry (plain dicts are kept in the snapshot)."""
+    for chain in chains.values():
+        if chain.get("smart_contracts"):
+            chain["smart_contracts"] = {name: ContractEntry(contract) if contract else contract for name, contract in chain["smart_contracts"].items()}
+    return chains
+
+
+def parse_chains():
+    """Parses chains.yaml, applies debug overrides and loads predefined ABIs."""
+    from yaml import load  # only imported when the snapshot has to be rebuilt
+
+    try:
+        from yaml import CLoader as Loader
+    except ImportError:
+        from yaml import Loader
+
+    with open(chains_file_path) as stream:
+        chains = load(stream, Loader)
+
+    # Replace smart contract addresses with debug addresses if DEBUG mode is enabled
+    for chain in chains.values():
+        for name, contract in chain.get("smart_contracts", {}).items():
+            if DEBUG and "debug_overrides" in contract and "address" in contract["debug_overrides"]:
+                contract["address"] = contract["debug_overrides"]["address"]
+                del contract["debug_overrides"]
+            if contract:
+                contract["name"] = name
+
+    load_predefined_abis(chains["eth"]["smart_contracts"])
+    load_predefined_abis(chains["debug"]["smart_contracts"])
+    # for chain in chains.values():
+    #     load_predefined_abis(chain.get('smart_contracts',{}))
+    return chains
+
+
+snapshot_sources = config_snapshot_sources()
+chains = load_config_snapshot(snapshot_sources) if use_snapshot else None
+if chains is None:
+    chains = parse_chains()
+    if use_snapshot:
+        save_config_snapshot(snapshot_sources, chains)
+make_contract_entries(chains)
+build_registry(chains)
 assert chains["eth"]["smart_contracts"]["USDT"]["type"] == "ERC20", "To ensure configuraiton is working, please provide USDT smart contract details on ETH MainNet as part of chains.yaml file"
 
 chain_name = "eth" if not DEBUG else "debug"
 # chain_id = 1 if not DEBUG else 131277322940537 # current chain id
 chain_id = chains[chain_name]["id"]
 
-# Replace smart contract addresses with debug addresses if DEBUG mode is enabled
-for chain in chains.values():
-    for name, contract in chain.get("smart_contracts", {}).items():
-        if DEBUG and "debug_overrides" in contract and "address" in contract["debug_overrides"]:
-            contract["address"] = contract["debug_overrides"]["address"]
-            del contract["debug_overrides"]
-        if contract:
-            contract["name"] = name
-
-# Application cache (global)
+# Application cache (global): in-memory layer of the current session, see w3off.observer.cache
+# Entries are persisted one by one in cache.sqlite, an older cache.json is migrated into it on first use
 cache = {}
 if chains_uses_home_path:
     cache_file_path = os.path.join(os.path.expanduser("~"), ".w3off", "cache.json")
-    cache_prompt_path_str = '~/.w3off'
 else:
     cache_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),"cache.json")
-    cache_prompt_path_str = 'your installed package directory'
-
-try:
-    with open(cache_file_path) as json_file:
-        cache = json.load(json_file)
-    print(f'Loading cache.json from {cache_prompt_path_str}...')
-except:
-    print(f'No cache.json file available at {cache_prompt_path_str}. The file will be auto-generated after the first successful run.')
-    cache = {}
+cache_db_path = os.path.join(os.path.dirname(cache_file_path), "cache.sqlite")
 
 # DEFAULT VALUES FOR API URLs
 # Choose network browser
 ethscan_api_key = os.environ.get("ETHSCAN_API_KEY","")
 # Choose one of the following node providers below:
-web3_provider_url = chains[chain_name]["rpc_provider"]
+web3_provider_url = chains[chain_name]["rpc_provider"]  # primary provider, see `rpc_fallbacks` in chains.yaml for the rest
 # web3_provider_url = f"https://mainnet.infura.io/v3/{os.environ['INFURA_API_KEY']}" if not DEBUG else "debug"
 # web3_provider_url = "https://rpc.ankr.com/eth" if not DEBUG else "EthereumTester (LOCAL)"
 # web3_provider_url = "https://ethereum-rpc.publicnode.com" if not DEBUG else "EthereumTester (LOCAL)"
@@ -70,41 +238,17 @@ web3_provider_url = chains[chain_name]["rpc_provider"]
 # web3_provider_url = f"https://polished-spring-needle.quiknode.pro/{os.environ['QUICKNODE_API_KEY']}"  # Alternative provider
 
 
-# Add ABIs to the previously loaded YAML ration from test/data/*.abi
-def load_predefined_abis(smart_contracts):
-    """Loads ABIs from test/data/*.abi to `smart_contracts` dictionary."""
-    _nPredefinedSmartContracts = len(smart_contracts)
-    if _nPredefinedSmartContracts == 0:
-        return
-    for file_path in glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "test", "data", "*.abi")):
-        file_name = os.path.splitext(os.path.basename(file_path))[0]
-        name_to_addr = {value["name"].lower(): addr for addr, value in smart_contracts.items()}
-        # Loads ABI strings from test/data/*.abi for ETH and DEBUG chains only
-        with open(file_path) as file:
-            addr = name_to_addr.get(file_name)
-            if addr and "abi" not in smart_contracts[addr]:
-                smart_contracts[addr].update({"abi": file.read()})
-
-
-load_predefined_abis(chains["eth"]["smart_contracts"])
-load_predefined_abis(chains["debug"]["smart_contracts"])
-# for chain in chains.values():
-#     load_predefined_abis(chain.get('smart_contracts',{}))
-
 # Allows to use smart_contracts_by_name['0x...'] , i.e. uses comfortable indexing
 # smart_contracts_by_name = {k: v.get('smart_contracts',{}) for k, v in chains.items()}
 # smart_contracts = { chain_name: { v['address']: {'name': k, **v } for k, v in chain_obj.items()} for chain_name, chain_obj in smart_contracts_by_name.items() }
-smart_contracts_by_name = chains["eth"]["smart_contracts"]
-for key in smart_contracts_by_name:
-    smart_contracts_by_name[key]["name"] = key
-smart_contracts = {v["address"]: {"name": k, **v} for k, v in smart_contracts_by_name.items()}
+smart_contracts_by_name, smart_contracts = getSmartContracts("eth")  # same entries, indexed by name and by address
 
 if DEBUG:
     assert chains["eth"]["smart_contracts"]["USDT"]["address"] == "0x2946259E0334f33A064106302415aD3391BeD384"
-    assert len(smart_contracts["0x2946259E0334f33A064106302415aD3391BeD384"]["abi"]) > 0
+    assert "abi" in smart_contracts["0x2946259E0334f33A064106302415aD3391BeD384"]
     assert smart_contracts["0xD24260C102B5D128cbEFA0F655E5be3c2370677C"]["implementation"] == "0xeF434E4573b90b6ECd4a00f4888381e4D0CC5Ccd"
     assert smart_contracts["0xD24260C102B5D128cbEFA0F655E5be3c2370677C"]["proxy"]
-    assert len(smart_contracts["0xD24260C102B5D128cbEFA0F655E5be3c2370677C"]["abi"]) > 0
+    assert "abi" in smart_contracts["0xD24260C102B5D128cbEFA0F655E5be3c2370677C"]
 else:
     assert smart_contracts["0xdAC17F958D2ee523a2206206994597C13D831ec7"]["type"] == "ERC20"
     assert smart_contracts["0xdAC17F958D2ee523a2206206994597C13D831ec7"]["decimals"] == 6
@@ -112,8 +256,8 @@ else:
 
 assert smart_contracts_by_name["USDT"]["name"] == "USDT"
 assert smart_contracts_by_name["USDT"]["type"] == "ERC20"
-assert len(smart_contracts_by_name["USDT"]["abi"]) > 0
-assert len(smart_contracts_by_name["USDC"]["abi"]) > 0
+assert "abi" in smart_contracts_by_name["USDT"]  # ABI files are only read on first use
+assert "abi" in smart_contracts_by_name["USDC"]
 # assert 'abi' not in chains['base']['smart_contracts']['USDC']
 
 # DEFAULT VALUES
@@ -161,15 +305,29 @@ default_abi = smart_contracts[default_contract]["abi"]
 signer_suggest_keystore = chains["eth"]["defaults"]["signer_suggest_keystore"] or True
 verbose = chains["eth"]["defaults"]["verbose"] or True
 
+# RPC connection parameters (used for every chain)
+rpc_timeout = chains["eth"]["defaults"].get("rpc_timeout") or 10  # seconds before failing over to the next RPC provider
+rpc_hedge_after = chains["eth"]["defaults"].get("rpc_hedge_after", 0.75)  # seconds before a slow read request is also sent to the next provider (0: never)
+rpc_cooldown = chains["eth"]["defaults"].get("rpc_cooldown") or 30  # seconds a failed provider is moved to the end of the list
+rpc_pool_maxsize = chains["eth"]["defaults"].get("rpc_pool_maxsize") or 10  # keep-alive connections per provider
+etherscan_rate_limit = chains["eth"]["defaults"].get("etherscan_rate_limit") or 5  # requests per second allowed by your Etherscan API plan
+
 
 def getDefault(chosen_chain: str, key: str):
     global chains
     return chains.get(chosen_chain, {}).get("defaults", {}).get(key, "")
 
 
+def getRpcProviders(chosen_chain: str):
+    """Return ordered list of RPC provider strings for the chain: `rpc_provider` first, then `rpc_fallbacks`."""
+    global chains
+    chain = chains.get(chosen_chain, {})
+    return [chain["rpc_provider"], *chain.get("rpc_fallbacks", [])]
+
+
 def getChainName(custom_chain_id: int = None):
     """Return current chain name chain_id"""
     global chain_id
     if custom_chain_id is None:
         custom_chain_id = chain_id
-    return next((k for k, v in chains.items() if v["id"] == custom_chain_id), None)
+    return chain_names_by_id.get(custom_chain_id)
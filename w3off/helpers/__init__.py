@@ -1 +1 @@
-from w3off.helpers import abiHelpers, addressHelpers, txHelpers
+from w3off.helpers import abiHelpers, addressHelpers, senderRecovery, txHelpers
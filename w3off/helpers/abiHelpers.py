@@ -7,25 +7,36 @@ from eth_utils import (
     filter_abi_by_type,
 )
 from eth_abi import abi
+from eth_abi.exceptions import EncodingTypeError, ValueOutOfBounds
+from eth_abi.grammar import normalize, parse
+from eth_abi.registry import registry
+from eth_utils.abi import abi_to_signature, get_abi_input_types
+import w3off.config as config
 from w3off.w3provider import w3
+from collections import OrderedDict
+import functools
 import json
+import re
+import threading
 
 # from eth_keys import keys
 
+# Number of parsed ABIs and of Contract objects kept in memory, least recently used ones are dropped first
+ABI_CACHE_SIZE = 256
+CONTRACT_CACHE_SIZE = 256
+CODEC_CACHE_SIZE = 256  # compiled calldata codecs, one per function signature
+# Functions of a contract are listed READ first, then WRITE
+MUTABILITY_ORDER = {"pure": 0, "view": 1, "nonpayable": 2, "payable": 3}
+
+_contracts = OrderedDict()  # (chain id, address, ABI) -> Contract, see getContract
+_contracts_lock = threading.Lock()
+
 
 def encodeABICall(func_signature, param_values):
-    """Encode ABI function call to data attribute by padding all function parameters."""
-    _, param_types = func_signature.split("(")
-    param_types = param_types[:-1].split(",")
-    encoded_params = ""
-    for param, param_type in zip(param_values, param_types):
-        if param_type == "address":
-            encoded_params += pad_hex(param)
-        elif param_type == "uint256":
-            hex_param = hex(int(param))
-            encoded_params += pad_hex(hex_param)
-        # TODO: add other supported attribute types, as well as dynamic
-    return encoded_params
+    """Encode ABI function call to data attribute by padding all function parameters (integers may be passed as strings)."""
+    codec = calldataCodec(func_signature)
+    param_values = [int(value) if re.fullmatch(r"u?int\d*", type_str) else value for type_str, value in zip(codec.types, param_values)]
+    return codec.encodeArgs(param_values).hex()
 
 
 def decodeABICall(abi_string: str, func_params_sig: str, data: str):
@@ -39,19 +50,137 @@ def decodeABIParams(func_params_sig: str, data: str):
 
 
 def decodeABIMethod(abi_string: str, data: str):
-    abi_obj = json.loads(abi_string)
-    func_selector = data[:10]  # Get the first 10 characters
-    for func in abi_obj:
-        func_signature = f"{func['name']}({','.join([input['type'] for input in func['inputs']])})"
-        selector = function_signature_to_4byte_selector(func_signature)
-        if selector.hex() == func_selector[2:]:  # Compare hex values without '0x'
-            func_name = func["name"]
-            break
-
-    if not func_name:
+    entry = functionTable(abi_string).by_selector.get(data[2:10])  # first 4 bytes without '0x'
+    if entry is None:
         raise ValueError("Could not find function name in provided ABI. Check ABI parameter passed to decodeABICall() function.")
 
-    return func_name
+    return entry.name
+
+
+@functools.lru_cache(maxsize=ABI_CACHE_SIZE)
+def _parseABIString(abi_string: str):
+    return json.loads(abi_string)
+
+
+def parseABI(abi):
+    """
+    ABI as a list of dicts. JSON strings are parsed once and the same list is returned for the same string afterwards,
+    so do not modify it.
+    """
+    return _parseABIString(abi) if isinstance(abi, str) else abi
+
+
+class FunctionEntry:
+    """Function of an ABI with everything needed to list, choose, encode and decode it, computed once (see FunctionTable)."""
+
+    __slots__ = ("name", "signature", "selector", "mutability", "input_types", "abi", "position", "overloads")
+
+    def __init__(self, func: dict):
+        self.name = func["name"]
+        self.signature = abi_to_signature(func)  # canonical, e.g. "transfer(address,uint256)", tuples expanded
+        self.selector = function_signature_to_4byte_selector(self.signature).hex()  # without '0x'
+        self.mutability = func.get("stateMutability") or ("view" if func.get("constant") else "nonpayable")  # old ABIs only have "constant"
+        self.input_types = tuple(get_abi_input_types(func))
+        self.abi = func
+        self.position = None  # 1-based index in the table
+        self.overloads = ()  # all entries with this name, this one included
+
+    @property
+    def is_read(self) -> bool:
+        return self.mutability in ("pure", "view")
+
+    def __repr__(self):
+        return f"<FunctionEntry {self.position}: {self.signature} {self.mutability}>"
+
+
+class FunctionTable:
+    """
+    Functions of an ABI indexed by selector, name and position (1-based, READ functions first, as listed to the user).
+    Built once per ABI string, see functionTable.
+    """
+
+    __slots__ = ("entries", "by_selector", "by_name")
+
+    def __init__(self, abi):
+        funcs = [FunctionEntry(func) for func in parseABI(abi) if func.get("type", "function") == "function" and "name" in func]
+        self.entries = tuple(sorted(funcs, key=lambda entry: MUTABILITY_ORDER.get(entry.mutability, 999)))
+        self.by_selector = {}
+        self.by_name = {}
+        for position, entry in enumerate(self.entries, start=1):
+            entry.position = position
+            self.by_selector.setdefault(entry.selector, entry)
+            self.by_name.setdefault(entry.name, []).append(entry)
+        for name, overloads in self.by_name.items():
+            self.by_name[name] = overloads = tuple(overloads)
+            for entry in overloads:
+                entry.overloads = overloads
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def choose(self, choice) -> FunctionEntry:
+        """
+        Function chosen by the user: its position (int or digits), name or selector. Among overloads of a name, the one
+        with most parameters is chosen, since the shorter ones typically take raw bytes, which are harder to enter.
+        Raises ValueError if there is no such function.
+        """
+        choice = str(choice).strip()
+        if choice.isdigit():
+            if not 1 <= int(choice) <= len(self.entries):
+                raise ValueError(f"There is no function number {choice}, choose from 1 to {len(self.entries)}.")
+            return self.entries[int(choice) - 1]
+        overloads = self.by_name.get(choice)
+        if overloads:
+            return max(overloads, key=lambda entry: len(entry.input_types))
+        entry = self.by_selector.get(choice.removeprefix("0x").lower())
+        if entry is None:
+            raise ValueError("There are not matching entries for your choice.")
+        return entry
+
+
+@functools.lru_cache(maxsize=ABI_CACHE_SIZE)
+def _functionTable(abi_string: str):
+    return FunctionTable(abi_string)
+
+
+def functionTable(abi) -> FunctionTable:
+    """FunctionTable of ABI (JSON string or list of dicts), built once per ABI string."""
+    return _functionTable(abi if isinstance(abi, str) else json.dumps(abi))
+
+
+def functionSelectors(abi):
+    """Function names of ABI by their 4-byte selector (hex without '0x'). Computed once per ABI string."""
+    return {selector: entry.name for selector, entry in functionTable(abi).by_selector.items()}
+
+
+def getContract(address: str, abi, chain_id: int = None):
+    """
+    Same as `w3.eth.contract(address=address, abi=abi)`, but the Contract object is built once per (chain, address, ABI)
+    and reused afterwards (up to CONTRACT_CACHE_SIZE contracts).
+    """
+    key = (config.chain_id if chain_id is None else chain_id, address, abi if isinstance(abi, str) else json.dumps(abi))
+    with _contracts_lock:
+        contract = _contracts.get(key)
+        if contract is not None:
+            _contracts.move_to_end(key)
+            return contract
+    contract = w3.eth.contract(address=address, abi=parseABI(abi))
+    with _contracts_lock:
+        _contracts[key] = contract
+        while len(_contracts) > CONTRACT_CACHE_SIZE:
+            _contracts.popitem(last=False)
+    return contract
+
+
+def clearABICaches():
+    _parseABIString.cache_clear()
+    _functionTable.cache_clear()
+    calldataCodec.cache_clear()
+    with _contracts_lock:
+        _contracts.clear()
 
 
 def pad_hex(value):
@@ -61,7 +190,7 @@ def pad_hex(value):
 
 def dataFromCall(func_signature, func_parameters):
     """
-    Construct the `data` attribute for an Ethereum transaction. Does not support dynamic parameters (with dynamic length) at this point.
+    Construct the `data` attribute for an Ethereum transaction (see CalldataCodec, compiled once per signature).
 
     Args:
     func_signature (str): The function signature, e.g., "transfer(address,uint256)"
@@ -70,16 +199,103 @@ def dataFromCall(func_signature, func_parameters):
     Returns:
     str: The encoded `data` attribute for the transaction.
     """
-    # Ensure that the first parameter (if address) is checksummed to avoid errors
-    if "address" in func_signature.split("(")[1].split(",")[0]:  # TODO may need smarter address determination, not always first param?
-        func_parameters[0] = Web3.to_checksum_address(func_parameters[0])
-
-    # ABI encode the function call
-    function_selector = w3.keccak(text=func_signature)[:4]  # First 4 bytes
-    # using web3 library function instead of encodeabi in this module
-    encoded_parameters = encode(
-        types=func_signature.split("(")[1][:-1].split(","), args=func_parameters
-    )  # Function parameters, padded by 32 bytes, or 64 hex-chars
-    # Concatenate function selector and encoded parameters
-    data = function_selector.hex() + encoded_parameters.hex()
-    return data
+    return calldataCodec(func_signature).encode(func_parameters)
+
+
+def _encodeAddress(value):
+    if isinstance(value, (bytes, bytearray)) and len(value) == 20:
+        return bytes(12) + bytes(value)
+    if not isinstance(value, str) or len(value) != 42 or value[:2] not in ("0x", "0X"):
+        raise EncodingTypeError(f"Value {value!r} is not an address")
+    hex_digits = value[2:]
+    if not (hex_digits.islower() or hex_digits.isupper() or hex_digits.isdigit()) and not Web3.is_checksum_address(value):
+        raise EncodingTypeError(f"Address {value} has an invalid checksum")
+    try:
+        return bytes(12) + bytes.fromhex(hex_digits)
+    except ValueError:
+        raise EncodingTypeError(f"Value {value!r} is not an address") from None
+
+
+def _encodeBool(value):
+    if not isinstance(value, bool):
+        raise EncodingTypeError(f"Value {value!r} is not a bool")
+    return bytes(31) + bytes((value,))
+
+
+def _intEncoder(bits: int, signed: bool):
+    low, high = (-(2 ** (bits - 1)), 2 ** (bits - 1)) if signed else (0, 2**bits)
+
+    def encodeInt(value):
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise EncodingTypeError(f"Value {value!r} is not an integer")
+        if not low <= value < high:
+            raise ValueOutOfBounds(f"Value {value} does not fit into {'' if signed else 'u'}int{bits}")
+        return value.to_bytes(32, "big", signed=signed)
+
+    return encodeInt
+
+
+def _wordEncoder(type_str: str):
+    """Encoder of a static elementary type to its 32-byte word, or None for the other types (encoded by eth_abi)."""
+    if type_str == "address":
+        return _encodeAddress
+    if type_str == "bool":
+        return _encodeBool
+    match = re.fullmatch(r"(u?)int(\d+)", type_str)
+    if match:
+        return _intEncoder(int(match[2]), signed=not match[1])
+    return None
+
+
+class CalldataCodec:
+    """
+    Calldata encoder / decoder of one function signature, e.g. "transfer(address,uint256)". The selector and the encoders
+    of its parameter types are computed once. Calls with only static elementary parameters (address, bool, (u)intN)
+    are encoded word by word without going through eth_abi, the others with eth_abi's encoder for the parameter tuple.
+    Use calldataCodec(signature) to get the shared codec of a signature.
+    """
+
+    __slots__ = ("name", "types", "signature", "selector", "_word_encoders", "_encoder")
+
+    def __init__(self, signature: str):
+        self.name, params = signature.strip().split("(", 1)
+        params = params.strip()[:-1]
+        self.types = tuple(component.to_type_str() for component in parse(normalize(f"({params})")).components) if params else ()
+        self.signature = f"{self.name}({','.join(self.types)})"  # canonical, e.g. "uint" is "uint256"
+        self.selector = function_signature_to_4byte_selector(self.signature)
+        word_encoders = [_wordEncoder(type_str) for type_str in self.types]
+        self._word_encoders = None if None in word_encoders else tuple(word_encoders)
+        self._encoder = registry.get_tuple_encoder(*self.types)
+
+    def encodeArgs(self, args) -> bytes:
+        """ABI encoded parameters, without the selector."""
+        if len(args) != len(self.types):
+            raise EncodingTypeError(f"{self.signature} takes {len(self.types)} parameters, {len(args)} given")
+        if self._word_encoders is None:
+            return self._encoder(args)
+        return b"".join([encode(value) for encode, value in zip(self._word_encoders, args)])
+
+    def encode(self, args) -> str:
+        """Calldata of the call with `args`, as hex without '0x' (same as dataFromCall)."""
+        return (self.selector + self.encodeArgs(args)).hex()
+
+    def encodeBatch(self, args_list) -> list:
+        """Calldata of many calls, e.g. [(receiver, amount), ...] of "transfer(address,uint256)", in one pass."""
+        selector, encodeArgs = self.selector, self.encodeArgs
+        return [(selector + encodeArgs(args)).hex() for args in args_list]
+
+    def decode(self, data) -> tuple:
+        """Parameters of calldata (hex with or without '0x', or bytes). Raises ValueError if it is a call of another function."""
+        data = bytes.fromhex(data[2:] if data[:2] in ("0x", "0X") else data) if isinstance(data, str) else bytes(data)
+        if data[:4] != self.selector:
+            raise ValueError(f"Calldata is not a call of {self.signature} (selector 0x{data[:4].hex()} instead of 0x{self.selector.hex()})")
+        return abi.decode(self.types, data[4:])
+
+    def __repr__(self):
+        return f"<CalldataCodec {self.signature} 0x{self.selector.hex()}>"
+
+
+@functools.lru_cache(maxsize=CODEC_CACHE_SIZE)
+def calldataCodec(signature: str) -> CalldataCodec:
+    """CalldataCodec of function signature, compiled once per signature."""
+    return CalldataCodec(signature)
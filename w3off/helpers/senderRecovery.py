@@ -0,0 +1,61 @@
+"""
+Sender recovery of large batches of signed transactions. Public key recovery (secp256k1) is CPU-bound, so batches are split
+into chunks recovered by a pool of processes, and coincurve (libsecp256k1) is used instead of eth_keys when it is installed.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from eth_utils import keccak, to_checksum_address
+
+from w3off.helpers.txHelpers import decodeEnvelope, rawTxBytes, recoverSender
+
+try:
+    import coincurve
+except ImportError:  # optional, pip install coincurve
+    coincurve = None
+
+RECOVERY_CHUNK_SIZE = 500  # transactions sent to a worker at once
+PARALLEL_MIN_TXS = 2000  # smaller batches are recovered in this process, starting workers would take longer
+
+
+def fastRecoverSender(signing_hash: bytes, y_parity: int, r: int, s: int) -> str:
+    """Same as txHelpers.recoverSender, with coincurve if it is installed."""
+    if coincurve is None:
+        return recoverSender(signing_hash, y_parity, r, s)
+    signature = r.to_bytes(32, "big") + s.to_bytes(32, "big") + bytes((y_parity,))
+    public_key = coincurve.PublicKey.from_signature_and_message(signature, signing_hash, hasher=None).format(compressed=False)
+    return to_checksum_address(keccak(public_key[1:])[-20:])
+
+
+def _recoverChunk(offset: int, raw_txs: list):
+    senders = []
+    for i, raw_tx in enumerate(raw_txs, start=offset):
+        try:
+            _, tx, _, signing_hash, y_parity = decodeEnvelope(raw_tx)
+            senders.append(fastRecoverSender(signing_hash, y_parity, tx.r, tx.s))
+        except Exception as e:
+            raise ValueError(f"Transaction {i}: {e}") from e
+    return senders
+
+
+def recoverSenders(raw_txs, workers: int = None, chunk_size: int = RECOVERY_CHUNK_SIZE, parallel_min: int = PARALLEL_MIN_TXS):
+    """
+    Sender addresses of signed raw transactions (hex or bytes, any type), in the same order. Batches of at least
+    `parallel_min` transactions are recovered in chunks of `chunk_size` by `workers` processes (one per CPU by default).
+    Raises ValueError with the index of a transaction which cannot be decoded.
+    """
+    raw_txs = [rawTxBytes(raw_tx) for raw_tx in raw_txs]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(raw_txs) < parallel_min:
+        return _recoverChunk(0, raw_txs)
+    offsets = range(0, len(raw_txs), chunk_size)
+    with ProcessPoolExecutor(max_workers=min(workers, len(offsets))) as executor:
+        chunks = executor.map(_recoverChunk, offsets, [raw_txs[offset : offset + chunk_size] for offset in offsets])
+        return [sender for chunk in chunks for sender in chunk]
+
+
+def verifySenders(raw_txs, expected: str, **kwargs):
+    """(index, sender) of the transactions which are not signed by `expected`, see recoverSenders for arguments."""
+    expected = to_checksum_address(expected)
+    return [(i, sender) for i, sender in enumerate(recoverSenders(raw_txs, **kwargs)) if sender != expected]
@@ -1,16 +1,15 @@
-from dataclasses import dataclass
 from hexbytes import HexBytes
+import json
 import rlp
+from eth_keys import keys
+from eth_keys.exceptions import BadSignature, ValidationError
 from eth_typing import HexStr
-from eth_utils import keccak, to_bytes, encode_hex, is_hexstr
-from rlp.sedes import Binary, big_endian_int, binary, lists
-from w3off.w3provider import w3
+from eth_utils import keccak, to_bytes, is_hexstr, to_checksum_address
+from rlp.sedes import Binary, big_endian_int, binary
 
 from web3.datastructures import AttributeDict
 
-from eth_account import Account
 from eth_account.typed_transactions import TypedTransaction
-from hexbytes import HexBytes
 
 
 def decodeRawTx2(raw_tx: str):
@@ -32,6 +31,27 @@ class Transaction_Type0(rlp.Serializable):
     ]
 
 
+# [[address, [storage key, ...]], ...] of typed transactions
+access_list_sedes = rlp.sedes.CountableList(rlp.sedes.List([Binary.fixed_length(20), rlp.sedes.CountableList(Binary.fixed_length(32))]))
+
+
+# EIP-2930 transaction
+class Transaction_Type1(rlp.Serializable):
+    fields = [
+        ("chain_id", big_endian_int),
+        ("nonce", big_endian_int),
+        ("gas_price", big_endian_int),
+        ("gas", big_endian_int),
+        ("to", binary),
+        ("value", big_endian_int),
+        ("data", binary),
+        ("access_list", access_list_sedes),
+        ("v", big_endian_int),
+        ("r", big_endian_int),
+        ("s", big_endian_int),
+    ]
+
+
 class Transaction_Type2(rlp.Serializable):
     fields = [
         ("chain_id", big_endian_int),
@@ -42,16 +62,66 @@ class Transaction_Type2(rlp.Serializable):
         ("to", binary),
         ("value", big_endian_int),
         ("data", binary),
-        (
-            "access_list",
-            rlp.sedes.CountableList(rlp.sedes.List([binary, binary])),
-        ),  # Access list needs a proper sedes
+        ("access_list", access_list_sedes),
+        ("v", big_endian_int),
+        ("r", big_endian_int),
+        ("s", big_endian_int),
+    ]
+
+
+# EIP-4844 blob transaction (without blobs, commitments and proofs of its network form)
+class Transaction_Type3(rlp.Serializable):
+    fields = [
+        ("chain_id", big_endian_int),
+        ("nonce", big_endian_int),
+        ("max_priority_fee_per_gas", big_endian_int),
+        ("max_fee_per_gas", big_endian_int),
+        ("gas", big_endian_int),
+        ("to", binary),
+        ("value", big_endian_int),
+        ("data", binary),
+        ("access_list", access_list_sedes),
+        ("max_fee_per_blob_gas", big_endian_int),
+        ("blob_versioned_hashes", rlp.sedes.CountableList(Binary.fixed_length(32))),
+        ("v", big_endian_int),
+        ("r", big_endian_int),
+        ("s", big_endian_int),
+    ]
+
+
+class Authorization(rlp.Serializable):
+    fields = [
+        ("chain_id", big_endian_int),
+        ("address", Binary.fixed_length(20)),
+        ("nonce", big_endian_int),
+        ("y_parity", big_endian_int),
+        ("r", big_endian_int),
+        ("s", big_endian_int),
+    ]
+
+
+# EIP-7702 set code transaction
+class Transaction_Type4(rlp.Serializable):
+    fields = [
+        ("chain_id", big_endian_int),
+        ("nonce", big_endian_int),
+        ("max_priority_fee_per_gas", big_endian_int),
+        ("max_fee_per_gas", big_endian_int),
+        ("gas", big_endian_int),
+        ("to", binary),
+        ("value", big_endian_int),
+        ("data", binary),
+        ("access_list", access_list_sedes),
+        ("authorization_list", rlp.sedes.CountableList(Authorization)),
         ("v", big_endian_int),
         ("r", big_endian_int),
         ("s", big_endian_int),
     ]
 
 
+TX_TYPES = {0: Transaction_Type0, 1: Transaction_Type1, 2: Transaction_Type2, 3: Transaction_Type3, 4: Transaction_Type4}
+
+
 def hex_to_bytes(data: str) -> bytes:
     try:
         result = to_bytes(hexstr=HexStr(data))
@@ -60,64 +130,135 @@ def hex_to_bytes(data: str) -> bytes:
     return result
 
 
-def decodeRawTx(raw_tx: str):
-    if not raw_tx.startswith("0x"):
-        raw_tx = "0x" + raw_tx
+def rawTxBytes(raw_tx: str | bytes) -> bytes:
+    """Raw transaction as bytes, from hex (with or without '0x') or bytes."""
+    if isinstance(raw_tx, (bytes, bytearray)):
+        return bytes(raw_tx)
+    raw_tx = raw_tx.strip()
+    return bytes.fromhex(raw_tx[2:] if raw_tx[:2] in ("0x", "0X") else raw_tx)
 
-    raw_tx_bytes = to_bytes(hexstr=raw_tx)
-    type = raw_tx_bytes[0]
 
-    if type == 0x02:
-        # EIP-1559 transaction (Type 2)
-        tx = rlp.decode(raw_tx_bytes[1:], Transaction_Type2, strict=False)
-    else:
-        # Legacy transaction (Type 0)
-        tx = rlp.decode(raw_tx_bytes, Transaction_Type0, strict=False)
-
-    hash_tx = w3.to_hex(keccak(hex_to_bytes(raw_tx)))
-    from_ = w3.eth.account.recover_transaction(raw_tx)
-    to = w3.to_checksum_address(tx.to) if tx.to else None
-    data = w3.to_hex(tx.data)
-    r = hex(tx.r)
-    s = hex(tx.s)
-    chain_id = (tx.v - 35) // 2 if tx.v % 2 else (tx.v - 36) // 2
-
-    if type == 0x02:
-        # EIP-1559 transaction (Type 2)
-        return {
-            "hash": hash_tx,
-            "type": 2,  # Indicate EIP-1559 transaction
-            "from": from_,
-            "to": to,
-            "nonce": tx.nonce,
-            "gas": tx.gas,
-            "maxPriorityFeePerGas": tx.max_priority_fee_per_gas,
-            "maxFeePerGas": tx.max_fee_per_gas,
-            "value": tx.value,
-            "data": data,
-            "chainId": tx.chain_id,
-            "r": r,
-            "s": s,
-            "v": tx.v,
-            "accessList": tx.access_list,
-        }
+def decodeEnvelope(raw_tx: bytes):
+    """
+    Decodes a signed transaction of any type (legacy, EIP-2930, EIP-1559, EIP-4844, EIP-7702) from its raw bytes.
+
+    Returns:
+        tuple: (type, decoded transaction, transaction hash, signing hash, y parity of the signature)
+    """
+    if not raw_tx:
+        raise ValueError("Empty raw transaction")
+    if raw_tx[0] >= 0xC0:  # RLP list, legacy transaction
+        items = rlp.decode(raw_tx, strict=False)
+        tx = Transaction_Type0.deserialize(items)
+        unsigned = items[:6]
+        if tx.v in (27, 28):
+            y_parity = tx.v - 27
+        else:  # EIP-155, chain id is signed too
+            y_parity = (tx.v - 35) % 2
+            unsigned = unsigned + [big_endian_int.serialize((tx.v - 35) // 2), b"", b""]
+        return 0, tx, keccak(raw_tx), keccak(rlp.encode(unsigned)), y_parity
+
+    type = raw_tx[0]
+    if type not in TX_TYPES:
+        raise ValueError(f"Unsupported transaction type {type}")
+    items = rlp.decode(raw_tx[1:], strict=False)
+    if type == 3 and items and isinstance(items[0], list):  # network form [tx, blobs, commitments, proofs]
+        items = items[0]
+        raw_tx = raw_tx[:1] + rlp.encode(items)
+    tx = TX_TYPES[type].deserialize(items)
+    return type, tx, keccak(raw_tx), keccak(raw_tx[:1] + rlp.encode(items[:-3])), tx.v
+
+
+def recoverSender(signing_hash: bytes, y_parity: int, r: int, s: int) -> str:
+    """Checksum address of the signer of `signing_hash` (see decodeEnvelope)."""
+    return keys.Signature(vrs=(y_parity, r, s)).recover_public_key_from_msg_hash(signing_hash).to_checksum_address()
+
 
+def _accessList(access_list):
+    return tuple({"address": to_checksum_address(address), "storageKeys": tuple("0x" + key.hex() for key in storage_keys)} for address, storage_keys in access_list)
+
+
+def txRecord(type: int, tx, tx_hash: bytes, from_: str = None):
+    """Transaction decoded by decodeEnvelope as a dict (see decodeRawTx)."""
+    record = {"hash": "0x" + tx_hash.hex()}
+    if type:
+        record["type"] = type
+    record["from"] = from_
+    record["to"] = to_checksum_address(tx.to) if tx.to else None
+    record["nonce"] = tx.nonce
+    record["gas"] = tx.gas
+    if type in (0, 1):
+        record["gasPrice"] = tx.gas_price
+    else:
+        record["maxPriorityFeePerGas"] = tx.max_priority_fee_per_gas
+        record["maxFeePerGas"] = tx.max_fee_per_gas
+    record["value"] = tx.value
+    record["data"] = "0x" + tx.data.hex()
+    if type:
+        record["chainId"] = tx.chain_id
+    elif tx.v in (27, 28):
+        record["chainId"] = None  # pre EIP-155, not bound to a chain
     else:
-        # Legacy transaction (Type 0)
-        return {
-            "hash": hash_tx,
-            "from": from_,
-            "to": to,
-            "nonce": tx.nonce,
-            "gas": tx.gas,
-            "gasPrice": tx.gas_price,
-            "value": tx.value,
-            "data": data,
-            "chainId": chain_id,
-            "r": r,
-            "s": s,
-            "v": tx.v,
-        }
+        record["chainId"] = (tx.v - 35) // 2 if tx.v % 2 else (tx.v - 36) // 2
+    record["r"] = hex(tx.r)
+    record["s"] = hex(tx.s)
+    record["v"] = tx.v
+    if type:
+        record["accessList"] = _accessList(tx.access_list)
+    if type == 3:
+        record["maxFeePerBlobGas"] = tx.max_fee_per_blob_gas
+        record["blobVersionedHashes"] = tuple("0x" + blob_hash.hex() for blob_hash in tx.blob_versioned_hashes)
+    if type == 4:
+        record["authorizationList"] = tuple(
+            {"chainId": auth.chain_id, "address": to_checksum_address(auth.address), "nonce": auth.nonce, "yParity": auth.y_parity, "r": hex(auth.r), "s": hex(auth.s)}
+            for auth in tx.authorization_list
+        )
+    return record
+
+
+def decodeRawTx(raw_tx: str | bytes, recover: bool = True):
+    """
+    Decodes a signed transaction of any type (0 legacy, 1 EIP-2930, 2 EIP-1559, 3 EIP-4844, 4 EIP-7702) from hex or bytes.
+    Its sender ("from") is recovered from the signature, unless `recover` is False (then it is None).
+    """
+    type, tx, tx_hash, signing_hash, y_parity = decodeEnvelope(rawTxBytes(raw_tx))
+    return txRecord(type, tx, tx_hash, recoverSender(signing_hash, y_parity, tx.r, tx.s) if recover else None)
+
+
+def iterRawTxs(source):
+    """
+    Yields (line number, raw transaction) of a file (path or open file) with one transaction per line: hex, a JSON string,
+    or a JSON object with "raw_transaction" (as saved by the signer) or "rawTransaction". Blank lines are skipped.
+    """
+    if isinstance(source, str):
+        with open(source) as file:
+            yield from iterRawTxs(file)
+        return
+    for line_number, line in enumerate(source, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] in "{\"":
+            try:
+                value = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {line_number}: invalid JSON ({e})") from e
+            line = value if isinstance(value, str) else value.get("raw_transaction") or value.get("rawTransaction")
+            if not line:
+                raise ValueError(f"Line {line_number}: no raw_transaction")
+        yield line_number, line
+
+
+def iterDecodeRawTxs(source, recover: bool = True):
+    """
+    Lazily decodes a file of raw transactions (see iterRawTxs), one record of decodeRawTx per line, so that large batches
+    are never held in memory. Raises ValueError with the line number of a transaction which cannot be decoded.
+    """
+    for line_number, raw_tx in iterRawTxs(source):
+        try:
+            yield decodeRawTx(raw_tx, recover)
+        except (ValueError, rlp.DecodingError, rlp.DeserializationError, BadSignature, ValidationError) as e:
+            raise ValueError(f"Line {line_number}: {e}") from e
 
 
 def prepareDictToPrint(d: AttributeDict | dict):
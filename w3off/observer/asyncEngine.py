@@ -0,0 +1,281 @@
+import asyncio
+
+import aiohttp
+from web3 import AsyncWeb3, Web3
+from web3.providers.eth_tester import AsyncEthereumTesterProvider
+
+import w3off.config as config
+from w3off.helpers.abiHelpers import getContract, parseABI
+from w3off.observer.cache import (
+    IMPLEMENTATION_TTL,
+    checkABICache,
+    checkImplementationCache,
+    checkTokenCache,
+    setABICache,
+    setImplementationCache,
+    setTokenCache,
+)
+from w3off.observer import etherscan
+from w3off.observer.etherscan import TokenBucket
+from w3off.observer.proxyResolver import resolveProxyAsync
+from w3off.observer.shortcuts.customTx import calculateFees
+from w3off.rpc import AsyncFailoverHTTPProvider
+from w3off.w3provider import connect, resolve_rpc_urls, w3
+
+
+async def _optional(awaitable):
+    """Result of `awaitable`, or None if it fails (for values which have a fallback)."""
+    try:
+        return await awaitable
+    except Exception as e:
+        return None
+
+
+def makeAsyncWeb3(chain_name: str = None):
+    """
+    AsyncWeb3 connected to the current chain, failing over to `rpc_fallbacks` like `w3` (without hedging and the response cache,
+    which are sync only). The debug chain shares the EthereumTester instance of `w3`. With `chain_name`, connects to the RPC
+    providers of that chain in chains.yaml instead (None if the primary one needs a missing environment variable).
+    """
+    if chain_name is not None:
+        provider_urls = resolve_rpc_urls(chain_name, prompt=False)
+        return AsyncWeb3(makeAsyncProvider(provider_urls)) if provider_urls else None
+    if hasattr(w3.provider, "ethereum_tester"):
+        provider = AsyncEthereumTesterProvider()
+        provider.ethereum_tester = w3.provider.ethereum_tester
+    else:
+        connect()
+        provider = makeAsyncProvider(resolve_rpc_urls(config.chain_name, config.web3_provider_url))
+    return AsyncWeb3(provider)
+
+
+def makeAsyncProvider(provider_urls: list):
+    return AsyncFailoverHTTPProvider(provider_urls, request_timeout=config.rpc_timeout, cooldown=config.rpc_cooldown)
+
+
+class AsyncEngine:
+    """
+    Asyncio counterpart of the observer lookups (contract code, ABI, proxy resolution, nonce and fee data) for the current chain
+    (or `chain_name` from chains.yaml). Independent RPC and Etherscan requests run at the same time, and many transactions can be
+    built concurrently. Etherscan requests wait for `rate_limiter` (the one of the shared Etherscan client by default).
+
+    Usage:
+        async with AsyncEngine() as engine:
+            txs = await engine.prepTxs([{"from_address": ..., "to_address": ..., "value": ...}, ...])
+    """
+
+    def __init__(self, chain_name: str = None, rate_limiter: TokenBucket = None):
+        self.w3 = makeAsyncWeb3(chain_name)
+        self.rate_limiter = rate_limiter
+        self.session = None  # aiohttp session for Etherscan, created on first use
+        self._chain_id = None if chain_name is None else config.chains[chain_name]["id"]
+        self.cache_chain_id = config.chain_id if chain_name is None else self._chain_id  # chain of cache entries
+        self._network_data = {}  # (type, low_percentile) -> task reading fee data shared by all transactions
+        self._nonces = {}  # sender -> [task reading its nonce, transactions built so far], see reserveNonce
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.w3 is not None and isinstance(self.w3.provider, AsyncFailoverHTTPProvider):
+            await self.w3.provider.disconnect()
+
+    async def chainId(self):
+        if self._chain_id is None:
+            self._chain_id = await self.w3.eth.chain_id
+        return self._chain_id
+
+    # ----- ETHERSCAN -----
+    async def etherscanRequest(self, module: str, action: str, **params):
+        """Async version of fetchABI.etherscanRequest (through the shared Etherscan client). Returns parsed JSON response."""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=config.rpc_timeout))
+        return await etherscan.client.requestAsync(self.session, await self.chainId(), module, action, limiter=self.rate_limiter, **params)
+
+    async def fetchABI(self, contract_address):
+        """Async version of fetchABI.fetchABI"""
+        contract_address = Web3.to_checksum_address(contract_address)
+        abi = checkABICache(contract_address, self.cache_chain_id)
+        if abi is not None:
+            return abi
+        response_json = await self.etherscanRequest("contract", "getabi", address=contract_address)
+        return setABICache(contract_address, response_json["result"], chain_id=self.cache_chain_id)
+
+    async def implementationAddress(self, address):
+        """Async version of fetchABI.implementationAddress"""
+        address = Web3.to_checksum_address(address)
+        record = checkImplementationCache(address, self.cache_chain_id)
+        if not record and self.w3 is not None:
+            implementation = await resolveProxyAsync(self.w3, address)
+            if implementation is not None:
+                record = setImplementationCache(address, {"Proxy": "1", "Implementation": implementation}, self.cache_chain_id)
+        if not record:
+            response_json = await self.etherscanRequest("contract", "getsourcecode", address=address)
+            record = setImplementationCache(address, response_json, self.cache_chain_id)
+            if record is None:
+                raise ValueError(f"Could not get source code information of {address} from Etherscan: {response_json}")
+        if record["Proxy"] != "1":
+            return address
+        return Web3.to_checksum_address(record["Implementation"])
+
+    # ----- LOOKUPS -----
+    async def resolveABI(self, address):
+        """ABI of the contract at `address` (the one of its implementation for proxies) and the implementation address."""
+        address = Web3.to_checksum_address(address)
+        abi = checkABICache(address, self.cache_chain_id)
+        if abi is not None:
+            return abi, address
+        implementation = await self.implementationAddress(address)
+        abi = await self.fetchABI(implementation)
+        if address != implementation:  # if proxy address, its ABI changes on upgrade
+            setABICache(address, abi, ttl=IMPLEMENTATION_TTL, chain_id=self.cache_chain_id)
+        return abi, implementation
+
+    async def resolveContract(self, address):
+        """
+        Code check, proxy resolution and ABI of the contract at `address`, with code and proxy lookups done at the same time.
+
+        Returns:
+            dict: address, is_contract, implementation (same as address unless it is a proxy) and abi
+        """
+        address = Web3.to_checksum_address(address)
+        code, (abi, implementation) = await asyncio.gather(self.w3.eth.get_code(address), self.resolveABI(address))
+        return {"address": address, "is_contract": code.hex() != "", "implementation": implementation, "abi": abi}
+
+    async def tokenInfo(self, address, abi):
+        """Name, symbol and decimals of ERC20 token (cached, see fetchERC20Info)."""
+        address = Web3.to_checksum_address(address)
+        token_info = checkTokenCache(address, self.cache_chain_id)
+        if token_info is None:
+            functions = self.w3.eth.contract(address=address, abi=parseABI(abi)).functions
+            name, symbol, decimals = await asyncio.gather(functions.name().call(), functions.symbol().call(), functions.decimals().call())
+            token_info = setTokenCache(address, {"name": name, "symbol": symbol, "decimals": decimals}, self.cache_chain_id)
+        return token_info
+
+    async def _gatherNetworkData(self, type: int, low_percentile: int):
+        lookups = {
+            "chain_id": self.chainId(),
+            "gas_price": self.w3.eth.gas_price,
+            "priority_fee_history": self.w3.eth.fee_history(1, "latest", [low_percentile, 90]),
+        }
+        if config.verbose:
+            lookups["base_fee_history"] = self.w3.eth.fee_history(5, "latest", [10, 90])
+        if type == 2:
+            lookups["latest_block"] = _optional(self.w3.eth.get_block("latest"))
+            lookups["max_priority_fee"] = self.w3.eth.max_priority_fee
+        return dict(zip(lookups, await asyncio.gather(*lookups.values())))
+
+    def reserveNonce(self, from_address: str):
+        """
+        Offset of the next transaction of `from_address` built by this engine, counted from its nonce on chain (see gatherTxData).
+        The nonce is read once per sender, so that transactions built at the same time get consecutive nonces.
+        """
+        if from_address not in self._nonces:
+            self._nonces[from_address] = [asyncio.ensure_future(self.w3.eth.get_transaction_count(from_address)), 0]
+        sender = self._nonces[from_address]
+        sender[1] += 1
+        return sender[1] - 1
+
+    async def gatherTxData(self, from_address: str, to_address: str, type: int, is_contract_call: bool, low_percentile: int = 5, nonce_offset: int = None):
+        """
+        Async version of customTx.gatherTxData. Fee data is read once and shared by all transactions built by this engine, and so
+        is the nonce of every sender: "nonce" is the one on chain plus `nonce_offset` (reserved with reserveNonce if not given).
+        """
+        key = (type, low_percentile)
+        if key not in self._network_data:
+            self._network_data[key] = asyncio.ensure_future(self._gatherNetworkData(type, low_percentile))
+        if nonce_offset is None:
+            nonce_offset = self.reserveNonce(from_address)
+        lookups = {"nonce": self._nonces[from_address][0]}
+        if is_contract_call:
+            lookups["code"] = self.w3.eth.get_code(to_address)
+        network_data, *values = await asyncio.gather(self._network_data[key], *lookups.values())
+
+        tx_data = dict.fromkeys(("base_fee_history", "latest_block", "max_priority_fee", "code"))
+        tx_data.update(network_data)
+        tx_data.update(zip(lookups, values))
+        tx_data["nonce"] += nonce_offset
+        return tx_data
+
+    # ----- TRANSACTIONS -----
+    async def prepTx(
+        self,
+        from_address: str,
+        to_address: str,
+        value: int = 0,
+        fn_name: str = None,
+        args: tuple = (),
+        type: int = config.tx_type,
+    ):
+        """
+        Async version of customTx.prepTx for non-interactive use: contract function is given by its name and arguments.
+        Unlike prepTx, it does not fall back to historical gas estimates nor prepares approvals, so it raises if gas cannot be estimated.
+        """
+        from_address = Web3.to_checksum_address(from_address)
+        to_address = Web3.to_checksum_address(to_address)
+        low_percentile = 5
+        is_contract_call = fn_name is not None
+        nonce_offset = self.reserveNonce(from_address)  # before the first await, so that nonces follow the order of calls
+
+        lookups = [self.gatherTxData(from_address, to_address, type, is_contract_call, low_percentile, nonce_offset)]
+        if is_contract_call:
+            lookups.append(self.resolveContract(to_address))
+        tx_data, *contract = await asyncio.gather(*lookups)
+
+        base_fee = ((tx_data["latest_block"] or {}).get("baseFeePerGas") or tx_data["gas_price"]) if type == 2 else None
+        fees = calculateFees(tx_data, type, base_fee, low_percentile)
+
+        tx = {
+            "chainId": tx_data["chain_id"],
+            "from": from_address,
+            "to": to_address,
+            "data": "0x",
+            "nonce": tx_data["nonce"],
+            "value": value,
+        }
+        if is_contract_call:
+            if not contract[0]["is_contract"]:
+                raise ValueError(f"The target address {to_address} should be smart contract address.")
+            tx["data"] = getContract(to_address, contract[0]["abi"]).encode_abi(fn_name, args=list(args))  # encoding needs no provider
+
+        # Estimated without the nonce: later transactions of the same sender have nonces which the node does not accept yet
+        gas = await self.w3.eth.estimate_gas({key: value for key, value in tx.items() if key != "nonce"})
+        tx["gas"] = int(gas * config.gas_leeway_coef)
+        if type == 2:
+            tx["type"] = 2
+        tx.update(fees)
+        return tx
+
+    async def prepTxs(self, requests: list):
+        """
+        Builds transactions concurrently. Each request is a dict of prepTx arguments. Results keep the order of `requests`, and
+        transactions of the same sender get consecutive nonces in that order.
+        """
+        return await asyncio.gather(*(self.prepTx(**request) for request in requests))
+
+
+# ----- SYNC WRAPPERS -----
+def prepTxs(requests: list):
+    """Builds transactions for many senders / targets at once, see AsyncEngine.prepTxs."""
+
+    async def run():
+        async with AsyncEngine() as engine:
+            return await engine.prepTxs(requests)
+
+    return asyncio.run(run())
+
+
+def resolveContract(address):
+    """Code check, proxy resolution and ABI of a contract, see AsyncEngine.resolveContract."""
+
+    async def run():
+        async with AsyncEngine() as engine:
+            return await engine.resolveContract(address)
+
+    return asyncio.run(run())
@@ -1,43 +1,111 @@
-import json
+import sqlite3
+import time
+
 import w3off.config as config
+from w3off.observer.cacheStore import CacheStore, isProxyRecord, splitSourceCode
 from w3off.w3provider import w3
 
+# ABIs of regular contracts never change, while proxies can be upgraded: their implementation and the ABI cached
+# under the proxy address are fetched again after IMPLEMENTATION_TTL seconds
+IMPLEMENTATION_TTL = 60 * 60
+MAX_ENTRIES = 10000  # least recently used entries above this are evicted from disk by persist_cache()
+
+# Persistent cache on disk. config.cache is the in-memory layer of the current session: entries read from the store
+# are kept there, entries set during the session are written to the store by persist_cache().
+# Both are keyed by (chain id, checksum address), see cacheKey
+store = CacheStore(config.cache_db_path, config.cache_file_path)
+_dirty = set()  # (kind, key) set since the last persist_cache()
+_expires = {}  # (kind, key) -> expiry of session entries which have one
+
+
+def cacheKey(contract_address, chain_id: int = None):
+    return (config.chain_id if chain_id is None else chain_id, w3.to_checksum_address(contract_address))
+
+
+def _check(kind, contract_address, chain_id):
+    key = cacheKey(contract_address, chain_id)
+    session = config.cache.setdefault(kind, {})
+    if session.get(key):
+        if _expires.get((kind, key), float("inf")) > time.time():
+            return session[key]
+        del session[key]
+    entry = store.get(kind, *key)
+    if entry is None or not entry[0]:
+        return None
+    session[key] = entry[0]
+    if entry[1] is not None:
+        _expires[(kind, key)] = entry[1]
+    return entry[0]
 
-def checkABICache(contract_address):
-    # Current cache logic is only uses smart contract address as an index
-    # This should be fine for now since smart contracts will have different addresses on different chains in most cases, or otherwise share the same abi
 
+def _set(kind, contract_address, value, ttl, chain_id):
+    key = cacheKey(contract_address, chain_id)
+    config.cache.setdefault(kind, {})[key] = value
+    if ttl is None:
+        _expires.pop((kind, key), None)
+    else:
+        _expires[(kind, key)] = time.time() + ttl
+    _dirty.add((kind, key))
+    return value
+
+
+def checkABICache(contract_address, chain_id: int = None):
     # ERC-20 and Smart contracts from w3off.config for current chain
-    if config.smart_contracts.get(contract_address, {}).get("abi"):
+    if (chain_id is None or chain_id == config.chain_id) and config.smart_contracts.get(contract_address, {}).get("abi"):
         return config.smart_contracts[w3.to_checksum_address(contract_address)]["abi"]
 
     # application cache
-    if config.cache.setdefault("abi", {}).get(contract_address):
-        return config.cache.get("abi").get(contract_address)
+    return _check("abi", contract_address, chain_id)
+
 
-    return None
+def setABICache(contract_address, abi, ttl: float = None, chain_id: int = None):
+    """Caches ABI of a contract on the current chain (or `chain_id`). Pass `ttl` (seconds) if it may change, e.g. IMPLEMENTATION_TTL for proxies."""
+    return _set("abi", contract_address, abi, ttl, chain_id)
 
 
-def setABICache(contract_address, abi):
-    if "abi" not in config.cache:
-        config.cache["abi"] = {}
+def checkImplementationCache(contract_address, chain_id: int = None):
+    """Implementation record {"Proxy", "Implementation"} of the contract, see setImplementationCache."""
+    # application cache
+    return _check("implementation", contract_address, chain_id)
 
-    config.cache["abi"][w3.to_checksum_address(contract_address)] = abi
-    return abi
 
+def setImplementationCache(contract_address, response_json, chain_id: int = None):
+    """
+    Caches Etherscan getsourcecode response trimmed to an implementation record {"Proxy", "Implementation"} (or such record,
+    e.g. of a proxy resolved on-chain), which is returned (None if the response is not valid, e.g. an Etherscan error). Records of proxies expire after IMPLEMENTATION_TTL.
+    The ABI of a verified contract which is not a proxy is cached too, so it does not have to be fetched separately.
+    """
+    record, abi = splitSourceCode(response_json)
+    if record is None:
+        return None
+    if abi and not checkABICache(contract_address, chain_id):
+        setABICache(contract_address, abi, chain_id=chain_id)
+    return _set("implementation", contract_address, record, IMPLEMENTATION_TTL if isProxyRecord(record) else None, chain_id)
 
-def checkImplementationCache(contract_address):
-    # application cache
-    if config.cache.setdefault("implementation", {}).get(contract_address):
-        return config.cache.get("implementation").get(contract_address)
-    return None
+
+def checkTokenCache(contract_address, chain_id: int = None):
+    """ERC20 token metadata {"name", "symbol", "decimals"}, see setTokenCache."""
+    return _check("token", contract_address, chain_id)
 
 
-def setImplementationCache(contract_address, response_json):
-    config.cache.setdefault("implementation", {})[w3.to_checksum_address(contract_address)] = response_json
-    return response_json
+def setTokenCache(contract_address, token_info, chain_id: int = None):
+    return _set("token", contract_address, {key: token_info[key] for key in ("name", "symbol", "decimals")}, None, chain_id)
 
 
 def persist_cache():
-    with open(config.cache_file_path, "w") as json_file:
-        json.dump(config.cache, json_file, indent=2)
+    """
+    Writes entries set during this session to disk and evicts stale ones. Only these entries are written, so entries saved
+    meanwhile by other processes sharing the cache are kept.
+    """
+    entries = []
+    for kind, key in sorted(_dirty):
+        value = config.cache.get(kind, {}).get(key)
+        if value:
+            entries.append((kind, *key, value, _expires.get((kind, key))))
+    try:
+        store.put_many(entries)
+        store.evict(MAX_ENTRIES)
+    except sqlite3.OperationalError as e:  # e.g. other processes kept the cache locked for too long, keep the entries for the next time
+        print(f"Could not save cache to {store.path}: {e}")
+        return
+    _dirty.clear()
@@ -0,0 +1,280 @@
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+SCHEMA_VERSION = 3
+BUSY_TIMEOUT = 30  # seconds to wait while another process writes to the cache
+LEGACY_CHAIN_ID = 1  # entries of cache.json and of schema 1 were not chain-aware, they were collected on Ethereum mainnet by default
+
+_CREATE_ENTRIES = """CREATE TABLE entries (
+    kind TEXT NOT NULL,
+    chain_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    abi_hash TEXT,
+    expires_at REAL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (kind, chain_id, key)
+)"""
+# ABI bodies, shared by all entries with the same ABI (e.g. a proxy and its implementation, or the same contract on several chains)
+_CREATE_ABIS = """CREATE TABLE abis (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    compressed INTEGER NOT NULL
+)"""
+
+
+class CacheStore:
+    """
+    Persistent application cache (ABIs and Etherscan proxy information) in a SQLite file, keyed by kind, chain id and address.
+    Entries are looked up and upserted one by one, so nothing is loaded or rewritten as a whole. Entries may expire
+    (`expires_at`, seconds since epoch, None means never) and the least recently used ones are evicted (see evict).
+    ABIs are stored once per content hash, zlib-compressed unless `compress` is False.
+    The connection is opened on first use; an existing cache.json (`legacy_json_path`) is migrated into the new file once.
+
+    Several processes may share the same file: it is in WAL mode (readers never wait for writers), every write is a short
+    transaction which merges its entries into the ones written by others, and SQLite's file locks serialize writers
+    (waiting up to BUSY_TIMEOUT). A file which is not a valid database is moved aside and replaced by an empty cache.
+    """
+
+    def __init__(self, path: str, legacy_json_path: str = None, compress: bool = True):
+        self.path = path
+        self.legacy_json_path = legacy_json_path
+        self.compress = compress
+        self._conn = None
+        self._touched = {}  # (kind, chain_id, key) -> last access, written on the next put_many/evict
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            try:
+                self._conn = self._open()
+            except sqlite3.OperationalError:
+                raise  # e.g. locked for longer than BUSY_TIMEOUT, the file itself is fine
+            except sqlite3.DatabaseError as e:
+                corrupt_path = f"{self.path}.corrupt-{int(time.time())}"
+                print(f"Cache file {self.path} is damaged ({e}). It is moved to {corrupt_path} and the cache starts empty.")
+                os.replace(self.path, corrupt_path)
+                for suffix in ("-wal", "-shm"):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(self.path + suffix)
+                self._conn = self._open()
+        return self._conn
+
+    def _open(self):
+        # Transactions are started explicitly, see _transaction
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")  # durable enough for a cache in WAL mode, and much faster
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._upgrade(conn)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self, conn):
+        """Write transaction which takes the write lock right away, so that concurrent writers wait instead of failing halfway."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _upgrade(self, conn):
+        with self._transaction(conn):
+            version = conn.execute("PRAGMA user_version").fetchone()[0]  # again under the write lock, another process may have done it
+            if version >= SCHEMA_VERSION:
+                return
+            migrated_json = self._migrate(conn, version)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if migrated_json is not None:  # only once the entries are committed
+            os.replace(self.legacy_json_path, f"{self.legacy_json_path}.migrated")
+            print(f"Migrated {migrated_json} entries of {self.legacy_json_path} to {self.path}")
+        if version:
+            conn.execute("VACUUM")  # one-time compaction, the file still has the space of full responses and duplicate ABIs
+
+    def _create_tables(self, conn):
+        conn.execute(_CREATE_ENTRIES)
+        conn.execute("CREATE INDEX entries_lru ON entries (accessed_at)")
+        conn.execute(_CREATE_ABIS)
+
+    def _migrate(self, conn, version: int):
+        """Migrates the schema from `version`. Returns the number of entries imported from cache.json (to be renamed then), if any."""
+        if version == 0:
+            self._create_tables(conn)
+            return self._migrate_legacy_json(conn)
+        if version == 1:  # (kind, key, value) without chains, expiry and access times
+            rows = [(kind, LEGACY_CHAIN_ID, key, json.loads(value), None, None) for kind, key, value in conn.execute("SELECT kind, key, value FROM entries")]
+        else:  # 2: full getsourcecode responses and ABIs stored in entries
+            rows = [
+                (kind, chain_id, key, json.loads(value), expires_at, accessed_at)
+                for kind, chain_id, key, value, expires_at, accessed_at in conn.execute("SELECT kind, chain_id, key, value, expires_at, accessed_at FROM entries")
+            ]
+        conn.execute("DROP TABLE entries")
+        self._create_tables(conn)
+        self._insert_legacy(conn, rows, revalidate=version == 1)
+        return None
+
+    def _migrate_legacy_json(self, conn):
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return None
+        try:
+            with open(self.legacy_json_path) as json_file:
+                legacy = json.load(json_file)
+        except (OSError, ValueError):
+            print(f"Could not read {self.legacy_json_path}, it will not be migrated.")
+            return None
+        rows = [(kind, LEGACY_CHAIN_ID, key, value, None, None) for kind, entries in legacy.items() if isinstance(entries, dict) for key, value in entries.items()]
+        return self._insert_legacy(conn, rows, revalidate=True)
+
+    def _insert_legacy(self, conn, rows, revalidate: bool):
+        """
+        Inserts entries of an older format: Etherscan responses are trimmed to implementation records, with ABIs of verified contracts
+        moved to the ABI cache. If `revalidate`, their age is unknown, so proxy information expires right away.
+        """
+        now = time.time()
+        entries, abis = [], []
+        for kind, chain_id, key, value, expires_at, accessed_at in rows:
+            if kind == "implementation":
+                value, abi = splitSourceCode(value)
+                if value is None:
+                    continue
+                if abi:
+                    abis.append(("abi", chain_id, key, abi, None, accessed_at or now))
+                if revalidate and isProxyRecord(value):
+                    expires_at = now
+            entries.append((kind, chain_id, key, value, expires_at, accessed_at or now))
+        # ABIs which were already cached win over the ones taken from getsourcecode
+        self._write(conn, abis, replace=False)
+        self._write(conn, entries)
+        return len(entries)
+
+    def _write(self, conn, rows, replace: bool = True):
+        """Writes (kind, chain_id, key, value, expires_at, accessed_at) rows, with ABIs stored in the abis table."""
+        entries = []
+        for kind, chain_id, key, value, expires_at, accessed_at in rows:
+            if kind == "abi":
+                abi_hash = self._write_abi(conn, value)
+                entries.append((kind, chain_id, key, None, abi_hash, expires_at, accessed_at))
+            else:
+                entries.append((kind, chain_id, key, json.dumps(value), None, expires_at, accessed_at))
+        conflict = (
+            "ON CONFLICT (kind, chain_id, key) DO UPDATE SET value = excluded.value, abi_hash = excluded.abi_hash, "
+            "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at"
+            if replace
+            else "ON CONFLICT (kind, chain_id, key) DO NOTHING"
+        )
+        conn.executemany(f"INSERT INTO entries (kind, chain_id, key, value, abi_hash, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?) {conflict}", entries)
+
+    def _write_abi(self, conn, abi):
+        data = json.dumps(abi).encode()
+        abi_hash = hashlib.sha256(data).hexdigest()
+        if self.compress:
+            data = zlib.compress(data)
+        conn.execute("INSERT OR IGNORE INTO abis (hash, data, compressed) VALUES (?, ?, ?)", (abi_hash, data, int(self.compress)))
+        return abi_hash
+
+    def get(self, kind: str, chain_id: int, key: str):
+        """(value, expires_at) of a cached entry, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT entries.value, entries.expires_at, abis.data, abis.compressed FROM entries LEFT JOIN abis ON abis.hash = entries.abi_hash "
+                "WHERE kind = ? AND chain_id = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (kind, chain_id, key, now),
+            ).fetchone()
+            if row:
+                self._touched[(kind, chain_id, key)] = now
+        if row is None:
+            return None
+        value, expires_at, data, compressed = row
+        if data is not None:
+            value = zlib.decompress(data) if compressed else data
+        return (json.loads(value), expires_at) if value is not None else None
+
+    def _flush_touched(self, conn):
+        if self._touched:
+            conn.executemany(
+                "UPDATE entries SET accessed_at = ? WHERE kind = ? AND chain_id = ? AND key = ?",
+                [(accessed_at, *entry) for entry, accessed_at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def put_many(self, entries):
+        """Upserts (kind, chain_id, key, value, expires_at) entries in one transaction."""
+        now = time.time()
+        rows = [(kind, chain_id, key, value, expires_at, now) for kind, chain_id, key, value, expires_at in entries]
+        if not rows:
+            return
+        with self._lock:
+            with self._transaction(self._connect()) as conn:
+                self._flush_touched(conn)
+                self._write(conn, rows)
+
+    def put(self, kind: str, chain_id: int, key: str, value, expires_at: float = None):
+        self.put_many([(kind, chain_id, key, value, expires_at)])
+
+    def evict(self, max_entries: int):
+        """Deletes expired entries and then the least recently used ones above `max_entries`. Returns the number of deleted entries."""
+        with self._lock:
+            with self._transaction(self._connect()) as conn:
+                self._flush_touched(conn)
+                deleted = conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)).rowcount
+                excess = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - max_entries
+                if excess > 0:
+                    deleted += conn.execute("DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY accessed_at LIMIT ?)", (excess,)).rowcount
+                if deleted:
+                    conn.execute("DELETE FROM abis WHERE hash NOT IN (SELECT abi_hash FROM entries WHERE abi_hash IS NOT NULL)")
+        return deleted
+
+    def count(self, kind: str = None):
+        with self._lock:
+            conn = self._connect()
+            if kind is None:
+                return conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return conn.execute("SELECT COUNT(*) FROM entries WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def implementationRecord(response_json):
+    """Compact record {"Proxy", "Implementation"} of Etherscan getsourcecode response, or None if it is not a valid response."""
+    try:
+        result = response_json["result"][0]
+        return {"Proxy": result["Proxy"], "Implementation": result.get("Implementation", "")}
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def splitSourceCode(response_json):
+    """
+    Implementation record and ABI (of verified contracts that are not proxies, otherwise None) of getsourcecode response.
+    Compact records, e.g. already migrated ones, are returned as they are.
+    """
+    if isinstance(response_json, dict) and "Proxy" in response_json:
+        return response_json, None
+    record = implementationRecord(response_json)
+    if record is None or isProxyRecord(record):
+        return record, None
+    abi = response_json["result"][0].get("ABI", "")
+    return record, abi if abi.startswith("[") else None
+
+
+def isProxyRecord(record) -> bool:
+    """True if implementation record (see implementationRecord) describes a proxy contract."""
+    return bool(record) and record.get("Proxy") == "1"
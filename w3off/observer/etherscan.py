@@ -0,0 +1,234 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import w3off.config as config
+from w3off.rpc import recordReplay
+from w3off.rpc.stats import endpointName, recordCall
+
+ETHERSCAN_API_URL = "https://api.etherscan.io/v2/api"
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)  # transient HTTP errors, retried with backoff
+RETRIES = 3
+BACKOFF = 0.5  # seconds before the first retry, doubled for every next one
+
+
+class EtherscanError(Exception):
+    """Etherscan answered with an error message instead of a result (e.g. invalid API key, contract source code not verified)."""
+
+
+def etherscanUrl(chain_id: int, module: str, action: str, **params):
+    assert config.ethscan_api_key, "Please sign up on etherscan and save your API key to environment variable named ETHSCAN_API_KEY to use this application."
+    query = "&".join(f"{key}={value}" for key, value in params.items())
+    return f"{ETHERSCAN_API_URL}?chainid={chain_id}&module={module}&action={action}&{query}&apikey={config.ethscan_api_key}"
+
+
+def isRateLimited(response_json):
+    """True if Etherscan refused the request because of its rate limit (it still answers with status 200)."""
+    result = response_json.get("result") if isinstance(response_json, dict) else None
+    return isinstance(result, str) and "rate limit" in result.lower()
+
+
+def checkResponse(response_json):
+    """Returns the response, or raises EtherscanError if it is an error ("status": "0" and a message as result).
+    Empty results, e.g. "No transactions found", are not errors."""
+    if isinstance(response_json, dict) and response_json.get("status") == "0" and isinstance(response_json.get("result"), str):
+        raise EtherscanError(f"{response_json.get('message', 'NOTOK')}: {response_json['result']}")
+    return response_json
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average, in bursts of up to `burst` calls. Callers which are over the limit wait
+    for their turn (in order). Thread-safe; asyncio code awaits waitAsync() instead of wait().
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Takes a token and returns the seconds to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def wait(self):
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def waitAsync(self):
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class EtherscanClient:
+    """
+    Etherscan API (v2) client shared by all lookups: pooled keep-alive connections, requests spaced by a token bucket sized
+    to the API plan (config.etherscan_rate_limit), retries with exponential backoff on throttling and transient errors,
+    and identical requests in flight sent only once (all callers get the same parsed response, do not modify it).
+    Responses are recorded in network call stats and can be recorded / replayed (see w3off.rpc.recordReplay).
+    """
+
+    def __init__(self, rate: float = None, retries: int = RETRIES, backoff: float = BACKOFF, timeout: float = None, pool_maxsize: int = None):
+        self.limiter = TokenBucket(rate or config.etherscan_rate_limit)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout or config.rpc_timeout
+        self.pool_maxsize = pool_maxsize or config.rpc_pool_maxsize
+        self._session = None
+        self._inflight = {}  # (http method, url) -> Future of the request being sent
+        self._inflight_async = {}  # (event loop id, url) -> Task of the request being sent
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+                self._session = requests.Session()
+                self._session.mount("https://", adapter)
+                self._session.headers.update({"User-Agent": "w3off"})
+            return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    # ----- SYNC -----
+    def request(self, chain_id: int, module: str, action: str, http_method: str = "get", **params):
+        """Sends request to Etherscan. Returns parsed JSON response, raises EtherscanError if Etherscan answers with an error."""
+        url = etherscanUrl(chain_id, module, action, **params)
+        key = (http_method, url)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if owner:
+            try:
+                future.set_result(self._request(url, f"{module}.{action}", http_method))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+        return future.result()
+
+    def batch(self, calls: list):
+        """
+        Sends requests [(chain_id, module, action, params), ...] concurrently, within the rate limit.
+        Returns their results in the same order, with the exception in place of a failed request.
+        """
+        if not calls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(calls), self.pool_maxsize)) as executor:
+            futures = [executor.submit(self.request, chain_id, module, action, **params) for chain_id, module, action, params in calls]
+        return [future.exception() or future.result() for future in futures]
+
+    def _request(self, url: str, method: str, http_method: str):
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                response = self._send(url, method, http_method)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                continue
+            if response.status_code in RETRY_STATUS_CODES:
+                error = requests.HTTPError(f"{response.status_code} response from Etherscan", response=response)
+                continue
+            response.raise_for_status()
+            response_json = response.json()
+            if isRateLimited(response_json):
+                error = EtherscanError(response_json["result"])
+                continue
+            return checkResponse(response_json)
+        raise error
+
+    def _send(self, url: str, method: str, http_method: str) -> requests.Response:
+        start = time.perf_counter()
+        response = None
+        try:
+            if recordReplay.replaying is not None:
+                response = recordReplay.replaying.etherscanResponse(url)
+            else:
+                self.limiter.wait()
+                start = time.perf_counter()  # time spent waiting for the rate limit is not latency
+                response = self.session.request(http_method, url, timeout=self.timeout)
+                if recordReplay.recording is not None:
+                    recordReplay.recording.recordEtherscan(url, response)
+            return response
+        finally:
+            received = len(response.content) if response is not None else 0
+            recordCall("etherscan", endpointName(ETHERSCAN_API_URL), method, time.perf_counter() - start, len(url), received, error=response is None or not response.ok)
+
+    # ----- ASYNC -----
+    async def requestAsync(self, session, chain_id: int, module: str, action: str, limiter: TokenBucket = None, **params):
+        """
+        Asyncio version of request, sent with aiohttp `session`. Waits for `limiter` (the shared token bucket by default).
+        Identical requests in flight on the same event loop are sent once.
+        """
+        url = etherscanUrl(chain_id, module, action, **params)
+        key = (id(asyncio.get_running_loop()), url)
+        task = self._inflight_async.get(key)
+        if task is None:
+            task = self._inflight_async[key] = asyncio.ensure_future(self._requestAsync(session, url, f"{module}.{action}", limiter or self.limiter))
+            task.add_done_callback(lambda _: self._inflight_async.pop(key, None))
+        return await asyncio.shield(task)  # a cancelled caller does not cancel the others
+
+    async def _requestAsync(self, session, url: str, method: str, limiter: TokenBucket):
+        import aiohttp
+
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                status, body = await self._sendAsync(session, url, method, limiter)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = e
+                continue
+            if status in RETRY_STATUS_CODES:
+                error = EtherscanError(f"{status} response from Etherscan")
+                continue
+            if status >= 400:
+                raise EtherscanError(f"{status} response from Etherscan")
+            response_json = json.loads(body)
+            if isRateLimited(response_json):
+                error = EtherscanError(response_json["result"])
+                continue
+            return checkResponse(response_json)
+        raise error
+
+    async def _sendAsync(self, session, url: str, method: str, limiter: TokenBucket):
+        if recordReplay.replaying is not None:
+            await asyncio.sleep(recordReplay.replaying.latency)
+            response = recordReplay.replaying.etherscanResponse(url, wait=False)
+            return response.status_code, response.content
+        await limiter.waitAsync()
+        start = time.perf_counter()
+        status, body = None, b""
+        try:
+            async with session.get(url) as response:
+                status, body = response.status, await response.read()
+                return status, body
+        finally:
+            recordCall("etherscan", endpointName(ETHERSCAN_API_URL), method, time.perf_counter() - start, len(url), len(body), error=status is None or status >= 400)
+
+
+client = EtherscanClient()  # shared by all sync lookups and asyncio engines
@@ -1,12 +1,16 @@
-import requests
 import w3off.config as config
+from w3off.observer import etherscan
 from w3off.observer.cache import (
+    IMPLEMENTATION_TTL,
     checkABICache,
     checkImplementationCache,
     persist_cache,
     setABICache,
     setImplementationCache,
 )
+from w3off.observer.etherscan import EtherscanError
+from w3off.observer.proxyResolver import resolveProxy
+from w3off.helpers.abiHelpers import functionTable, getContract
 from w3off.w3provider import w3
 
 # Flags for currently processed transaction
@@ -15,6 +19,14 @@ sourceAddr = ""
 implementationAddr = ""
 
 
+def etherscanRequest(module: str, action: str, http_method: str = "get", **params):
+    """
+    Sends request to Etherscan API (v2) for the current chain through the shared client (see w3off.observer.etherscan).
+    Returns parsed JSON response, raises EtherscanError if Etherscan answers with an error.
+    """
+    return etherscan.client.request(w3.eth.chain_id, module, action, http_method, **params)
+
+
 def fetchABI(contract_address):
     """
     Fetches ABI as a string for a smart contract deployed at address `address`
@@ -28,17 +40,15 @@ def fetchABI(contract_address):
     if abi is not None:
         return abi
 
-    assert config.ethscan_api_key, "Please sign up on etherscan and save your API key to environment variable named ETHSCAN_API_KEY to use this application."
-    url = f"https://api.etherscan.io/v2/api?chainid={w3.eth.chain_id}&module=contract&action=getabi&address={contract_address}&apikey={config.ethscan_api_key}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        abi = setABICache(contract_address, response.json()["result"])
-        return abi
-    else:
+    try:
+        response_json = etherscanRequest("contract", "getabi", address=contract_address)
+    except EtherscanError:  # e.g. source code not verified, nothing to cache
         return None
+    return setABICache(contract_address, response_json["result"])
 
 
-def listFunctions(contract_address: str, abi: str = None):
+def contractABI(contract_address: str):
+    """ABI of the smart contract at `contract_address` (the one of its implementation for proxies), from cache or Etherscan."""
     contract_address = w3.to_checksum_address(contract_address)
 
     if not isContract(contract_address):
@@ -50,40 +60,52 @@ def listFunctions(contract_address: str, abi: str = None):
         contract_address_impl = implementationAddress(contract_address)
         abi = fetchABI(contract_address_impl)
         setABICache(contract_address_impl, abi)
-        if contract_address != contract_address_impl:  # if proxy address
-            setABICache(contract_address, abi)
+        if contract_address != contract_address_impl:  # if proxy address, its ABI changes on upgrade
+            setABICache(contract_address, abi, ttl=IMPLEMENTATION_TTL)
 
-    contract = w3.eth.contract(address=contract_address, abi=abi)
+    return abi
 
-    return list([i for i in contract.functions if i.abi["type"] == "function"])
+
+def contractFunctions(contract_address: str):
+    """Contract object and FunctionTable (functions indexed by selector, name and position) of the smart contract at `contract_address`."""
+    contract_address = w3.to_checksum_address(contract_address)
+    abi = contractABI(contract_address)
+    return getContract(contract_address, abi), functionTable(abi)
+
+
+def listFunctions(contract_address: str, abi: str = None):
+    contract, table = contractFunctions(contract_address)
+
+    return [contract.functions[entry.signature] for entry in table]
 
 
 def implementationAddress(address):
     global isProxy, implementationAddr, sourceAddr
     address = w3.to_checksum_address(address)
-    response_json = checkImplementationCache(address)
-    if not response_json:
-        assert config.ethscan_api_key, "Please sign up on etherscan and save your API key to environment variable named ETHSCAN_API_KEY to use this application."
-        response = requests.post(
-            f"https://api.etherscan.io/v2/api?chainid={w3.eth.chain_id}&module=contract&action=getsourcecode&address={address}&apikey={config.ethscan_api_key}"
-        )
-        response_json = response.json()
-        setImplementationCache(address, response_json)
-
-    # initial_abi = response_json['result'][0]['ABI']
+    record = checkImplementationCache(address)
+    if not record:
+        # standard proxies are resolved on-chain, Etherscan is asked only about the others
+        implementation = resolveProxy(w3, address)
+        if implementation is not None:
+            record = setImplementationCache(address, {"Proxy": "1", "Implementation": implementation})
+    if not record:
+        response_json = etherscanRequest("contract", "getsourcecode", "post", address=address)
+        record = setImplementationCache(address, response_json)
+        if record is None:
+            raise ValueError(f"Could not get source code information of {address} from Etherscan: {response_json}")
+
     sourceAddr = address
-    isProxy = response_json["result"][0]["Proxy"] == "1"
+    isProxy = record["Proxy"] == "1"
     if not isProxy:
-        # setABICache(address, initial_abi)
         return address
-    implementationAddr = response_json["result"][0]["Implementation"]
+    implementationAddr = record["Implementation"]
     return w3.to_checksum_address(implementationAddr)
 
 
-def isContract(address):
-    # Get the code at the address!
+def isContract(address, code: bytes = None):
+    # Get the code at the address! (unless it has already been fetched, e.g. in a batch)
     address = w3.to_checksum_address(address)
-    code = w3.eth.get_code(address)
+    code = w3.eth.get_code(address) if code is None else code
     # Check if the code is empty
     return code.hex() != ""  # Returns True if it's a contract
 
@@ -0,0 +1,76 @@
+import asyncio
+
+from eth_utils import keccak, to_checksum_address
+from web3 import Web3
+
+from w3off.rpc import batchRead
+
+
+def _slot(text: str, minus_one: bool = True):
+    return int.from_bytes(keccak(text=text), "big") - int(minus_one)
+
+
+# Storage slots holding the implementation (or beacon) address of standard proxies, in order of precedence
+PROXY_SLOTS = {
+    "eip1967": _slot("eip1967.proxy.implementation"),
+    "eip1822": _slot("PROXIABLE", minus_one=False),
+    "oz_legacy": _slot("org.zeppelinos.proxy.implementation", minus_one=False),  # OpenZeppelin (zos) proxies before EIP-1967
+    "eip1967_beacon": _slot("eip1967.proxy.beacon"),
+}
+BEACON_IMPLEMENTATION_CALL = "0x5c60da1b"  # implementation() of EIP-1967 beacons
+PROXY_MAX_DEPTH = 5  # proxies of proxies followed at most
+
+
+def _address(word: bytes):
+    """Address stored in a 32-byte word, or None if it is empty."""
+    word = bytes(word or b"")[-20:]
+    return to_checksum_address(word) if word.strip(b"\x00") else None
+
+
+def _pick(slots: dict):
+    """(kind, address) of the first non-empty proxy slot (see PROXY_SLOTS), or (None, None)."""
+    for kind in PROXY_SLOTS:
+        address = _address(slots.get(kind))
+        if address:
+            return kind, address
+    return None, None
+
+
+def resolveProxy(w3: Web3, address: str, max_depth: int = PROXY_MAX_DEPTH):
+    """
+    Implementation address of a standard proxy (EIP-1967 implementation or beacon, EIP-1822, OpenZeppelin legacy) read from
+    its storage slots in one batch, following proxies of proxies. Returns None if no slot is set (not a standard proxy) or the
+    beacon cannot be asked for the implementation.
+    """
+    address = to_checksum_address(address)
+    implementation = None
+    for _ in range(max_depth):
+        slots = batchRead(w3, {kind: (lambda slot=slot: w3.eth.get_storage_at(address, slot)) for kind, slot in PROXY_SLOTS.items()}, optional=tuple(PROXY_SLOTS))
+        kind, target = _pick(slots)
+        if kind == "eip1967_beacon":
+            try:
+                target = _address(w3.eth.call({"to": target, "data": BEACON_IMPLEMENTATION_CALL}))
+            except Exception:
+                return None  # beacon without implementation() or reverting, left to Etherscan
+        if not target or target == address:
+            break
+        implementation = address = target
+    return implementation
+
+
+async def resolveProxyAsync(w3, address: str, max_depth: int = PROXY_MAX_DEPTH):
+    """Asyncio version of resolveProxy for AsyncWeb3 (slots are read concurrently)."""
+    address = to_checksum_address(address)
+    implementation = None
+    for _ in range(max_depth):
+        words = await asyncio.gather(*(w3.eth.get_storage_at(address, slot) for slot in PROXY_SLOTS.values()), return_exceptions=True)
+        kind, target = _pick({kind: word for kind, word in zip(PROXY_SLOTS, words) if not isinstance(word, Exception)})
+        if kind == "eip1967_beacon":
+            try:
+                target = _address(await w3.eth.call({"to": target, "data": BEACON_IMPLEMENTATION_CALL}))
+            except Exception:
+                return None  # beacon without implementation() or reverting, left to Etherscan
+        if not target or target == address:
+            break
+        implementation = address = target
+    return implementation
@@ -1,8 +1,10 @@
-import requests
 import w3off.config as config
 from w3off.config import getChainName
 from w3off.w3provider import estimateBaseFee, w3
-from w3off.observer.fetchABI import fetchABI, implementationAddress, isContract
+from w3off.helpers.abiHelpers import getContract
+from w3off.observer.cache import checkTokenCache, setTokenCache
+from w3off.observer.fetchABI import etherscanRequest, fetchABI, implementationAddress, isContract
+from w3off.rpc import batchRead
 from web3.types import TContractFn
 from eth_utils import keccak
 from w3off.cli.helpers import bcolors
@@ -27,52 +29,21 @@ def prepTx(
     from_address = w3.to_checksum_address(from_address)
     to_address = w3.to_checksum_address(to_address)
 
-    # Construct transaction params
-    nonce = w3.eth.get_transaction_count(from_address)
-    gas_price = w3.eth.gas_price  # default calculation
-
-    tx = {}
+    # Construct transaction params (all independent network reads are done in one round trip)
     low_percentile = 5
-    priority_fees_low_estimate = calculateGasPriorityFeePercentile(low_percentile=low_percentile) or 0
+    tx_data = gatherTxData(from_address, to_address, type, f is not None, low_percentile)
+    chain_id = tx_data["chain_id"]
+    nonce = tx_data["nonce"]
+    gas_price = tx_data["gas_price"]  # default calculation
 
-    if config.verbose:
-        avg_base_fee = calculateGasBaseFeeAverage()
-        print(f"=============================== ")
-        print(f"Current network gas statistics: ")
-        print(f"=============================== ")
-        print(f"- current gas price = {round(w3.from_wei(gas_price, 'gwei'),4)} gwei")
-        print(f"- avg base fee = {round(w3.from_wei(avg_base_fee, 'gwei'),4)} gwei")
-        print(f"- priority fee (lower {low_percentile}% percentile) = {round(w3.from_wei(priority_fees_low_estimate, 'gwei'),4)} gwei")
-
-    if type == 2:
-        base_fee = estimateBaseFee()
-        # maxPriorityFeePerGas = min(int(gas_price*config.gas_leeway_coef) - base_fee,config.gas_max_priority_fee)
-        maxPriorityFeePerGas = int(
-            min(
-                w3.eth.max_priority_fee,
-                priority_fees_low_estimate,
-                config.gas_max_priority_fee,
-            )
-        )
-        maxFeePerGas = int((base_fee + maxPriorityFeePerGas) * config.gas_leeway_coef)
-        if maxFeePerGas > config.gas_max_fee:
-            print(
-                f"{bcolors.WARNING}High gas price{bcolors.ENDC}. Estimated maxFeePerGas is {round(w3.from_wei(maxFeePerGas,'gwei'),4)} \
-                   and it exceeds your limit in configuration of {round(w3.from_wei(config.gas_max_fee,'gwei'),4)} gwei."
-            )
-
-        if config.verbose:
-            print(f"================================ ")
-            print(f"Your transaction gas parameters: ")
-            print(f"================================ ")
-            print(f"- type: 2 (EIP-1559)             ")
-            print(f"- base fee (MINIMUM EXPENSE)= {round(w3.from_wei(base_fee, 'gwei'),4)} gwei")
-            print(f"- max priority fee per gas = {round(w3.from_wei(maxPriorityFeePerGas, 'gwei'),4)} gwei")
-            print(f"- max fee per gas for your transaction (UPPER EXPENSE LIMIT) = {round(w3.from_wei(maxFeePerGas, 'gwei'),4)} gwei")
-            print(f"=============================== ")
+    tx = {}
+    base_fee = estimateBaseFee(tx_data["latest_block"]) if type == 2 else None
+    fees = calculateFees(tx_data, type, base_fee, low_percentile)
+    maxPriorityFeePerGas = fees.get("maxPriorityFeePerGas")
+    maxFeePerGas = fees.get("maxFeePerGas")
 
     if f is not None:
-        if not isContract(to_address):
+        if not isContract(to_address, tx_data["code"]):
             raise ValueError(f"The target address {to_address} should be smart contract address.")
         try:
             gas = f(*param_values).estimate_gas({"from": from_address, "nonce": nonce})
@@ -90,7 +61,7 @@ def prepTx(
             # Legacy Transaction (Type 0)
             tx = f(*param_values).build_transaction(
                 {
-                    "chainId": w3.eth.chain_id,
+                    "chainId": chain_id,
                     "from": from_address,  # Specify the source address here
                     "gas": gas,
                     "gasPrice": gas_price,  # use gas_price if connected to blockchain
@@ -103,7 +74,7 @@ def prepTx(
             tx = f(*param_values).build_transaction(
                 {
                     "type": 2,
-                    "chainId": w3.eth.chain_id,
+                    "chainId": chain_id,
                     "from": from_address,  # Specify the source address here
                     "gas": gas,
                     "maxPriorityFeePerGas": maxPriorityFeePerGas,
@@ -115,7 +86,7 @@ def prepTx(
 
     else:  # Simple transfer
         tx = {
-            "chainId": w3.eth.chain_id,
+            "chainId": chain_id,
             "from": from_address,
             "to": to_address,
             "data": "0x",
@@ -140,6 +111,77 @@ def prepTx(
     return tx
 
 
+def gatherTxData(from_address: str, to_address: str, type: int, is_contract_call: bool, low_percentile: int = 5):
+    """
+    Reads all independent values needed by prepTx (nonce, gas and fee data, contract code, chain id) in one JSON-RPC batch.
+    Values which are not needed for the given transaction type are returned as None.
+    """
+    calls = {
+        "chain_id": lambda: w3.eth.chain_id,
+        "nonce": lambda: w3.eth.get_transaction_count(from_address),
+        "gas_price": lambda: w3.eth.gas_price,
+        "priority_fee_history": lambda: w3.eth.fee_history(1, "latest", [low_percentile, 90]),
+    }
+    if config.verbose:
+        calls["base_fee_history"] = lambda: w3.eth.fee_history(5, "latest", [10, 90])
+    if type == 2:
+        calls["latest_block"] = lambda: w3.eth.get_block("latest")
+        calls["max_priority_fee"] = lambda: w3.eth.max_priority_fee
+    if is_contract_call:
+        calls["code"] = lambda: w3.eth.get_code(to_address)
+
+    tx_data = dict.fromkeys(("base_fee_history", "latest_block", "max_priority_fee", "code"))
+    tx_data.update(batchRead(w3, calls, optional=("latest_block",)))
+    return tx_data
+
+
+def calculateFees(tx_data: dict, type: int, base_fee: int = None, low_percentile: int = 5):
+    """
+    Gas price fields of a transaction computed from values read by gatherTxData (no network calls, shared with the async engine).
+    Returns {"gasPrice": ...} for legacy transactions and {"maxPriorityFeePerGas": ..., "maxFeePerGas": ...} for EIP-1559 ones.
+    """
+    gas_price = tx_data["gas_price"]  # default calculation
+    priority_fees_low_estimate = calculateGasPriorityFeePercentile(low_percentile=low_percentile, fee_history=tx_data["priority_fee_history"]) or 0
+
+    if config.verbose:
+        avg_base_fee = calculateGasBaseFeeAverage(fee_history=tx_data["base_fee_history"])
+        print(f"=============================== ")
+        print(f"Current network gas statistics: ")
+        print(f"=============================== ")
+        print(f"- current gas price = {round(w3.from_wei(gas_price, 'gwei'),4)} gwei")
+        print(f"- avg base fee = {round(w3.from_wei(avg_base_fee, 'gwei'),4)} gwei")
+        print(f"- priority fee (lower {low_percentile}% percentile) = {round(w3.from_wei(priority_fees_low_estimate, 'gwei'),4)} gwei")
+
+    if type != 2:
+        return {"gasPrice": gas_price}
+
+    # maxPriorityFeePerGas = min(int(gas_price*config.gas_leeway_coef) - base_fee,config.gas_max_priority_fee)
+    maxPriorityFeePerGas = int(
+        min(
+            tx_data["max_priority_fee"],
+            priority_fees_low_estimate,
+            config.gas_max_priority_fee,
+        )
+    )
+    maxFeePerGas = int((base_fee + maxPriorityFeePerGas) * config.gas_leeway_coef)
+    if maxFeePerGas > config.gas_max_fee:
+        print(
+            f"{bcolors.WARNING}High gas price{bcolors.ENDC}. Estimated maxFeePerGas is {round(w3.from_wei(maxFeePerGas,'gwei'),4)} \
+               and it exceeds your limit in configuration of {round(w3.from_wei(config.gas_max_fee,'gwei'),4)} gwei."
+        )
+
+    if config.verbose:
+        print(f"================================ ")
+        print(f"Your transaction gas parameters: ")
+        print(f"================================ ")
+        print(f"- type: 2 (EIP-1559)             ")
+        print(f"- base fee (MINIMUM EXPENSE)= {round(w3.from_wei(base_fee, 'gwei'),4)} gwei")
+        print(f"- max priority fee per gas = {round(w3.from_wei(maxPriorityFeePerGas, 'gwei'),4)} gwei")
+        print(f"- max fee per gas for your transaction (UPPER EXPENSE LIMIT) = {round(w3.from_wei(maxFeePerGas, 'gwei'),4)} gwei")
+        print(f"=============================== ")
+    return {"maxPriorityFeePerGas": maxPriorityFeePerGas, "maxFeePerGas": maxFeePerGas}
+
+
 def parseERC20Info(f: TContractFn = None, param_values: tuple = None):
     token_info = {}
     for i, param in enumerate(f.abi["inputs"]):
@@ -160,24 +202,28 @@ def parseERC20Info(f: TContractFn = None, param_values: tuple = None):
 
 def fetchERC20Info(token_address, abi=None):
     abi = abi or fetchABI(token_address)
-    contract = w3.eth.contract(address=token_address, abi=abi)
-    name = contract.functions.name().call()
-    decimals = contract.functions.decimals().call()
-    symbol = contract.functions.symbol().call()
-    config.smart_contracts[token_address] = {
-        "name": name,
-        "decimals": decimals,
-        "symbol": symbol,
-        "address": token_address,
-        "abi": abi,
-        "type": "ERC20",
-    }
+    token_info = checkTokenCache(token_address)  # e.g. filled by `w3off cache warm`
+    if token_info is None:
+        contract = getContract(token_address, abi)
+        name = contract.functions.name().call()
+        decimals = contract.functions.decimals().call()
+        symbol = contract.functions.symbol().call()
+        token_info = setTokenCache(token_address, {"name": name, "symbol": symbol, "decimals": decimals})
+    config.smart_contracts[token_address] = config.registerContract(
+        config.chain_id,
+        {
+            **token_info,
+            "address": token_address,
+            "abi": abi,
+            "type": "ERC20",
+        },
+    )
     return config.smart_contracts[token_address]
 
 
 def fetchApprovedAmount(from_address, spender_address, token_info, abi=None):
     abi = abi or fetchABI(implementationAddress(token_info["address"]))
-    contract = w3.eth.contract(address=token_info["address"], abi=abi)
+    contract = getContract(token_info["address"], abi)
 
     decimals = contract.functions.decimals.call()
     token_info["decimals"] = decimals
@@ -210,7 +256,7 @@ def handleApprovalIfRequired(
     if approvedAmount < token_info.get("amount", -1):  # Not enough allowance
         print(f"{bcolors.WARNING}Approval to spend coins needed{bcolors.ENDC}. You need to issue approval to spend at least {token_info['amount'] // 10**token_info['decimals']} of {token_info['name']} first. Your current allowance is {approvedAmount}.")
         print(f"We proceed to approval transaction creation. Please launch this dialog again , if needed, for your initially desired transaction once you complete the approval tx.")
-        erc20_contract = w3.eth.contract(address=token_info["address"], abi=token_info["abi"])
+        erc20_contract = getContract(token_info["address"], token_info["abi"])
         tx_approval = prepTx(
             from_address,
             token_info["address"],
@@ -228,11 +274,9 @@ def handleApprovalIfRequired(
 
 
 def calculateGasBasedOnHistory(contract_address, f_signature):
-    assert config.ethscan_api_key, "Please sign up on etherscan and save your API key to environment variable named ETHSCAN_API_KEY to use this application."
-    response = requests.post(
-        f"https://api.etherscan.io/v2/api?chainId={w3.eth.chain_id}&module=account&action=txlist&address={contract_address}&startblock=0&endblock=99999999&page=1&offset=10000&sort=asc&apikey={config.ethscan_api_key}"
+    response_json = etherscanRequest(
+        "account", "txlist", "post", address=contract_address, startblock=0, endblock=99999999, page=1, offset=10000, sort="asc"
     )
-    response_json = response.json()
     f_name_encoded = "0x" + keccak(text=f_signature).hex()[:8]
     transactions = filter(lambda tx: tx.get("methodId") == f_name_encoded, response_json["result"])
 
@@ -252,14 +296,14 @@ def calculateGasBasedOnHistory(contract_address, f_signature):
     return average_gas_used
 
 
-def calculateGasBaseFeeAverage(n_blocks: int = 5):
-    fee_history = w3.eth.fee_history(n_blocks, "latest", [10, 90])
+def calculateGasBaseFeeAverage(n_blocks: int = 5, fee_history: dict = None):
+    fee_history = fee_history or w3.eth.fee_history(n_blocks, "latest", [10, 90])
     base_fee = sum(fee_history["baseFeePerGas"]) / len(fee_history["baseFeePerGas"])
     return base_fee
 
 
-def calculateGasPriorityFeePercentile(n_blocks: int = 1, low_percentile: int = 10):
-    fee_history = w3.eth.fee_history(n_blocks, "latest", [low_percentile, 90])
+def calculateGasPriorityFeePercentile(n_blocks: int = 1, low_percentile: int = 10, fee_history: dict = None):
+    fee_history = fee_history or w3.eth.fee_history(n_blocks, "latest", [low_percentile, 90])
     if fee_history["reward"]:
         priority_fees_low = [low_reward for low_reward in fee_history["reward"][0]]
         priority_fees_low_estimate = sum(priority_fees_low) / len(priority_fees_low)
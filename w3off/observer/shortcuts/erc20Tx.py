@@ -1,3 +1,5 @@
+from w3off.helpers.abiHelpers import getContract
+from w3off.rpc import batchRead
 from w3off.w3provider import w3
 
 name = "ERC20"
@@ -15,19 +17,26 @@ def prepERC20Transfer(
     receiver_address = w3.to_checksum_address(receiver_address)
     contract_address = w3.to_checksum_address(contract_address)
 
-    # Create contract object
-    contract = w3.eth.contract(address=contract_address, abi=abi)
+    # Create contract object (or reuse it)
+    contract = getContract(contract_address, abi)
     decimals = contract.functions.decimals.call()
 
-    nonce = w3.eth.get_transaction_count(sender_address)
-    gas_price = w3.eth.gas_price
+    tx_data = batchRead(
+        w3,
+        {
+            "chain_id": lambda: w3.eth.chain_id,
+            "nonce": lambda: w3.eth.get_transaction_count(sender_address),
+            "gas_price": lambda: w3.eth.gas_price,
+        },
+    )
+    chain_id, nonce, gas_price = tx_data["chain_id"], tx_data["nonce"], tx_data["gas_price"]
     amount = int(amount * 10**decimals)
-    gas = contract.functions.transfer(receiver_address, amount).estimate_gas({"chainId": w3.eth.chain_id, "from": sender_address, "nonce": nonce})
+    gas = contract.functions.transfer(receiver_address, amount).estimate_gas({"chainId": chain_id, "from": sender_address, "nonce": nonce})
 
     # Build the transaction to call the `transfer` function
     tx = contract.functions.transfer(receiver_address, amount).build_transaction(
         {
-            "chainId": w3.eth.chain_id,
+            "chainId": chain_id,
             "gas": gas,
             "gasPrice": gas_price,  # use gas_price if connected to blockchain
             "nonce": nonce,
@@ -4,10 +4,11 @@ import itertools
 import w3off.config as config
 from w3off.config import getChainName
 from w3off.cli.prompts import inputShortcut
-from w3off.w3provider import change_chain, w3
+from w3off.rpc import formatCacheStats, handleStatsFlag
+from w3off.w3provider import change_chain, w3, warm_up
 
 from w3off.observer.cache import persist_cache
-from w3off.observer.fetchABI import fetchABI, isContract, listFunctions
+from w3off.observer.fetchABI import contractFunctions, fetchABI, isContract
 from w3off.observer.shortcuts.erc20Tx import prepERC20Transfer
 from w3off.observer.shortcuts.customTx import prepTx
 from w3off.observer.shortcuts import available_shortcuts
@@ -32,11 +33,7 @@ def run_simple_eth_transfer(source, to_address, **pparams):
 
 def run_smart_contract_tx(source, to_address, **pparams):
     print("You have entered a smart contract address...")
-    funcs = listFunctions(to_address)
-
-    # Put READ functions first, then WRITE
-    order = {"pure": 0, "view": 1, "nonpayable": 2, "payable": 3}
-    funcs = sorted(funcs, key=lambda f: order.get(f.abi["stateMutability"], 999))
+    contract, funcs = contractFunctions(to_address)  # READ functions first, then WRITE
 
     from w3off.observer.fetchABI import isProxy, implementationAddr
 
@@ -46,12 +43,11 @@ def run_smart_contract_tx(source, to_address, **pparams):
     # Print list of functions, but only if function was not pre-selected in input pparams
     if not pparams.get("func_choice", False):
         flag = None
-        i = 1
         for f in funcs:
             if flag is None:
                 print("--- READ functions ---")
                 flag = "READ"
-            if (f.abi["stateMutability"] not in ("pure", "view")) and flag != "WRITE":
+            if not f.is_read and flag != "WRITE":
                 print("----------------------")
                 print("--- WRITE functions ---")
                 flag = "WRITE"
@@ -60,46 +56,31 @@ def run_smart_contract_tx(source, to_address, **pparams):
             if len(f.abi["inputs"]) == 0:
                 param_string = ""
             print(
-                i,
+                f.position,
                 " - ",
                 f.name,
                 "( ",
                 param_string,
                 " )",
                 " - ",
-                f.abi["stateMutability"],
+                f.mutability,
             )
-            i += 1
         print("----------------------")
 
     # Select function and then enter parameter values for the selected function
     while True:
         # INPUT FUNCTION NAME
-        func_choice = None
-        while func_choice is None:
+        chosen_entry = None
+        while chosen_entry is None:
             func_choice = pparams.get("func_choice", False) or input(
                 "Choose function you want to execute (you can either numerical index or function name): "
             )
             try:
-                func_choice = int(func_choice)
-                chosen_func = funcs[func_choice - 1]
-            except Exception as e1:
-                try:
-                    matched_funcs = list(i for i, f in enumerate(funcs) if f.name == func_choice)
-                    if not matched_funcs:
-                        raise ValueError("There are not matching entries for your choice.")
-                    chosen_func = funcs[matched_funcs[0]]
-
-                    # Sometimes, two functions are matched. In this case, choose funciton with more parameters.
-                    # Typically, function with less parameters would require a raw byte input, which is less preferred for the end user.
-                    if len(matched_funcs) > 1:
-                        chosen_func2 = funcs[matched_funcs[1]]
-                        if len(chosen_func2.abi["inputs"]) > len(chosen_func.abi["inputs"]):
-                            chosen_func = chosen_func2
-
-                except Exception as e2:
-                    print(f"Your entry is incorrect. Here is the excpetion thrown: {e2}")
-                    func_choice = None
+                # by position or name, overloads with more parameters preferred (see FunctionTable.choose)
+                chosen_entry = funcs.choose(func_choice)
+            except ValueError as e:
+                print(f"Your entry is incorrect. Here is the excpetion thrown: {e}")
+        chosen_func = contract.functions[chosen_entry.signature]
 
         print(f"You have chosen **{chosen_func.name}** function")
 
@@ -128,7 +109,7 @@ def run_smart_contract_tx(source, to_address, **pparams):
 
         chosen_params = tuple(chosen_params)
 
-        if chosen_func.abi["stateMutability"] in ("view", "pure"):
+        if chosen_entry.is_read:
             print("Since this function is READ, it can be just executed without a transaction. Executing... See result below.")
             if len(chosen_params) == 0:
                 print(chosen_func.call())
@@ -198,6 +179,7 @@ def run_observer(**kwargs):
     if kwargs:
         pparams = prep_autocomplete_from_kwargs(**kwargs)
 
+    warm_up()
     print("Choose desired blockchain for transaction: ")
     # include eth_tester provider regardless of the mode selected
     supported_chains = [key for key in config.chains.keys() if config.chains[key].get("debug", False) in {config.DEBUG, True}]
@@ -254,6 +236,8 @@ def run_observer(**kwargs):
 
     print("Your transaction is ready: ")
     print(tx)
+    if config.verbose:
+        print(formatCacheStats())
     # Save cache on disk
     if not config.DEBUG:
         persist_cache()
@@ -263,6 +247,7 @@ def run_observer(**kwargs):
 
 def main():
     # TODO: add parsing of sys.argv parameters if passed. Do not redirect stdin due to interactive mode required cross-platform.
+    handleStatsFlag()  # --stats prints network call summary at exit
     run_observer()
 
 
@@ -0,0 +1,92 @@
+"""
+Fills the cache with ABIs, proxy implementations and ERC20 token metadata of all contracts in chains.yaml, so that later runs
+do not wait for Etherscan. Contracts of all chains are resolved concurrently, within Etherscan's rate limit.
+
+    w3off cache warm [chain ...] [--rate REQUESTS_PER_SECOND]
+"""
+
+import asyncio
+import sys
+
+import w3off.config as config
+from w3off.observer.asyncEngine import AsyncEngine
+from w3off.observer.cache import persist_cache
+from w3off.observer.etherscan import TokenBucket
+
+LOCAL_CHAINS = ("debug",)  # EthereumTester, nothing to fetch
+
+
+def warmTargets(chain_names: list = None):
+    """(chain name, contract) of every contract with an address in chains.yaml (of `chain_names` only, if given)."""
+    targets = []
+    for chain_name, chain in config.chains.items():
+        if chain_name in LOCAL_CHAINS or (chain_names and chain_name not in chain_names):
+            continue
+        for contract in (chain.get("smart_contracts") or {}).values():
+            if contract and contract.get("address"):
+                targets.append((chain_name, contract))
+    return targets
+
+
+async def warmContract(engine: AsyncEngine, contract: dict):
+    """Resolves proxy and ABI of the contract (and token metadata of ERC20 tokens, if the chain has an RPC provider). Returns a summary."""
+    abi, implementation = await engine.resolveABI(contract["address"])
+    result = {"name": contract["name"], "address": contract["address"], "implementation": implementation, "token": None}
+    if contract.get("type") == "ERC20" and engine.w3 is not None:
+        result["token"] = await engine.tokenInfo(contract["address"], abi)
+    return result
+
+
+async def warmCache(chain_names: list = None, rate: float = None):
+    """
+    Warms the cache for all contracts of `chain_names` (all chains by default) and saves it. Etherscan requests are sent at
+    `rate` per second (config.etherscan_rate_limit by default).
+
+    Returns:
+        list: (chain name, contract summary or exception) for every contract
+    """
+    targets = warmTargets(chain_names)
+    rate_limiter = TokenBucket(rate) if rate else None  # shared by all chains (Etherscan limits the API key), the client's one by default
+    engines = {chain_name: AsyncEngine(chain_name, rate_limiter) for chain_name in dict.fromkeys(chain_name for chain_name, _ in targets)}
+    try:
+        results = await asyncio.gather(*(warmContract(engines[chain_name], contract) for chain_name, contract in targets), return_exceptions=True)
+    finally:
+        await asyncio.gather(*(engine.close() for engine in engines.values()))
+        persist_cache()
+    return [(chain_name, result) for (chain_name, _), result in zip(targets, results)]
+
+
+def main(argv: list = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "warm":
+        print(__doc__)
+        return 1
+    args, rate = argv[1:], None
+    if "--rate" in args:
+        i = args.index("--rate")
+        rate = float(args[i + 1])
+        del args[i : i + 2]
+    unknown = [chain_name for chain_name in args if chain_name not in config.chains]
+    if unknown:
+        print(f"Unknown chains: {', '.join(unknown)}. Available chains: {', '.join(config.chains)}")
+        return 1
+    if config.DEBUG:
+        print("Cache warm-up is not available in DEBUG mode, contract addresses point to the local EthereumTester.")
+        return 1
+
+    results = asyncio.run(warmCache(args, rate))
+    failed = 0
+    for chain_name, result in results:
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"[{chain_name}] FAILED: {result!r}")
+            continue
+        proxy = f" -> implementation {result['implementation']}" if result["implementation"] != result["address"] else ""
+        token = f" ({result['token']['symbol']}, {result['token']['decimals']} decimals)" if result["token"] else ""
+        print(f"[{chain_name}] {result['name']} {result['address']}{proxy}{token}")
+    print(f"Cache is warm: {len(results) - failed} of {len(results)} contracts resolved.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
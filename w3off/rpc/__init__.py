@@ -0,0 +1,5 @@
+from w3off.rpc.failoverProvider import AsyncFailoverHTTPProvider, FailoverHTTPProvider
+from w3off.rpc.batchReads import batchRead, supportsBatching
+from w3off.rpc.recordReplay import Fixture, ReplayProvider, startRecording, startReplay, stopRecording, stopReplay
+from w3off.rpc.stats import formatStats, getStats, handleStatsFlag, resetStats
+from w3off.rpc.responseCache import ResponseCacheMiddleware, formatCacheStats, getCacheStats, resetCacheStats
@@ -0,0 +1,56 @@
+import requests
+from web3 import Web3
+from web3.exceptions import BadResponseFormat, MethodUnavailable, Web3RPCError
+from web3.providers.base import JSONBaseProvider
+
+INVALID_REQUEST = -32600  # JSON-RPC error code of nodes which do not accept a batch as a request
+
+
+def supportsBatching(w3: Web3):
+    """True if the provider can send several JSON-RPC requests in one batch (e.g. HTTP providers, but not EthereumTester)."""
+    provider = w3.provider
+    return isinstance(provider, JSONBaseProvider) and type(provider).make_batch_request is not JSONBaseProvider.make_batch_request
+
+
+def batchUnsupported(error: Exception):
+    """
+    True if `error` of a batch means that the node does not accept batches (rejected over HTTP, e.g. 400 or 413, answered with
+    a single invalid request error or a response which is not a list, or with method not found), not that one of its calls failed.
+    """
+    if isinstance(error, (requests.HTTPError, BadResponseFormat, MethodUnavailable)):
+        return True
+    return isinstance(error, Web3RPCError) and isinstance(error.rpc_response, dict) and (error.rpc_response.get("error") or {}).get("code") == INVALID_REQUEST
+
+
+def batchRead(w3: Web3, calls: dict, optional: tuple = ()):
+    """
+    Executes independent read calls in one JSON-RPC batch (a single round trip) if the provider supports it, and one by one otherwise.
+
+    Args:
+        calls (dict): name -> callable without arguments doing one web3 call, e.g. {"nonce": lambda: w3.eth.get_transaction_count(address)}
+        optional (tuple): names of calls which resolve to None if they fail instead of raising an exception.
+
+    Returns:
+        dict: name -> result of the call.
+    """
+    if len(calls) > 1 and supportsBatching(w3):
+        try:
+            with w3.batch_requests() as batch:
+                for call in calls.values():
+                    batch.add(call())
+                responses = batch.execute()
+            return dict(zip(calls.keys(), responses))
+        except Exception as e:
+            # Falls back to one by one if the node does not support batching, or to find out which of the optional calls failed
+            if not (batchUnsupported(e) or optional):
+                raise
+
+    results = {}
+    for name, call in calls.items():
+        try:
+            results[name] = call()
+        except Exception:
+            if name not in optional:
+                raise
+            results[name] = None
+    return results
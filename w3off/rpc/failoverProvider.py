@@ -0,0 +1,226 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from web3.providers import AsyncHTTPProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.providers.base import JSONBaseProvider
+
+from w3off.rpc.stats import endpointName, recordBatch, recordCall
+
+# Responses with these HTTP codes mean "try another node" (rate limited or node is unhealthy)
+FAILOVER_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class _FailoverStatus(requests.HTTPError):
+    """Response with one of FAILOVER_STATUS_CODES. Other HTTP errors (e.g. 401 bad API key, 413 batch too large) would fail on every node, so they do not fail over."""
+
+
+FAILOVER_ERRORS = (requests.Timeout, requests.ConnectionError, _FailoverStatus)
+ASYNC_FAILOVER_ERRORS = (asyncio.TimeoutError, aiohttp.ClientConnectionError)  # and aiohttp.ClientResponseError with FAILOVER_STATUS_CODES
+
+# These methods change state, so we never send them to two nodes at the same time
+NON_HEDGED_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+
+
+class _EndpointRotation:
+    """Ordered endpoints (`endpoint_uris`), of which the failed ones are put on cooldown for `cooldown` seconds."""
+
+    def _init_rotation(self, endpoint_uris: list, cooldown: float):
+        assert endpoint_uris, "At least one RPC endpoint is required"
+        self.endpoint_uris = list(endpoint_uris)
+        self.cooldown = cooldown
+        self._failed_until = {}
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint_uri(self):
+        """Endpoint which the next request will be sent to."""
+        return self._ordered_endpoints()[0]
+
+    def _ordered_endpoints(self):
+        """Healthy endpoints in the configured order, followed by the ones on cooldown (as a last resort)."""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [uri for uri in self.endpoint_uris if self._failed_until.get(uri, 0) <= now]
+            cooling = sorted((uri for uri in self.endpoint_uris if uri not in healthy), key=lambda uri: self._failed_until[uri])
+        return healthy + cooling
+
+    def _mark_failed(self, uri):
+        with self._lock:
+            self._failed_until[uri] = time.monotonic() + self.cooldown
+
+
+class FailoverHTTPProvider(_EndpointRotation, JSONBaseProvider):
+    """
+    JSON-RPC provider over an ordered list of HTTP endpoints (primary first, then fallbacks).
+
+    Each endpoint keeps its own keep-alive session with a tuned connection pool. A request goes to the first healthy endpoint
+    and fails over to the next one on timeouts, connection errors, 429 and 5xx responses. Failed endpoints are put on cooldown.
+    Read requests which are not answered within `hedge_after` seconds are also sent to the next endpoint, and the first answer wins.
+    """
+
+    def __init__(
+        self,
+        endpoint_uris: list,
+        request_timeout: float = 10,
+        hedge_after: float = None,
+        cooldown: float = 30,
+        pool_maxsize: int = 10,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._init_rotation(endpoint_uris, cooldown)
+        self.request_timeout = request_timeout
+        self.hedge_after = hedge_after
+        self.pool_maxsize = pool_maxsize
+
+        self._sessions = {uri: self._make_session() for uri in self.endpoint_uris}
+        self._executor = None
+
+    def __str__(self):
+        return f"RPC connection {self.endpoint_uri} (+{len(self.endpoint_uris) - 1} fallbacks)"
+
+    def _make_session(self):
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"Content-Type": "application/json", "User-Agent": "w3off"})
+        return session
+
+    def _post(self, uri, request_data: bytes, method: str = "", batch_methods: tuple = ()) -> bytes:
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self._sessions[uri].post(uri, data=request_data, timeout=self.request_timeout)
+            if response.status_code in FAILOVER_STATUS_CODES:
+                raise _FailoverStatus(f"{response.status_code} response from {uri}", response=response)
+            response.raise_for_status()
+            return response.content
+        finally:
+            ok = response is not None and response.ok
+            received = len(response.content) if response is not None else 0
+            if batch_methods:
+                recordBatch("rpc", endpointName(uri), batch_methods, time.perf_counter() - start, len(request_data), received, error=not ok)
+            else:
+                recordCall("rpc", endpointName(uri), method, time.perf_counter() - start, len(request_data), received, error=not ok)
+
+    def _send(self, method, request_data: bytes, batch_methods: tuple = ()) -> bytes:
+        endpoints = self._ordered_endpoints()
+        hedged = method not in NON_HEDGED_METHODS and NON_HEDGED_METHODS.isdisjoint(batch_methods)
+        if self.hedge_after and len(endpoints) > 1 and hedged:
+            return self._send_hedged(method, request_data, endpoints, batch_methods)
+
+        error = None
+        for uri in endpoints:
+            try:
+                return self._post(uri, request_data, method, batch_methods)
+            except FAILOVER_ERRORS as e:
+                self._mark_failed(uri)
+                error = e
+        raise error
+
+    def _send_hedged(self, method, request_data: bytes, endpoints: list, batch_methods: tuple = ()) -> bytes:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.endpoint_uris), thread_name_prefix="w3off-rpc")
+        queue = list(endpoints)
+        pending = {}
+        error = None
+        while pending or queue:
+            if not pending:
+                uri = queue.pop(0)
+                pending[self._executor.submit(self._post, uri, request_data, method, batch_methods)] = uri
+            done, _ = wait(pending, timeout=self.hedge_after if queue else None, return_when=FIRST_COMPLETED)
+            if not done:
+                # Slow endpoint: hedge the same request to the next one, whichever answers first wins
+                uri = queue.pop(0)
+                pending[self._executor.submit(self._post, uri, request_data, method, batch_methods)] = uri
+                continue
+            for future in done:
+                uri = pending.pop(future)
+                try:
+                    return future.result()
+                except FAILOVER_ERRORS as e:
+                    self._mark_failed(uri)
+                    error = e
+        raise error
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        raw_response = self._send(method, request_data)
+        return self.decode_rpc_response(raw_response)
+
+    def make_batch_request(self, batch_requests):
+        request_data = self.encode_batch_rpc_request(batch_requests)
+        raw_response = self._send("batch", request_data, tuple(method for method, _ in batch_requests))
+        response = self.decode_rpc_response(raw_response)
+        if not isinstance(response, list):
+            # RPC errors return only one response with the error object
+            return response
+        return sorted(response, key=lambda r: r.get("id", 0))
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class AsyncFailoverHTTPProvider(_EndpointRotation, AsyncJSONBaseProvider):
+    """
+    Asyncio counterpart of FailoverHTTPProvider over an AsyncHTTPProvider per endpoint: a request goes to the first healthy
+    endpoint and fails over to the next one on timeouts, connection errors, 429 and 5xx responses (without hedging).
+    """
+
+    def __init__(self, endpoint_uris: list, request_timeout: float = 10, cooldown: float = 30, **kwargs):
+        super().__init__(**kwargs)
+        self._init_rotation(endpoint_uris, cooldown)
+        self.request_timeout = request_timeout
+        # Retries of AsyncHTTPProvider are off, the next endpoint is tried instead
+        self._providers = {
+            uri: AsyncHTTPProvider(uri, request_kwargs={"timeout": request_timeout}, exception_retry_configuration=None) for uri in self.endpoint_uris
+        }
+
+    def __str__(self):
+        return f"Async RPC connection {self.endpoint_uri} (+{len(self.endpoint_uris) - 1} fallbacks)"
+
+    async def _send(self, method: str, send):
+        """Result of `send(provider)` from the first endpoint which answers."""
+        error = None
+        for uri in self._ordered_endpoints():
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = await send(self._providers[uri])
+                ok = True
+                return result
+            except aiohttp.ClientResponseError as e:
+                if e.status not in FAILOVER_STATUS_CODES:
+                    raise
+                self._mark_failed(uri)
+                error = e
+            except ASYNC_FAILOVER_ERRORS as e:
+                self._mark_failed(uri)
+                error = e
+            finally:
+                recordCall("rpc", endpointName(uri), method, time.perf_counter() - start, error=not ok)
+        raise error
+
+    async def make_request(self, method, params):
+        return await self._send(method, lambda provider: provider.make_request(method, params))
+
+    async def make_batch_request(self, batch_requests):
+        return await self._send("batch", lambda provider: provider.make_batch_request(batch_requests))
+
+    async def is_connected(self, show_traceback: bool = False) -> bool:
+        return await self._providers[self.endpoint_uri].is_connected(show_traceback)
+
+    async def disconnect(self):
+        for provider in self._providers.values():
+            await provider.disconnect()
@@ -0,0 +1,175 @@
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+from web3.middleware import Web3Middleware
+from web3.providers.base import JSONBaseProvider
+
+from w3off.rpc.stats import recordBatch, recordCall
+
+recording = None  # Fixture which records JSON-RPC and Etherscan exchanges, if any (see startRecording)
+replaying = None  # Fixture which answers Etherscan requests, if any (see startReplay)
+
+
+def _rpcKey(method, params):
+    return json.dumps([method, params], sort_keys=True, default=str)
+
+
+def _etherscanKey(url: str):
+    """Etherscan URL without the API key (fixtures should be safe to share)."""
+    return re.sub(r"&?apikey=[^&]*", "", url)
+
+
+class Fixture:
+    """
+    Recorded JSON-RPC and Etherscan exchanges. The same request may be recorded several times with different answers
+    (e.g. a receipt which is None first and then mined); replay returns them in order and then keeps returning the last one.
+    """
+
+    def __init__(self, rpc: dict = None, etherscan: dict = None, latency: float = 0):
+        self.rpc = rpc or {}  # rpc key -> list of responses
+        self.etherscan = etherscan or {}  # url without api key -> list of {"status_code": ..., "body": ...}
+        self.latency = latency  # seconds added to every replayed request (or batch)
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, latency: float = 0):
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(data.get("rpc"), data.get("etherscan"), latency)
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"rpc": self.rpc, "etherscan": self.etherscan}, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def _next(self, entries: list, key):
+        with self._lock:
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+        return entries[min(position, len(entries) - 1)]
+
+    def recordRpc(self, method, params, response):
+        response = {k: v for k, v in response.items() if k != "id"}
+        with self._lock:
+            self.rpc.setdefault(_rpcKey(method, params), []).append(response)
+
+    def rpcResponse(self, method, params, request_id=0):
+        key = _rpcKey(method, params)
+        entries = self.rpc.get(key)
+        if not entries:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32000, "message": f"Not recorded in fixture: {key}"}}
+        return {"jsonrpc": "2.0", **self._next(entries, ("rpc", key)), "id": request_id}
+
+    def recordEtherscan(self, url: str, response: requests.Response):
+        with self._lock:
+            self.etherscan.setdefault(_etherscanKey(url), []).append({"status_code": response.status_code, "body": response.text})
+
+    def etherscanResponse(self, url: str, wait: bool = True) -> requests.Response:
+        """Recorded response to Etherscan request. Pass `wait=False` to inject the latency yourself (e.g. in asyncio code)."""
+        key = _etherscanKey(url)
+        entries = self.etherscan.get(key)
+        assert entries, f"Etherscan request is not recorded in fixture: {key}"
+        entry = self._next(entries, ("etherscan", key))
+        if wait:
+            time.sleep(self.latency)
+        response = requests.Response()
+        response.status_code = entry["status_code"]
+        response._content = entry["body"].encode()
+        response.url = url
+        return response
+
+
+class RecordingMiddleware(Web3Middleware):
+    """
+    Records every request and raw response of the provider into the `recording` fixture. Injected as the innermost middleware
+    (see startRecording), so it works with any provider, including EthereumTester.
+    """
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            response = make_request(method, params)
+            if recording is not None and isinstance(response, dict):
+                recording.recordRpc(method, params, response)
+            return response
+
+        return middleware
+
+    def wrap_make_batch_request(self, make_batch_request):
+        def middleware(requests_info):
+            responses = make_batch_request(requests_info)
+            if recording is not None and isinstance(responses, list):
+                for (method, params), response in zip(requests_info, responses):
+                    recording.recordRpc(method, params, response)
+            return responses
+
+        return middleware
+
+
+class ReplayProvider(JSONBaseProvider):
+    """Offline provider which answers from a recorded fixture, with `fixture.latency` seconds of injected latency per request."""
+
+    def __init__(self, fixture: Fixture, **kwargs):
+        super().__init__(**kwargs)
+        self.fixture = fixture
+        self.endpoint_uri = "replay"
+
+    def __str__(self):
+        return f"Replay of recorded RPC responses (+{self.fixture.latency}s latency)"
+
+    def make_request(self, method, params):
+        time.sleep(self.fixture.latency)
+        recordCall("rpc", self.endpoint_uri, method, self.fixture.latency)
+        return self.fixture.rpcResponse(method, params, next(self.request_counter))
+
+    def make_batch_request(self, batch_requests):
+        time.sleep(self.fixture.latency)  # one round trip for the whole batch
+        recordBatch("rpc", self.endpoint_uri, [method for method, _ in batch_requests], self.fixture.latency)
+        return [self.fixture.rpcResponse(method, params, next(self.request_counter)) for method, params in batch_requests]
+
+    def is_connected(self, show_traceback: bool = False):
+        return True
+
+
+def startRecording(w3, fixture: Fixture = None):
+    """Starts recording JSON-RPC requests of `w3` and Etherscan requests. Returns the fixture being recorded."""
+    global recording
+    recording = fixture or Fixture()
+    if "recorder" not in w3.middleware_onion:
+        w3.middleware_onion.inject(RecordingMiddleware, "recorder", layer=0)
+    return recording
+
+
+def stopRecording(w3, path: str = None):
+    """Stops recording and saves the fixture to `path` (if given). Returns the fixture."""
+    global recording
+    fixture, recording = recording, None
+    if "recorder" in w3.middleware_onion:
+        w3.middleware_onion.remove("recorder")
+    if path and fixture is not None:
+        fixture.save(path)
+    return fixture
+
+
+def startReplay(fixture, latency: float = None):
+    """
+    Starts replaying Etherscan requests from `fixture` (Fixture or path). Returns ReplayProvider to be used as the provider of `w3`
+    (see w3provider.use_provider).
+    """
+    global replaying
+    if not isinstance(fixture, Fixture):
+        fixture = Fixture.load(fixture)
+    if latency is not None:
+        fixture.latency = latency
+    replaying = fixture
+    return ReplayProvider(fixture)
+
+
+def stopReplay():
+    global replaying
+    replaying = None
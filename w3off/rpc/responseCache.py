@@ -0,0 +1,285 @@
+import copy
+import threading
+import time
+import weakref
+
+import requests
+from web3.middleware import Web3Middleware
+
+from w3off.rpc.batchReads import supportsBatching
+from w3off.rpc.failoverProvider import FAILOVER_STATUS_CODES
+
+# Cache policies
+IMMUTABLE = "immutable"  # cached forever (per provider)
+BLOCK_SCOPED = "block"  # cached until a new head is seen
+NEVER = "never"
+
+IMMUTABLE_METHODS = {"eth_chainId", "net_version"}
+BLOCK_SCOPED_METHODS = {
+    "eth_blockNumber",
+    "eth_gasPrice",
+    "eth_maxPriorityFeePerGas",
+    "eth_feeHistory",
+    "eth_getBlockByNumber",
+    "eth_getCode",
+    "eth_getStorageAt",
+    "eth_getBalance",
+    "eth_getTransactionCount",
+    "eth_call",
+    "eth_estimateGas",
+}
+# Position of the block identifier in params. Results at a block deep enough below the head (or at a block hash) never change.
+BLOCK_PARAM_INDEX = {
+    "eth_getBlockByNumber": 0,
+    "eth_feeHistory": 1,
+    "eth_getCode": 1,
+    "eth_getBalance": 1,
+    "eth_getTransactionCount": 1,
+    "eth_call": 1,
+    "eth_estimateGas": 1,
+    "eth_getStorageAt": 2,
+}
+# Sending a transaction changes nonces, balances etc., so block-scoped results are dropped right away
+STATE_CHANGING_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+
+FINALITY_DEPTH = 64  # blocks below the head which we consider final (no reorgs)
+HEAD_CHECK_INTERVAL = 1  # seconds during which the known head is trusted without asking the node again
+
+cache_stats = {"hits": 0, "misses": 0, "methods": {}}
+_stats_lock = threading.Lock()
+
+
+def _record(method, hit: bool):
+    with _stats_lock:
+        key = "hits" if hit else "misses"
+        cache_stats[key] += 1
+        method_stats = cache_stats["methods"].setdefault(method, {"hits": 0, "misses": 0})
+        method_stats[key] += 1
+
+
+def getCacheStats():
+    """Hit and miss counts of the RPC response cache (total and per method). Every hit is a request not sent to the node."""
+    with _stats_lock:
+        return copy.deepcopy(cache_stats)
+
+
+def resetCacheStats():
+    with _stats_lock:
+        cache_stats.update({"hits": 0, "misses": 0, "methods": {}})
+
+
+def formatCacheStats():
+    stats = getCacheStats()
+    return f"RPC cache: {stats['hits']} hits / {stats['misses']} misses ({stats['hits']} requests saved)"
+
+
+def _freeze(value):
+    """Hashable version of JSON-RPC params."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _is_cacheable(response):
+    return isinstance(response, dict) and "error" not in response and response.get("result") is not None
+
+
+def cachePolicy(method, params, head: int = None):
+    """Which policy (IMMUTABLE, BLOCK_SCOPED or NEVER) applies to a request. `head` is the latest known block number, if any."""
+    if method in IMMUTABLE_METHODS:
+        return IMMUTABLE
+    if method not in BLOCK_SCOPED_METHODS:
+        return NEVER
+    index = BLOCK_PARAM_INDEX.get(method)
+    block = params[index] if index is not None and len(params) > index else "latest"
+    if block == "pending":
+        return NEVER  # depends on the mempool, which changes between blocks
+    if isinstance(block, dict) or (isinstance(block, str) and len(block) == 66):
+        return IMMUTABLE  # block hash (EIP-1898)
+    if isinstance(block, str) and block.startswith("0x"):
+        block = int(block, 16)
+    if isinstance(block, int) and head is not None and head - block >= FINALITY_DEPTH:
+        return IMMUTABLE
+    return BLOCK_SCOPED
+
+
+class ResponseStore:
+    """Cached responses of one provider (i.e. one chain)."""
+
+    def __init__(self):
+        self.immutable = {}  # key -> response
+        self.block_scoped = {}  # key -> (head, response)
+        self.head = None
+        self.head_checked_at = 0
+        self.batching = True  # False once the node rejected a batch, then the head is asked for on its own
+        self.lock = threading.Lock()
+
+    def head_is_fresh(self):
+        return self.head is not None and time.monotonic() - self.head_checked_at < HEAD_CHECK_INTERVAL
+
+    def set_head(self, head: int):
+        with self.lock:
+            if head != self.head:
+                self.block_scoped.clear()  # new head: everything cached for the previous one is outdated
+            self.head = head
+            self.head_checked_at = time.monotonic()
+
+    def invalidate(self):
+        with self.lock:
+            self.block_scoped.clear()
+            self.head_checked_at = 0
+
+    def get(self, policy, key):
+        with self.lock:
+            if policy == IMMUTABLE:
+                return self.immutable.get(key)
+            entry = self.block_scoped.get(key)
+        if entry and entry[0] == self.head and self.head_is_fresh():
+            return entry[1]
+        return None
+
+    def put(self, policy, key, response):
+        with self.lock:
+            if policy == IMMUTABLE:
+                self.immutable[key] = response
+            elif self.head_is_fresh():
+                self.block_scoped[key] = (self.head, response)
+
+    def observe(self, method, params, response):
+        """Learns the head from responses which carry it anyway, so that no extra request is needed."""
+        if not _is_cacheable(response):
+            return
+        if method == "eth_blockNumber":
+            self.set_head(int(response["result"], 16))
+        elif method == "eth_getBlockByNumber" and params and params[0] == "latest":
+            self.set_head(int(response["result"]["number"], 16))
+
+
+stores = weakref.WeakKeyDictionary()  # provider -> ResponseStore
+_stores_lock = threading.Lock()
+
+
+def clearResponseCache():
+    with _stores_lock:
+        stores.clear()
+
+
+class ResponseCacheMiddleware(Web3Middleware):
+    """
+    Caches JSON-RPC responses per provider. Immutable results (chain id, code at a block hash or a final block) are kept forever,
+    results at the latest block are kept until a new head is seen, and state-changing calls are never cached.
+    Should be the innermost middleware, so that it caches raw node responses (see initialize_provider).
+    EthereumTester is not cached, since tests mine blocks and move time on their own.
+    """
+
+    def _store(self):
+        provider = self._w3.provider
+        if hasattr(provider, "ethereum_tester"):
+            return None
+        with _stores_lock:
+            if provider not in stores:
+                stores[provider] = ResponseStore()
+            return stores[provider]
+
+    def _lookup(self, store, method, params):
+        """Returns (policy, key, cached response or None)."""
+        policy = cachePolicy(method, params, store.head)
+        if method == "eth_blockNumber":
+            # The head itself is only trusted for a short time, then the node is asked again
+            fresh = store.head_is_fresh()
+            _record(method, fresh)
+            if fresh:
+                return policy, None, {"jsonrpc": "2.0", "id": 0, "result": hex(store.head)}
+            return NEVER, None, None
+        if policy == NEVER:
+            return policy, None, None
+        key = (method, _freeze(params))
+        response = store.get(policy, key)
+        _record(method, response is not None)
+        return policy, key, copy.deepcopy(response)
+
+    def _store_response(self, store, policy, key, method, params, response):
+        store.observe(method, params, response)
+        if method in STATE_CHANGING_METHODS:
+            store.invalidate()
+        elif policy != NEVER and key is not None and _is_cacheable(response):
+            store.put(policy, key, copy.deepcopy(response))
+
+    def _send_with_head(self, store, method, params):
+        """
+        Response to the request, sent in a batch with eth_blockNumber so that it can be tied to the head. None if the node does
+        not accept batches (then store.batching is turned off).
+        """
+        try:
+            responses = self._w3.provider.make_batch_request([(method, params), ("eth_blockNumber", [])])
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code in FAILOVER_STATUS_CODES:
+                raise  # node is down or rate limited, not a rejected batch
+            responses = None
+        if not (isinstance(responses, list) and len(responses) == 2):
+            store.batching = False
+            return None
+        store.observe("eth_blockNumber", [], responses[1])
+        return responses[0]
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            store = self._store()
+            if store is None:
+                return make_request(method, params)
+            policy, key, cached = self._lookup(store, method, params)
+            if cached is not None:
+                return cached
+
+            response = None
+            if policy == BLOCK_SCOPED and not store.head_is_fresh() and supportsBatching(self._w3):
+                if store.batching:
+                    response = self._send_with_head(store, method, params)
+                if not store.batching:
+                    # Head is refreshed on its own (at most once per HEAD_CHECK_INTERVAL), so that cached responses can be used
+                    store.observe("eth_blockNumber", [], make_request("eth_blockNumber", []))
+                    cached = store.get(policy, key)
+                    if cached is not None:
+                        return copy.deepcopy(cached)
+            if response is None:
+                response = make_request(method, params)
+            self._store_response(store, policy, key, method, params, response)
+            return response
+
+        return middleware
+
+    def wrap_make_batch_request(self, make_batch_request):
+        def middleware(requests_info):
+            store = self._store()
+            if store is None:
+                return make_batch_request(requests_info)
+
+            results = [None] * len(requests_info)
+            misses = []  # (position, method, params, policy, key)
+            for i, (method, params) in enumerate(requests_info):
+                policy, key, cached = self._lookup(store, method, params)
+                if cached is not None:
+                    results[i] = cached
+                else:
+                    misses.append((i, method, params, policy, key))
+            if not misses:
+                return results
+
+            to_send = [(method, params) for _, method, params, _, _ in misses]
+            with_head = any(policy == BLOCK_SCOPED for *_, policy, _ in misses) and not store.head_is_fresh()
+            if with_head:
+                to_send.append(("eth_blockNumber", []))
+            responses = make_batch_request(to_send)
+            if not isinstance(responses, list):
+                return responses  # error of the whole batch
+            if with_head:
+                store.observe("eth_blockNumber", [], responses.pop())
+
+            for (i, method, params, policy, key), response in zip(misses, responses):
+                self._store_response(store, policy, key, method, params, response)
+                results[i] = response
+            return results
+
+        return middleware
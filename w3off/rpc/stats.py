@@ -0,0 +1,113 @@
+import atexit
+import sys
+import threading
+from urllib.parse import urlsplit
+
+# Upper bounds (in seconds) of latency histogram buckets, the last bucket counts everything slower
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+call_stats = {}  # (kind, endpoint, method) -> stats dict, see recordCall
+_lock = threading.Lock()
+_print_at_exit = False
+
+
+def endpointName(uri: str):
+    """Host of an endpoint URL. Paths are dropped, since they often contain API keys."""
+    return urlsplit(uri).netloc or uri
+
+
+def recordCall(kind: str, endpoint: str, method: str, latency: float, bytes_sent: int = 0, bytes_received: int = 0, error: bool = False):
+    """
+    Records one network call.
+
+    Args:
+        kind (str): "rpc" or "etherscan"
+        endpoint (str): host which was called (see endpointName)
+        method (str): JSON-RPC method ("batch" for the round trip of a batch, see recordBatch) or Etherscan module.action
+        latency (float): seconds
+    """
+    bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))
+    with _lock:
+        stats = call_stats.get((kind, endpoint, method))
+        if stats is None:
+            stats = call_stats[(kind, endpoint, method)] = {
+                "count": 0,
+                "errors": 0,
+                "bytes_sent": 0,
+                "bytes_received": 0,
+                "total_latency": 0.0,
+                "max_latency": 0.0,
+                "histogram": [0] * (len(LATENCY_BUCKETS) + 1),
+            }
+        stats["count"] += 1
+        stats["errors"] += int(error)
+        stats["bytes_sent"] += bytes_sent
+        stats["bytes_received"] += bytes_received
+        stats["total_latency"] += latency
+        stats["max_latency"] = max(stats["max_latency"], latency)
+        stats["histogram"][bucket] += 1
+
+
+def recordBatch(kind: str, endpoint: str, methods: list, latency: float, bytes_sent: int = 0, bytes_received: int = 0, error: bool = False):
+    """
+    Records a batch of calls: its round trip as method "batch", and a call of each of its `methods`, which share the latency
+    and bytes of the batch evenly (so that per method rows add up to the batch).
+    """
+    recordCall(kind, endpoint, "batch", latency, bytes_sent, bytes_received, error)
+    share = max(len(methods), 1)
+    for method in methods:
+        recordCall(kind, endpoint, method, latency / share, bytes_sent // share, bytes_received // share, error)
+
+
+def getStats():
+    """Recorded calls as a list of dicts (kind, endpoint, method, count, errors, bytes, latencies and histogram), slowest in total first."""
+    with _lock:
+        rows = [{"kind": kind, "endpoint": endpoint, "method": method, **stats, "histogram": list(stats["histogram"])} for (kind, endpoint, method), stats in call_stats.items()]
+    for row in rows:
+        row["avg_latency"] = row["total_latency"] / row["count"]
+    return sorted(rows, key=lambda row: row["total_latency"], reverse=True)
+
+
+def resetStats():
+    with _lock:
+        call_stats.clear()
+
+
+def formatStats():
+    """Summary table of getStats() (latencies in ms)."""
+    from w3off.rpc.responseCache import formatCacheStats
+
+    rows = getStats()
+    if not rows:
+        return "No network calls recorded."
+    buckets = [f"<={int(bound * 1000)}" for bound in LATENCY_BUCKETS] + [f">{int(LATENCY_BUCKETS[-1] * 1000)}"]
+    lines = [
+        f"{'kind':<10}{'endpoint':<36}{'method':<34}{'count':>6}{'err':>5}{'sent':>9}{'recv':>10}{'avg':>8}{'max':>8}{'total':>9}  histogram ms ({' '.join(buckets)})"
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['kind']:<10}{row['endpoint'][:35]:<36}{row['method'][:33]:<34}{row['count']:>6}{row['errors']:>5}{row['bytes_sent']:>9}{row['bytes_received']:>10}"
+            f"{row['avg_latency'] * 1000:>8.1f}{row['max_latency'] * 1000:>8.1f}{row['total_latency'] * 1000:>9.1f}  {' '.join(str(n) for n in row['histogram'])}"
+        )
+    calls = [row for row in rows if row["method"] != "batch"]  # members of batches are counted in their own rows
+    lines.append(f"Total: {sum(row['count'] for row in calls)} calls in {sum(row['total_latency'] for row in calls):.3f}s. {formatCacheStats()}")
+    return "\n".join(lines)
+
+
+def printStats():
+    print("========== Network calls ==========")
+    print(formatStats())
+
+
+def handleStatsFlag(argv: list = None):
+    """Removes `--stats` from command line arguments and, if it was there, prints the network call summary at exit."""
+    global _print_at_exit
+    argv = sys.argv if argv is None else argv
+    if "--stats" not in argv:
+        return False
+    while "--stats" in argv:
+        argv.remove("--stats")
+    if not _print_at_exit:
+        _print_at_exit = True
+        atexit.register(printStats)
+    return True
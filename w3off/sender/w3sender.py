@@ -9,9 +9,10 @@ import w3off.config as config
 from w3off.config import getChainName
 from w3off.cli.helpers import bcolors
 from w3off.helpers.txHelpers import prepareDictToPrint
+from w3off.rpc import handleStatsFlag
 from w3off.signer.checkOffline import checkOffline
 
-from w3off.w3provider import w3
+from w3off.w3provider import w3, warm_up
 
 def sendRawTx(signed_tx: str):
     # raw_tx_str = signed_tx if isinstance(signed_tx, str) else signed_tx.get('raw_transaction')
@@ -60,6 +61,7 @@ def run_sender(signed_tx, **kwargs):
             print(f"{bcolors.UNDERLINE}You are offline!{bcolors.ENDC} Make sure you connect back to the Internet.")
             if kwargs.get("ignoreNetworkCheckPrompt", False) or cli_prompts.userNetworkCheck():
                 break
+        warm_up()
 
     if (not kwargs.get("ignoreTxConfirmation", False)) and (not cli_prompts.confirmSendRawTx(signed_tx)):
         print("Stopped the transaction sending. Please restart the program and try again.")
@@ -69,9 +71,9 @@ def run_sender(signed_tx, **kwargs):
     txHash = sendRawTx(signed_tx)
     print(f"Transaction has been sent: {'0x' + txHash.hex()}")
     if not config.DEBUG:
-        print(f"You check tx hash using the block scanner on the {getChainName(w3.eth.chain_id)} chain.")
+        print(f"You check tx hash using the block scanner on the {config.chain_name} chain.")
         try:
-            print(f"{config.chains[getChainName(w3.eth.chain_id)]['tx_url']}/tx/{'0x' + txHash.hex()}")
+            print(f"{config.chains[config.chain_name]['tx_url']}/tx/{'0x' + txHash.hex()}")
         except Exception as e:
             print("Could not build the URL to the transaction (it was likely not specified in chains.yml settings).")
 
@@ -85,12 +87,14 @@ def run_sender(signed_tx, **kwargs):
 
 
 def main(raw_tx_str: str = None):
+    handleStatsFlag()  # --stats prints network call summary at exit
     raw_tx_str = cli_prompts.getInitialStdinStr() if raw_tx_str is None else raw_tx_str
     signed_tx = parseRawTxFromStr(raw_tx_str)
     run_sender(signed_tx)
 
 
 if __name__ == "__main__":
+    handleStatsFlag()
     if len(sys.argv) > 1:
         main(sys.argv[1])
     else:
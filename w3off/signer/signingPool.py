@@ -0,0 +1,83 @@
+"""
+Signing of large batches of transactions on all cores. The pkey is handed to the worker processes in the vault's encrypted
+form (with the AES key of the session), decrypted only while a chunk of transactions is signed, and wiped when the
+workers and the batch end.
+"""
+
+import collections
+import itertools
+import multiprocessing.util
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from eth_account import Account
+
+import w3off.signer.vault as vault
+
+SIGNING_CHUNK_SIZE = 100  # transactions sent to a worker at once
+CHUNKS_IN_FLIGHT = 2  # per worker, so that workers never wait while only this many chunks are kept in memory
+
+_worker_key = None  # (encrypted pkey, AES key, iv) in a worker process, see _initWorker
+
+
+def _wipe(*buffers: bytearray):
+    for buffer in buffers:
+        buffer[:] = bytes(len(buffer))
+
+
+def _initWorker(encrypted_pkey: bytearray, key: bytearray, iv: bytearray):
+    global _worker_key
+    _worker_key = (encrypted_pkey, key, iv)
+    multiprocessing.util.Finalize(None, _wipe, args=_worker_key, exitpriority=100)  # run when the worker exits
+
+
+def _signChunk(txs: list):
+    encrypted_pkey, key, iv = _worker_key
+    pkey = vault.decrypt_str(bytes(encrypted_pkey), bytes(key), bytes(iv))
+    try:
+        return os.getpid(), [Account.sign_transaction(tx, pkey) for tx in txs]
+    finally:
+        del pkey
+
+
+def _chunks(txs, chunk_size: int):
+    txs = iter(txs)
+    while chunk := list(itertools.islice(txs, chunk_size)):
+        yield chunk
+
+
+def signTxsParallel(txs, workers: int = None, chunk_size: int = SIGNING_CHUNK_SIZE, progress=None):
+    """
+    Signs transactions (any iterable, read as the workers need more) with the pkey of the vault in `workers` processes
+    (one per CPU by default). Yields SignedTransaction in the order of `txs`. The vault keeps the pkey, see vault.clear_pkey.
+
+    Args:
+        progress (callable): called as progress(worker pid, signed by this worker, signed in total) after every chunk
+    """
+    assert vault.pkey is not None
+    workers = workers or os.cpu_count() or 1
+    key_material = (bytearray(vault.pkey), bytearray(vault._key), bytearray(vault._iv))
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=key_material)
+    try:
+        in_flight = collections.deque()
+        per_worker = collections.Counter()
+        signed = 0
+
+        def done(future):
+            nonlocal signed
+            pid, signed_txs = future.result()
+            per_worker[pid] += len(signed_txs)
+            signed += len(signed_txs)
+            if progress is not None:
+                progress(pid, per_worker[pid], signed)
+            return signed_txs
+
+        for chunk in _chunks(txs, chunk_size):
+            in_flight.append(executor.submit(_signChunk, chunk))
+            if len(in_flight) >= workers * CHUNKS_IN_FLIGHT:
+                yield from done(in_flight.popleft())
+        while in_flight:
+            yield from done(in_flight.popleft())
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        _wipe(*key_material)
@@ -41,6 +41,12 @@ def decrypt_pkey():
     pkey = decrypt_str(pkey)
 
 
+def clear_pkey():
+    """Removes the pkey from the vault, e.g. after the last signature of a batch."""
+    global pkey
+    pkey = None
+
+
 def generate_salt(length=32):
     """Generate a random salt."""
     return os.urandom(length)
@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+import contextlib
 import getpass
 import json
 import os
@@ -15,13 +16,19 @@ from w3off.helpers.txHelpers import decodeRawTx
 from eth_account.datastructures import SignedTransaction
 from pprint import pprint
 from w3off.signer.checkOffline import checkOffline
+from w3off.signer.signingPool import signTxsParallel
 
 
-def signTx(tx):
+def signTx(tx, keep_pkey: bool = False):
+    """Signs tx with the pkey of the vault, which is removed afterwards (unless `keep_pkey`, to sign more, it stays encrypted then)."""
     assert vault.pkey is not None
-    vault.decrypt_pkey()
-    raw_tx = w3.eth.account.sign_transaction(tx, vault.pkey)
-    del vault.pkey  # remove from memory right after signing
+    pkey = vault.decrypt_str(vault.pkey)  # decrypted only for this signature, the vault keeps the encrypted one
+    try:
+        raw_tx = w3.eth.account.sign_transaction(tx, pkey)
+    finally:
+        del pkey  # remove from memory right after signing
+        if not keep_pkey:
+            vault.clear_pkey()
     return raw_tx
 
 
@@ -45,31 +52,8 @@ def dictToSignedTx(signed_tx_dict: dict):
     )
 
 
-def run_signer(tx, **pparams):
-    """
-    Signs transaction and returns raw transactions. Ensures the operation is done fully offline.
-    Ensures private is not exposed to other modules and purged from memory as soon as possible.
-    Args:
-        ignoreNetworkCheckPrompt (bool): if True, will not prompt user
-        pkey (str): private key as a hex string
-        keystore_file (str): path to keystore file
-        keystore_pwd (str): keystore password
-
-    Returns:
-        raw_tx (AttributeDict):
-            Dictionary containing 'raw_transaction' key with a hex string, 'txHash' and signature keys 'r', 's', 'v'.
-            The output is ready to be consumed by sender module.
-    """
-    # print('Closing web3 connection if open...')
-    # for a in w3provider.session.adapters.values():
-    #     a.close()
-    #     a.poolmanager.clear()
-    #     for proxy in a.proxy_manager.values():
-    #         proxy.clear()
-    # w3provider.adapter.close()
-    # w3provider.session.close()
-
-    print("Proceeding to signing the transaction to generate a signed transaction...")
+def unlockKey(**pparams):
+    """Makes sure we are offline and loads the pkey to the vault (encrypted), prompting for it unless given in pparams (see run_signer)."""
     print("Checking if you are offline...")
     isOffline = checkOffline()
     while not isOffline:
@@ -90,7 +74,7 @@ def run_signer(tx, **pparams):
     while True:
         print("1 - Enter pkey securely in place")
         print("2 - Load pkey from keystore file")
-        chosen_pkey_mode = 1 if pparams.get("pkey", False) or (2 if pparams.get("keystore_file", False) else False) else False
+        chosen_pkey_mode = 1 if pparams.get("pkey", False) else (2 if pparams.get("keystore_file", False) else False)
         if chosen_pkey_mode:
             print(f"Your pre-selected choice: **{chosen_pkey_mode}**")
         # print('3 - Restore pkey from seed phrase (and optionally save in an encrypted keystore file)')
@@ -123,6 +107,34 @@ def run_signer(tx, **pparams):
             print("Please try again.")
             chosen_pkey_mode = None
 
+
+def run_signer(tx, **pparams):
+    """
+    Signs transaction and returns raw transactions. Ensures the operation is done fully offline.
+    Ensures private is not exposed to other modules and purged from memory as soon as possible.
+    Args:
+        ignoreNetworkCheckPrompt (bool): if True, will not prompt user
+        pkey (str): private key as a hex string
+        keystore_file (str): path to keystore file
+        keystore_pwd (str): keystore password
+
+    Returns:
+        raw_tx (AttributeDict):
+            Dictionary containing 'raw_transaction' key with a hex string, 'txHash' and signature keys 'r', 's', 'v'.
+            The output is ready to be consumed by sender module.
+    """
+    # print('Closing web3 connection if open...')
+    # for a in w3provider.session.adapters.values():
+    #     a.close()
+    #     a.poolmanager.clear()
+    #     for proxy in a.proxy_manager.values():
+    #         proxy.clear()
+    # w3provider.adapter.close()
+    # w3provider.session.close()
+
+    print("Proceeding to signing the transaction to generate a signed transaction...")
+    unlockKey(**pparams)
+
     signed_tx = signTx(tx)
 
     print("Your signed transaction (with signature r, s, v): ")
@@ -142,7 +154,73 @@ def parseTxFromStr(tx_str: str):
     return tx
 
 
+def _readTxs(input_file, input_path: str):
+    for line_number, line in enumerate(input_file, start=1):
+        if not line.strip():
+            continue
+        tx = parseTxFromStr(line)
+        if tx is None:
+            raise ValueError(f"Line {line_number} of {input_path} is not a transaction")
+        yield tx
+
+
+def run_batch_signer(input_path: str, output_path: str = None, workers: int = 1, **pparams):
+    """
+    Signs all transactions of a JSONL file (one transaction JSON per line) with one key unlock, and streams the signed ones
+    (see signedTxToDict) to `output_path` as JSONL, or to stdout (messages go to stderr then). The pkey stays encrypted in the
+    vault between signatures and is removed at the end. With `workers` > 1 (or 0 for one per CPU), transactions are signed
+    in that many processes (see signingPool), still written in input order. Accepts the same pparams as run_signer.
+
+    Returns:
+        int: number of signed transactions
+    """
+    output = open(output_path, "w") if output_path else sys.stdout
+    messages = contextlib.nullcontext() if output_path else contextlib.redirect_stdout(sys.stderr)
+    signed = 0
+    try:
+        with open(input_path) as input_file, messages:
+            print(f"Signing transactions of {input_path} with one key...")
+            unlockKey(**pparams)
+            txs = _readTxs(input_file, input_path)
+            if workers == 1:
+                signed_txs = (signTx(tx, keep_pkey=True) for tx in txs)
+            else:
+                progress = lambda pid, worker_signed, total: print(f"Worker {pid}: {worker_signed} signed ({total} in total)")
+                signed_txs = signTxsParallel(txs, workers or None, progress=progress)
+            # Closed right away if writing fails, so that the workers holding the key material are shut down before clear_pkey
+            with contextlib.closing(signed_txs):
+                for signed_tx in signed_txs:
+                    output.write(json.dumps(signedTxToDict(signed_tx)) + "\n")
+                    output.flush()
+                    signed += 1
+            print(f"Signed {signed} transactions{f' to {output_path}' if output_path else ''}.")
+    finally:
+        vault.clear_pkey()
+        if output_path:
+            output.close()
+    return signed
+
+
+BATCH_USAGE = "Usage: w3signer --batch UNSIGNED_TXS.jsonl [SIGNED_TXS.jsonl] [--workers N (0 for one per CPU)]"
+
+
+def main_batch(argv: list):
+    workers = 1
+    if "--workers" in argv:
+        i = argv.index("--workers")
+        value = argv[i + 1] if i + 1 < len(argv) else ""
+        workers = int(value) if value.isdigit() else None
+        argv = argv[:i] + argv[i + 2 :]
+    if workers is None or not 1 <= len(argv) <= 2:
+        print(BATCH_USAGE)
+        return 1
+    run_batch_signer(*argv, workers=workers)
+    return 0
+
+
 def main(tx_str: str = None):
+    if tx_str == "--batch" or (tx_str is None and sys.argv[1:2] == ["--batch"]):
+        return main_batch(sys.argv[2:])
     tx_str = cli_prompts.getInitialStdinStr() if tx_str is None else tx_str
     tx = parseTxFromStr(tx_str)
     run_signer(tx)
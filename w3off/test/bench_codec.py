@@ -0,0 +1,55 @@
+"""
+Benchmark of calldata encoding for payroll-style jobs: N transfer(address,uint256) calls encoded with the former per-call path
+of dataFromCall (signature split, keccak and eth_abi.encode on every call) vs the compiled CalldataCodec, call by call and in a batch.
+
+    python -m w3off.test.bench_codec [calls]
+"""
+
+import sys
+import time
+
+from eth_abi import encode
+from web3 import Web3
+
+from w3off.helpers.abiHelpers import calldataCodec, clearABICaches
+
+SIGNATURE = "transfer(address,uint256)"
+
+
+def perCallData(func_signature, func_parameters):
+    """dataFromCall before CalldataCodec, for comparison."""
+    if "address" in func_signature.split("(")[1].split(",")[0]:
+        func_parameters[0] = Web3.to_checksum_address(func_parameters[0])
+    function_selector = Web3.keccak(text=func_signature)[:4]
+    encoded_parameters = encode(types=func_signature.split("(")[1][:-1].split(","), args=func_parameters)
+    return function_selector.hex() + encoded_parameters.hex()
+
+
+def payroll(calls: int):
+    return [(Web3.to_checksum_address(f"0x{i + 1:040x}"), (i + 1) * 10**6) for i in range(calls)]
+
+
+def bench(calls: int = 10000):
+    args_list = payroll(calls)
+    clearABICaches()
+    cases = {
+        "per call (signature parsed and hashed every time)": lambda: [perCallData(SIGNATURE, list(args)) for args in args_list],
+        "CalldataCodec.encode, call by call": lambda: [calldataCodec(SIGNATURE).encode(args) for args in args_list],
+        "CalldataCodec.encodeBatch": lambda: calldataCodec(SIGNATURE).encodeBatch(args_list),
+    }
+    results, expected = {}, None
+    for name, run in cases.items():
+        start = time.perf_counter()
+        data = run()
+        results[name] = time.perf_counter() - start
+        assert expected is None or data == expected, f"{name} encodes different calldata"
+        expected = data
+
+    baseline = results["per call (signature parsed and hashed every time)"]
+    print(f"{calls} x {SIGNATURE}:")
+    for name, seconds in results.items():
+        print(f"- {name}: {seconds * 1000:.1f} ms, {seconds / calls * 10**6:.2f} us per call ({baseline / seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,46 @@
+"""
+Startup benchmark of `import w3off.config`: parsing chains.yaml and ABI files vs loading the compiled config snapshot.
+
+    python -m w3off.test.bench_config [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+import w3off.config as config
+
+
+def time_import(env: dict = None, remove_snapshot: bool = False):
+    """Seconds spent importing w3off.config (with its own imports, e.g. yaml) in a fresh process, as reported by -X importtime."""
+    if remove_snapshot and os.path.exists(config.snapshot_file_path):
+        os.remove(config.snapshot_file_path)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import w3off"], env={**os.environ, **(env or {})}, capture_output=True, text=True, check=True
+    )
+    for line in result.stderr.splitlines():
+        if line.split("|")[-1].strip() == "w3off.config":
+            return int(line.split("|")[1]) / 10**6  # cumulative microseconds
+    raise RuntimeError("w3off.config not found in -X importtime output")
+
+
+def bench(runs: int = 10):
+    cases = {
+        "no snapshot (parse chains.yaml + ABIs)": lambda: time_import({"W3OFF_NO_CONFIG_SNAPSHOT": "1"}),
+        "snapshot rebuild (sources changed)": lambda: time_import(remove_snapshot=True),
+        "snapshot load": lambda: time_import(),
+    }
+    results = {}
+    for name, run in cases.items():
+        results[name] = [run() for _ in range(runs)]
+
+    baseline = statistics.median(results["no snapshot (parse chains.yaml + ABIs)"])
+    print(f"import w3off.config, median of {runs} runs:")
+    for name, timings in results.items():
+        median = statistics.median(timings)
+        print(f"- {name}: {median * 1000:.1f} ms ({baseline / median:.1f}x)")
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
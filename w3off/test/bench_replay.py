@@ -0,0 +1,73 @@
+"""
+Offline benchmark of the observer against recorded mainnet responses (see w3off.rpc.recordReplay).
+
+Record a fixture once (needs network, RPC provider and ETHSCAN_API_KEY):
+    python -m w3off.test.bench_replay record fixture.json
+Then replay it on any machine, without network, with injected latency per round trip:
+    python -m w3off.test.bench_replay replay fixture.json [latency_seconds] [runs]
+"""
+
+import sys
+import time
+
+import w3off.config as config
+from w3off.observer.fetchABI import listFunctions
+from w3off.observer.shortcuts.customTx import prepTx
+from w3off.rpc import resetCacheStats, resetStats, formatStats, startRecording, startReplay, stopRecording, stopReplay
+from w3off.w3provider import use_provider, w3
+
+
+def scenario():
+    """Typical observer run: list functions of a proxy contract, then prepare a contract call and a simple ETH transfer."""
+    config.cache = {}  # ABIs and proxies come from the fixture (Etherscan), not from the local cache
+    timings = {}
+
+    start = time.perf_counter()
+    listFunctions(config.smart_contracts_by_name["AAVE_V3"]["address"])
+    timings["listFunctions"] = time.perf_counter() - start
+
+    usdt = config.smart_contracts_by_name["USDT"]
+    contract = w3.eth.contract(address=usdt["address"], abi=usdt["abi"])
+    start = time.perf_counter()
+    prepTx(config.default_sender, usdt["address"], 0, contract.functions.approve, (config.smart_contracts_by_name["AAVE_V3"]["address"], 0), 2)
+    timings["prepTx (contract call)"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prepTx(config.default_sender, config.default_destination, 10**15, None, None, 2)
+    timings["prepTx (transfer)"] = time.perf_counter() - start
+    return timings
+
+
+def record(path: str):
+    startRecording(w3)
+    try:
+        scenario()
+    finally:
+        stopRecording(w3, path)
+    print(f"Recorded fixture to {path}")
+
+
+def replay(path: str, latency: float = 0.05, runs: int = 5):
+    results = []
+    for _ in range(runs):
+        use_provider(startReplay(path, latency))  # fresh provider, so that every run starts with an empty response cache
+        resetStats()
+        resetCacheStats()
+        results.append(scenario())
+    stopReplay()
+
+    print(f"Replay of {path} with {latency * 1000:.0f} ms latency per round trip, best of {runs} runs:")
+    for step in results[0]:
+        print(f"- {step}: {min(run[step] for run in results) * 1000:.1f} ms")
+    print(formatStats())
+
+
+if __name__ == "__main__":
+    config.verbose = False
+    if len(sys.argv) < 3 or sys.argv[1] not in ("record", "replay"):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == "record":
+        record(sys.argv[2])
+    else:
+        replay(sys.argv[2], *(float(arg) for arg in sys.argv[3:4]), *(int(arg) for arg in sys.argv[4:5]))
@@ -0,0 +1,63 @@
+"""
+Throughput of signing a batch of transactions: signTx one by one vs the signing pool (see w3off.signer.signingPool) with
+1, 2, 4, ... workers up to the number of CPUs.
+
+    python -m w3off.test.bench_signing [transactions]
+"""
+
+import os
+import sys
+import time
+
+from web3 import Web3
+
+import w3off.signer.vault as vault
+from w3off.signer.signingPool import signTxsParallel
+from w3off.signer.w3signer import signTx
+
+PKEY = "f8f8a2f43c8376ccb0871305060d7b27b0554d2cc72bccf41b2705608452f315"  # test key of keystore-default.json
+
+
+def distribution(count: int):
+    """`count` ETH transfers of a monthly distribution."""
+    return [
+        {"type": 2, "chainId": 1, "nonce": nonce, "to": Web3.to_checksum_address(f"0x{nonce + 1:040x}"), "value": 10**15, "gas": 21000, "maxFeePerGas": 30 * 10**9, "maxPriorityFeePerGas": 10**9}
+        for nonce in range(count)
+    ]
+
+
+def workerCounts():
+    cpus = os.cpu_count() or 1
+    counts, workers = [], 1
+    while workers < cpus:
+        counts.append(workers)
+        workers *= 2
+    return counts + [cpus]
+
+
+def bench(count: int = 2000):
+    txs = distribution(count)
+    vault.get_pkey_from_prompt(PKEY)
+    try:
+        cases = {"signTx, one by one": lambda: [signTx(tx, keep_pkey=True) for tx in txs]}
+        for workers in workerCounts():
+            cases[f"signing pool, {workers} workers"] = lambda workers=workers: list(signTxsParallel(txs, workers))
+
+        results, expected = {}, None
+        for name, run in cases.items():
+            start = time.perf_counter()
+            signed = [signed_tx.raw_transaction for signed_tx in run()]
+            results[name] = time.perf_counter() - start
+            assert expected is None or signed == expected, f"{name} signed different transactions"
+            expected = signed
+    finally:
+        vault.clear_pkey()
+
+    baseline = results["signTx, one by one"]
+    print(f"Signing {count} transactions on {os.cpu_count()} CPUs:")
+    for name, seconds in results.items():
+        print(f"- {name}: {seconds:.2f} s, {count / seconds:.0f} tx/s ({baseline / seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -19,9 +19,11 @@ def setEthTesterEnv(w3: Web3, eth_tester: EthereumTester):
     print("----------------------")
     print(f"Full list of pre-populated test addresses: {w3.eth.accounts}")
 
-    config.cache.setdefault("abi", {})[usdt_ethtester["contract_address"]] = usdt_ethtester["abi"]
-    config.cache.setdefault("abi", {})[aave_v3_ethtester["contract_address"]] = aave_v3_ethtester["abi"]
-    config.cache.setdefault("abi", {})[aave_v3_ethtester["implementation_address"]] = aave_v3_ethtester["abi"]
+    # Session cache only (see w3off.observer.cache), these ABIs are not persisted
+    chain_id = w3.eth.chain_id
+    config.cache.setdefault("abi", {})[(chain_id, usdt_ethtester["contract_address"])] = usdt_ethtester["abi"]
+    config.cache.setdefault("abi", {})[(chain_id, aave_v3_ethtester["contract_address"])] = aave_v3_ethtester["abi"]
+    config.cache.setdefault("abi", {})[(chain_id, aave_v3_ethtester["implementation_address"])] = aave_v3_ethtester["abi"]
 
     w3.eth.default_account = w3.eth.accounts[0]  # contract owner
 
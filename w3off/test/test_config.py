@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import w3off.config as config
+
+
+class Test_configSnapshot(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        patcher = patch.object(config, "snapshot_file_path", os.path.join(tmp_dir.name, "chains.snapshot"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_roundtrip(self):
+        sources = config.config_snapshot_sources()
+        chains = config.parse_chains()
+        config.save_config_snapshot(sources, chains)
+        self.assertEqual(config.load_config_snapshot(sources), chains)
+        self.assertTrue(chains["eth"]["smart_contracts"]["USDT"]["abi_file"].endswith("usdt.abi"))
+
+    def test_outdated_snapshot(self):
+        sources = config.config_snapshot_sources()
+        config.save_config_snapshot(sources, config.chains)
+        chains_file = sources[-1][0]
+        changed_sources = sources[:-1] + (((chains_file[0], chains_file[1] + 1, chains_file[2]), *sources[-1][1:]),)
+        self.assertIsNone(config.load_config_snapshot(changed_sources))
+
+    def test_corrupted_snapshot(self):
+        with open(config.snapshot_file_path, "wb") as f:
+            f.write(b"\x00garbage")
+        self.assertIsNone(config.load_config_snapshot(config.config_snapshot_sources()))
+
+
+class Test_ContractEntry(unittest.TestCase):
+    def test_lazy_abi(self):
+        abi_file = config.chains["eth"]["smart_contracts"]["USDT"]["abi_file"]
+        entry = config.ContractEntry({"name": "USDT", "abi_file": abi_file})
+        self.assertIn("abi", entry)
+        self.assertIn("abi", entry.keys())
+        self.assertFalse(dict.__contains__(entry, "abi"))  # not read yet
+        with open(abi_file) as f:
+            self.assertEqual(entry.get("abi"), f.read())
+        self.assertEqual(list(entry), ["name", "abi_file", "abi"])
+        self.assertIs(entry.parsed_abi(), entry.parsed_abi())
+        self.assertEqual(entry.get("missing", 1), 1)
+        self.assertNotIn("abi", config.ContractEntry({"name": "X"}))
+
+    def test_copies_keep_abi(self):
+        abi_file = config.chains["eth"]["smart_contracts"]["USDC"]["abi_file"]
+        with open(abi_file) as f:
+            abi = f.read()
+        for copy in (
+            lambda entry: {**entry},
+            lambda entry: dict(entry),
+            lambda entry: dict(entry.items()),
+            lambda entry: {"i": 1, **entry},
+            lambda entry: entry.copy(),
+        ):
+            entry = config.ContractEntry({"name": "USDC", "abi_file": abi_file})
+            self.assertEqual(copy(entry)["abi"], abi)
+
+    def test_shared_entries(self):
+        usdt = config.smart_contracts_by_name["USDT"]
+        self.assertIs(config.smart_contracts[usdt["address"]], usdt)
+
+
+class Test_registry(unittest.TestCase):
+    def test_getChainName(self):
+        for name, chain in config.chains.items():
+            self.assertEqual(config.getChainName(chain["id"]), name)
+        self.assertIsNone(config.getChainName(-1))
+
+    def test_getContract(self):
+        usdc_base = config.getContract(8453, address="0x833589fcd6edb6e08f4c7c32d4f71b54bda02913")
+        self.assertIs(usdc_base, config.chains["base"]["smart_contracts"]["USDC"])
+        self.assertIs(config.getContract(8453, name="USDC"), usdc_base)
+        self.assertIsNot(config.getContract(1, name="USDC"), usdc_base)
+        self.assertIsNone(config.getContract(8453, address="0xdAC17F958D2ee523a2206206994597C13D831ec7"))
+
+    def test_views_are_not_rebuilt(self):
+        by_name, by_address = config.getSmartContracts("base")
+        self.assertIs(config.getSmartContracts("base")[1], by_address)
+        self.assertIs(by_address["0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913"], by_name["USDC"])
+
+    def test_registerContract(self):
+        token = {"name": "TEST", "address": "0x00000000000000000000000000000000000000aA", "type": "ERC20"}
+        config.registerContract(8453, token)
+        self.addCleanup(config.getSmartContracts("base")[1].pop, token["address"])
+        self.addCleanup(config.contracts_by_address.pop, (8453, token["address"].lower()))
+        self.addCleanup(config.contracts_by_name.pop, (8453, "TEST"))
+        self.assertIs(config.getContract(8453, address=token["address"].upper().replace("0X", "0x")), token)
+        self.assertIs(config.getSmartContracts("base")[1][token["address"]], token)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,25 @@
+import io
+import json
+import os
+import tempfile
 import unittest
 from web3.datastructures import AttributeDict
 
 from web3 import Web3, EthereumTesterProvider
 from eth_abi import encode
+from eth_abi.exceptions import EncodingError
 
 from hexbytes import HexBytes
+import rlp
+from eth_account import Account
 
-from w3off.helpers.abiHelpers import dataFromCall, encodeABICall, pad_hex
+import w3off.config as config
+from w3off.helpers import abiHelpers
+from w3off.helpers.abiHelpers import CalldataCodec, FunctionEntry, calldataCodec, dataFromCall, decodeABIMethod, encodeABICall, functionTable, getContract, pad_hex, parseABI
 from w3off.helpers.addressHelpers import deployerToSmartContractAddress
-from w3off.helpers.txHelpers import decodeRawTx, prepareDictToPrint
+from w3off.helpers import senderRecovery
+from w3off.helpers.senderRecovery import recoverSenders, verifySenders
+from w3off.helpers.txHelpers import decodeRawTx, iterDecodeRawTxs, prepareDictToPrint
 
 
 class TestAddressHelpers(unittest.TestCase):
@@ -69,12 +80,220 @@ class TestAbiHelpers(unittest.TestCase):
         )
 
 
+class TestAbiMemoization(unittest.TestCase):
+    def setUp(self):
+        abiHelpers.clearABICaches()
+        self.addCleanup(abiHelpers.clearABICaches)
+        self.usdt = config.smart_contracts_by_name["USDT"]
+
+    def test_parseABI(self):
+        abi = self.usdt["abi"]
+        self.assertIs(parseABI(abi), parseABI(abi))
+        self.assertIs(parseABI(abi), parseABI("".join(abi)))  # equal strings share the parsed ABI
+        self.assertEqual(parseABI(abi), config.ContractEntry(self.usdt).parsed_abi())
+
+    def test_decodeABIMethod(self):
+        data = getContract(self.usdt["address"], self.usdt["abi"]).encode_abi("transfer", args=[self.usdt["address"], 1])
+        self.assertEqual(decodeABIMethod(self.usdt["abi"], data), "transfer")
+        with self.assertRaises(ValueError):
+            decodeABIMethod(self.usdt["abi"], "0x12345678")
+
+    def test_getContract(self):
+        contract = getContract(self.usdt["address"], self.usdt["abi"])
+        self.assertIs(getContract(self.usdt["address"], self.usdt["abi"]), contract)
+        self.assertIsNot(getContract(self.usdt["address"], self.usdt["abi"], chain_id=-1), contract)
+        self.assertEqual(contract.address, self.usdt["address"])
+        self.assertIn("transfer", [fn.abi["name"] for fn in contract.all_functions()])
+
+    def test_getContract_eviction(self):
+        abi = parseABI(self.usdt["abi"])
+        for i in range(abiHelpers.CONTRACT_CACHE_SIZE + 10):
+            getContract(Web3.to_checksum_address(f"0x{i + 1:040x}"), abi)
+        self.assertEqual(len(abiHelpers._contracts), abiHelpers.CONTRACT_CACHE_SIZE)
+
+
+class TestFunctionTable(unittest.TestCase):
+    overloaded_abi = [
+        {"type": "function", "name": "safeTransferFrom", "stateMutability": "nonpayable", "inputs": [{"name": "from", "type": "address"}, {"name": "to", "type": "address"}, {"name": "tokenId", "type": "uint256"}], "outputs": []},
+        {"type": "function", "name": "safeTransferFrom", "stateMutability": "nonpayable", "inputs": [{"name": "from", "type": "address"}, {"name": "to", "type": "address"}, {"name": "tokenId", "type": "uint256"}, {"name": "data", "type": "bytes"}], "outputs": []},
+        {"type": "function", "name": "ownerOf", "stateMutability": "view", "inputs": [{"name": "tokenId", "type": "uint256"}], "outputs": [{"name": "", "type": "address"}]},
+        {"type": "event", "name": "Transfer", "inputs": [], "anonymous": False},
+    ]
+
+    def setUp(self):
+        abiHelpers.clearABICaches()
+        self.addCleanup(abiHelpers.clearABICaches)
+
+    def test_indexes(self):
+        aave = config.smart_contracts_by_name["AAVE_V3"]
+        table = functionTable(aave["abi"])
+        self.assertIs(functionTable(aave["abi"]), table)
+        contract = getContract(aave["address"], aave["abi"])
+        self.assertEqual(len(table), len(contract.all_functions()))
+        reads = [entry.is_read for entry in table]
+        self.assertEqual(reads, sorted(reads, reverse=True))  # READ functions first
+        for position, entry in enumerate(table, start=1):
+            self.assertEqual(entry.position, position)
+            self.assertIs(table.by_selector[entry.selector], entry)
+            self.assertIn(entry, table.by_name[entry.name])
+        supply = table.by_name["supply"][0]
+        data = contract.encode_abi("supply", args=[aave["address"], 1, aave["address"], 0])
+        self.assertIs(table.by_selector[data[2:10]], supply)
+        self.assertEqual(supply.input_types, ("address", "uint256", "address", "uint16"))
+        self.assertFalse(hasattr(supply, "__dict__"))
+        with self.assertRaises(AttributeError):
+            supply.comment = "entries have __slots__"
+
+    def test_choose(self):
+        table = functionTable(self.overloaded_abi)
+        self.assertEqual([entry.signature for entry in table], ["ownerOf(uint256)", "safeTransferFrom(address,address,uint256)", "safeTransferFrom(address,address,uint256,bytes)"])
+        self.assertIs(table.choose(1), table.by_name["ownerOf"][0])
+        self.assertIs(table.choose("2"), table.entries[1])
+        self.assertEqual(table.choose("safeTransferFrom").signature, "safeTransferFrom(address,address,uint256,bytes)")  # more parameters preferred
+        self.assertEqual(len(table.choose("safeTransferFrom").overloads), 2)
+        self.assertIs(table.choose("0x" + table.entries[1].selector), table.entries[1])
+        for choice in ("0", "4", "transfer"):
+            with self.assertRaises(ValueError):
+                table.choose(choice)
+        self.assertIsInstance(table.entries[0], FunctionEntry)
+
+
+class TestCalldataCodec(unittest.TestCase):
+    receivers = ["0x5AD1F1Aa106B5Af3A4F9D8B095427Df95607a452", "0xe57bfe9f44b819898f47bf37e5af72a0783e1141"]
+
+    def test_static(self):
+        codec = calldataCodec("transfer(address,uint256)")
+        self.assertIs(calldataCodec("transfer(address,uint256)"), codec)
+        self.assertEqual(codec.selector.hex(), "a9059cbb")
+        args = [(receiver, amount) for receiver in self.receivers for amount in (0, 1, 2**256 - 1)]
+        expected = ["a9059cbb" + encode(["address", "uint256"], list(call)).hex() for call in args]
+        self.assertEqual([codec.encode(call) for call in args], expected)
+        self.assertEqual(codec.encodeBatch(args), expected)
+        self.assertEqual(codec.decode("0x" + expected[1]), (self.receivers[0].lower(), 1))
+        with self.assertRaises(ValueError):
+            calldataCodec("approve(address,uint256)").decode(expected[0])
+
+    def test_dynamic(self):
+        codec = CalldataCodec("multicall(uint,(address,bytes)[],bool)")
+        self.assertEqual(codec.signature, "multicall(uint256,(address,bytes)[],bool)")
+        args = (7, [(self.receivers[0], b"\x01\x02"), (self.receivers[1], b"")], True)
+        self.assertEqual(codec.encode(args), (codec.selector + encode(codec.types, args)).hex())
+        self.assertEqual(codec.decode(bytes.fromhex(codec.encode(args)))[0], 7)
+        self.assertEqual(CalldataCodec("pause()").encode(()), Web3.keccak(text="pause()")[:4].hex())
+
+    def test_invalid_args(self):
+        codec = calldataCodec("setParams(address,uint8,int8,bool)")
+        self.assertEqual(codec.decode(codec.encode((self.receivers[0], 255, -128, False))), (self.receivers[0].lower(), 255, -128, False))
+        for args in [
+            (self.receivers[0], 256, 0, False),  # out of bounds
+            (self.receivers[0], 0, 128, False),
+            (self.receivers[0], -1, 0, False),
+            (self.receivers[0], 1, 0, 1),  # not a bool
+            (self.receivers[0].replace("A", "a", 1), 1, 0, False),  # invalid checksum
+            ("0x1234", 1, 0, False),
+            (self.receivers[0], 1, 0),
+        ]:
+            with self.assertRaises(EncodingError, msg=args):
+                codec.encode(args)
+
+
+class TestRawTxDecoder(unittest.TestCase):
+    account = Account.from_key("0x" + "11" * 32)
+    base_tx = {"nonce": 1, "gas": 50000, "to": "0x" + "22" * 20, "value": 5, "data": "0x1234", "chainId": 8453}
+    access_list = [{"address": "0x" + "33" * 20, "storageKeys": ["0x" + "44" * 32]}]
+
+    def signedTxs(self):
+        authorization = self.account.sign_authorization({"chainId": 8453, "address": "0x" + "55" * 20, "nonce": 2})
+        fees = {"maxFeePerGas": 10, "maxPriorityFeePerGas": 1}
+        txs = {
+            "legacy": {**self.base_tx, "chainId": None, "gasPrice": 10},
+            0: {**self.base_tx, "gasPrice": 10},
+            1: {**self.base_tx, "type": 1, "gasPrice": 10, "accessList": self.access_list},
+            2: {**self.base_tx, "type": 2, **fees, "accessList": self.access_list},
+            3: {**self.base_tx, "type": 3, **fees, "maxFeePerBlobGas": 7, "blobVersionedHashes": ["0x01" + "66" * 31]},
+            4: {**self.base_tx, "type": 4, **fees, "authorizationList": [authorization]},
+        }
+        return {type: (tx, self.account.sign_transaction({k: v for k, v in tx.items() if v is not None})) for type, tx in txs.items()}
+
+    def test_all_types(self):
+        for type, (tx, signed) in self.signedTxs().items():
+            decoded = decodeRawTx(signed.raw_transaction.to_0x_hex())
+            self.assertEqual(decoded["from"], self.account.address, type)
+            self.assertEqual(decoded["hash"], signed.hash.to_0x_hex(), type)
+            self.assertEqual(decoded["to"], Web3.to_checksum_address(tx["to"]))
+            self.assertEqual((decoded["nonce"], decoded["gas"], decoded["value"], decoded["data"]), (1, 50000, 5, "0x1234"))
+            self.assertEqual((decoded["r"], decoded["s"], decoded["v"]), (hex(signed.r), hex(signed.s), signed.v))
+            self.assertEqual(decoded.get("type"), type if type not in ("legacy", 0) else None)
+            self.assertEqual(decodeRawTx(bytes(signed.raw_transaction), recover=False), {**decoded, "from": None})
+        decoded = {type: decodeRawTx(signed.raw_transaction) for type, (_, signed) in self.signedTxs().items()}
+        self.assertEqual(decoded[0]["chainId"], 8453)
+        self.assertEqual(decoded[1]["gasPrice"], 10)
+        self.assertEqual(decoded[2]["accessList"], ({"address": Web3.to_checksum_address("0x" + "33" * 20), "storageKeys": ("0x" + "44" * 32,)},))
+        self.assertEqual((decoded[3]["maxFeePerBlobGas"], decoded[3]["blobVersionedHashes"]), (7, ("0x01" + "66" * 31,)))
+        self.assertEqual(decoded[4]["authorizationList"][0]["address"], Web3.to_checksum_address("0x" + "55" * 20))
+        self.assertEqual(decoded[4]["authorizationList"][0]["nonce"], 2)
+
+    def test_blob_network_form(self):
+        _, signed = self.signedTxs()[3]
+        items = rlp.decode(bytes(signed.raw_transaction)[1:])
+        network_form = b"\x03" + rlp.encode([items, [bytes(32)], [bytes(48)], [bytes(48)]])
+        self.assertEqual(decodeRawTx(network_form), decodeRawTx(signed.raw_transaction))
+
+    def test_iterDecodeRawTxs(self):
+        signed = [signed for _, signed in self.signedTxs().values()]
+        lines = [signed[0].raw_transaction.to_0x_hex(), "", json.dumps(signed[1].raw_transaction.hex()), json.dumps({"raw_transaction": signed[2].raw_transaction.to_0x_hex()})]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as file:
+            file.write("\n".join(lines) + "\n")
+        self.addCleanup(os.remove, file.name)
+        records = iterDecodeRawTxs(file.name)
+        self.assertFalse(isinstance(records, list))
+        self.assertEqual([record["hash"] for record in records], [tx.hash.to_0x_hex() for tx in signed[:3]])
+        with self.assertRaisesRegex(ValueError, "Line 2"):
+            list(iterDecodeRawTxs(io.StringIO(lines[0] + "\n0x05c0\n")))
+        with self.assertRaisesRegex(ValueError, "Line 3: invalid JSON"):
+            list(iterDecodeRawTxs(io.StringIO(lines[0] + "\n\n{raw_transaction\n")))
+        zero_r = "0x" + rlp.encode([0, 1, 21000, bytes(20), 0, b"", 27, 0, 1]).hex()  # r = 0 is not a valid signature
+        with self.assertRaisesRegex(ValueError, "Line 2"):
+            list(iterDecodeRawTxs(io.StringIO(lines[0] + "\n" + zero_r + "\n")))
+
+
+class TestSenderRecovery(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        accounts = [Account.from_key(f"0x{i + 1:064x}") for i in range(3)]
+        cls.senders = [accounts[i % 3].address for i in range(40)]
+        fees = [{"gasPrice": 10}, {"type": 2, "maxFeePerGas": 10, "maxPriorityFeePerGas": 1}]
+        cls.raw_txs = [
+            accounts[i % 3].sign_transaction({"nonce": i, "gas": 21000, "to": accounts[0].address, "value": i, "chainId": 1, **fees[i % 2]}).raw_transaction
+            for i in range(40)
+        ]
+
+    def test_sequential(self):
+        self.assertEqual(recoverSenders([raw_tx.to_0x_hex() for raw_tx in self.raw_txs]), self.senders)
+        self.assertEqual(recoverSenders(self.raw_txs[:3]), [decodeRawTx(raw_tx)["from"] for raw_tx in self.raw_txs[:3]])
+
+    def test_process_pool(self):
+        # chunks are recovered by several workers, executor.map returns them in input order
+        self.assertEqual(recoverSenders(self.raw_txs, workers=3, chunk_size=7, parallel_min=0), self.senders)
+        mismatches = verifySenders(self.raw_txs, self.senders[0], workers=2, chunk_size=5, parallel_min=0)
+        self.assertEqual([i for i, _ in mismatches], [i for i in range(40) if i % 3])
+        with self.assertRaisesRegex(ValueError, "Transaction 2"):
+            recoverSenders(self.raw_txs[:2] + [b"\x05\xc0"], workers=2, chunk_size=1, parallel_min=0)
+
+    @unittest.skipIf(senderRecovery.coincurve is None, "coincurve is not installed")
+    def test_coincurve(self):
+        from w3off.helpers.txHelpers import decodeEnvelope, recoverSender
+
+        _, tx, _, signing_hash, y_parity = decodeEnvelope(bytes(self.raw_txs[1]))
+        self.assertEqual(senderRecovery.fastRecoverSender(signing_hash, y_parity, tx.r, tx.s), recoverSender(signing_hash, y_parity, tx.r, tx.s))
+
+
 class TestTxHelpers(unittest.TestCase):
     def test_decodeRawTxLegacy1(self):
         raw_tx = "0xf8a910850684ee180082e48694a0b86991c6218b36c1d19d4a2e9eb0ce3606eb4880b844a9059cbb000000000000000000000000b8b59a7bc828e6074a4dd00fa422ee6b92703f9200000000000000000000000000000000000000000000000000000000010366401ba0e2a4093875682ac6a1da94cdcc0a783fe61a7273d98e1ebfe77ace9cab91a120a00f553e48f3496b7329a7c0008b3531dd29490c517ad28b0e6c1fba03b79a1dee"  # noqa
         res = decodeRawTx(raw_tx)
         expected = {
-            "chainId": -4,
+            "chainId": None,  # pre EIP-155 (v 27)
             "data": "0xa9059cbb000000000000000000000000b8b59a7bc828e6074a4dd00fa422ee6b92703f920000000000000000000000000000000000000000000000000000000001036640",
             "from": "0xD8cE57B469962b6Ea944d28b741312Fb7E78cfaF",
             "gas": 58502,
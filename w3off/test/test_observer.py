@@ -1,9 +1,24 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
 import unittest
 from unittest import mock
 from unittest.mock import patch, MagicMock, Mock
+from web3 import Web3
+
 import w3off.config as config
 from w3off.config import getChainName
+from w3off.observer import cache, warmCache
+from w3off.observer.asyncEngine import AsyncEngine, prepTxs, resolveContract
+from w3off.observer import etherscan
+from w3off.observer.etherscan import EtherscanClient, EtherscanError, TokenBucket
+from w3off.observer.cacheStore import LEGACY_CHAIN_ID, CacheStore
 from w3off.observer.fetchABI import fetchABI, implementationAddress, listFunctions, isContract
+from w3off.observer.proxyResolver import PROXY_SLOTS, resolveProxy, resolveProxyAsync
 from w3off.signer.checkOffline import checkOffline
 from w3off.w3provider import change_chain, w3
 from w3off.test.ethTesterContracts import aave_v3_ethtester, usdt_ethtester
@@ -19,13 +34,13 @@ class Test_fetchABI(unittest.TestCase):
         cls.initial_cache = config.cache
         cls.usdt_abi = '[{"constant":true,"inputs":[],"name":"name","outputs":[{"name":"","type":"string"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_upgradedAddress","type":"address"}],"name":"deprecate","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"_spender","type":"address"},{"name":"_value","type":"uint256"}],"name":"approve","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"deprecated","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_evilUser","type":"address"}],"name":"addBlackList","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"totalSupply","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_from","type":"address"},{"name":"_to","type":"address"},{"name":"_value","type":"uint256"}],"name":"transferFrom","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"upgradedAddress","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"","type":"address"}],"name":"balances","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"decimals","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"maximumFee","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"_totalSupply","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[],"name":"unpause","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"_maker","type":"address"}],"name":"getBlackListStatus","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"","type":"address"},{"name":"","type":"address"}],"name":"allowed","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"paused","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"who","type":"address"}],"name":"balanceOf","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[],"name":"pause","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"getOwner","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"owner","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"symbol","outputs":[{"name":"","type":"string"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_to","type":"address"},{"name":"_value","type":"uint256"}],"name":"transfer","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"newBasisPoints","type":"uint256"},{"name":"newMaxFee","type":"uint256"}],"name":"setParams","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"amount","type":"uint256"}],"name":"issue","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"amount","type":"uint256"}],"name":"redeem","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"_owner","type":"address"},{"name":"_spender","type":"address"}],"name":"allowance","outputs":[{"name":"remaining","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"basisPointsRate","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"","type":"address"}],"name":"isBlackListed","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_clearedUser","type":"address"}],"name":"removeBlackList","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"MAX_UINT","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"newOwner","type":"address"}],"name":"transferOwnership","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"_blackListedUser","type":"address"}],"name":"destroyBlackFunds","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"inputs":[{"name":"_initialSupply","type":"uint256"},{"name":"_name","type":"string"},{"name":"_symbol","type":"string"},{"name":"_decimals","type":"uint256"}],"payable":false,"stateMutability":"nonpayable","type":"constructor"},{"anonymous":false,"inputs":[{"indexed":false,"name":"amount","type":"uint256"}],"name":"Issue","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"name":"amount","type":"uint256"}],"name":"Redeem","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"name":"newAddress","type":"address"}],"name":"Deprecate","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"name":"feeBasisPoints","type":"uint256"},{"indexed":false,"name":"maxFee","type":"uint256"}],"name":"Params","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"name":"_blackListedUser","type":"address"},{"indexed":false,"name":"_balance","type":"uint256"}],"name":"DestroyedBlackFunds","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"name":"_user","type":"address"}],"name":"AddedBlackList","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"name":"_user","type":"address"}],"name":"RemovedBlackList","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"owner","type":"address"},{"indexed":true,"name":"spender","type":"address"},{"indexed":false,"name":"value","type":"uint256"}],"name":"Approval","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"from","type":"address"},{"indexed":true,"name":"to","type":"address"},{"indexed":false,"name":"value","type":"uint256"}],"name":"Transfer","type":"event"},{"anonymous":false,"inputs":[],"name":"Pause","type":"event"},{"anonymous":false,"inputs":[],"name":"Unpause","type":"event"}]'
         config.smart_contracts = {}
-        config.cache = {"abi": {
-            usdt_ethtester["contract_address"]: cls.usdt_abi
-        }}
         cls.online_mode = w3.is_connected() and cls.initial_chain != "debug"
         cls.target_chain = "debug" if cls.online_mode else "eth"
         if cls.online_mode and cls.initial_chain != "eth":
             change_chain("eth")
+        config.cache = {"abi": {
+            cache.cacheKey(usdt_ethtester["contract_address"]): cls.usdt_abi
+        }}
 
     @classmethod
     def tearDownClass(cls):
@@ -48,8 +63,8 @@ class Test_fetchABI(unittest.TestCase):
     def test_listFunctions(self, mock_isContract, mock_fetchABI, mock_implementationAddress):
         AAVE_V3_addr = "0x87870Bca3F3fD6335C3F4ce8392D69350B4fA4E2"
         AAVE_V3_implementation = "0xeF434E4573b90b6ECd4a00f4888381e4D0CC5Ccd"
-        self.assertNotIn(AAVE_V3_addr, config.cache["abi"])
-        self.assertNotIn(AAVE_V3_implementation, config.cache["abi"])
+        self.assertNotIn(cache.cacheKey(AAVE_V3_addr), config.cache["abi"])
+        self.assertNotIn(cache.cacheKey(AAVE_V3_implementation), config.cache["abi"])
         mock_implementationAddress.side_effect = lambda addr: (
             "0xeF434E4573b90b6ECd4a00f4888381e4D0CC5Ccd" if addr == "0x87870Bca3F3fD6335C3F4ce8392D69350B4fA4E2" else ""
         )
@@ -58,12 +73,487 @@ class Test_fetchABI(unittest.TestCase):
             True if (addr == "0x87870Bca3F3fD6335C3F4ce8392D69350B4fA4E2" or addr == "0xeF434E4573b90b6ECd4a00f4888381e4D0CC5Ccd") else False
         )
         funcs = listFunctions(AAVE_V3_addr)
-        self.assertIn(AAVE_V3_addr, config.cache["abi"])
-        self.assertIn(AAVE_V3_implementation, config.cache["abi"])
+        self.assertIn(cache.cacheKey(AAVE_V3_addr), config.cache["abi"])
+        self.assertIn(cache.cacheKey(AAVE_V3_implementation), config.cache["abi"])
 
         self.assertIsNotNone(funcs[0].abi)
         self.assertEqual(funcs[0].abi["type"], "function")
 
 
+class Test_asyncEngine(unittest.TestCase):
+    """Async engine against EthereumTester (debug chain)."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.initial_chain = config.chain_name
+        cls.verbose = config.verbose
+        config.verbose = False
+        change_chain("debug")
+
+    @classmethod
+    def tearDownClass(cls):
+        config.verbose = cls.verbose
+        change_chain(cls.initial_chain)
+
+    def test_prepTxs(self):
+        usdt = config.smart_contracts_by_name["USDT"]["address"]
+        senders = w3.eth.accounts[:3]
+        destination = "0xE57bFE9F44b819898F47BF37E5AF72a0783e1141"
+        txs = prepTxs(
+            [{"from_address": sender, "to_address": destination, "value": 10**15, "type": 2} for sender in senders]
+            + [{"from_address": config.default_sender, "to_address": usdt, "fn_name": "transfer", "args": (destination, 1000000), "type": 0}]
+        )
+        self.assertEqual(len(txs), 4)
+        for sender, tx in zip(senders, txs):
+            self.assertEqual(tx["from"], sender)
+            self.assertEqual(tx["nonce"], w3.eth.get_transaction_count(sender))
+            self.assertEqual(tx["chainId"], w3.eth.chain_id)
+            self.assertEqual(tx["type"], 2)
+            self.assertIn("maxFeePerGas", tx)
+        usdt_contract = w3.eth.contract(address=usdt, abi=config.smart_contracts_by_name["USDT"]["abi"])
+        self.assertEqual(txs[3]["data"], usdt_contract.encode_abi("transfer", args=[destination, 1000000]))
+        self.assertIn("gasPrice", txs[3])
+
+    def test_nonces_of_one_sender(self):
+        sender = w3.eth.accounts[1]
+        destination = "0xE57bFE9F44b819898F47BF37E5AF72a0783e1141"
+        txs = prepTxs([{"from_address": sender, "to_address": destination, "value": value, "type": 2} for value in (1, 2, 3)])
+        nonce = w3.eth.get_transaction_count(sender)
+        self.assertEqual([(tx["nonce"], tx["value"]) for tx in txs], [(nonce, 1), (nonce + 1, 2), (nonce + 2, 3)])
+
+    def test_tokenInfo(self):
+        usdt = config.smart_contracts_by_name["USDT"]
+
+        async def run():
+            async with AsyncEngine() as engine:
+                return await warmCache.warmContract(engine, usdt)
+
+        with patch.object(cache, "store", CacheStore(":memory:")), patch.object(config, "cache", {}), patch.object(cache, "_dirty", set()):
+            result = asyncio.run(run())
+            self.assertEqual(result["token"], {"name": "Tether USD", "symbol": "USDT", "decimals": 6})
+            self.assertEqual(cache.checkTokenCache(usdt["address"]), result["token"])
+
+    def test_resolveContract(self):
+        usdt = config.smart_contracts_by_name["USDT"]["address"]
+        contract = resolveContract(usdt)
+        self.assertTrue(contract["is_contract"])
+        self.assertEqual(contract["implementation"], usdt)
+        self.assertEqual(contract["abi"], config.smart_contracts_by_name["USDT"]["abi"])
+
+
+def _deploy(runtime: bytes = b"\x00", storage: dict = None):
+    """Deploys handcrafted `runtime` code on EthereumTester, with constructor writing addresses {slot: address} to storage."""
+    init = b"".join(b"\x73" + bytes.fromhex(address[2:]) + b"\x7f" + slot.to_bytes(32, "big") + b"\x55" for slot, address in (storage or {}).items())
+    # PUSH2 size, DUP1, PUSH2 offset, PUSH1 0, CODECOPY, PUSH1 0, RETURN
+    init += b"\x61" + len(runtime).to_bytes(2, "big") + b"\x80\x61" + (len(init) + 13).to_bytes(2, "big") + b"\x60\x00\x39\x60\x00\xf3"
+    tx_hash = w3.eth.send_transaction({"from": w3.eth.accounts[0], "data": init + runtime})
+    return w3.eth.wait_for_transaction_receipt(tx_hash)["contractAddress"]
+
+
+class Test_proxyResolver(unittest.TestCase):
+    """Proxies resolved from storage slots, on EthereumTester (debug chain)."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.initial_chain = config.chain_name
+        change_chain("debug")
+        cls.implementation = _deploy()
+
+    @classmethod
+    def tearDownClass(cls):
+        change_chain(cls.initial_chain)
+
+    def test_standard_slots(self):
+        for kind in ("eip1967", "eip1822", "oz_legacy"):
+            proxy = _deploy(storage={PROXY_SLOTS[kind]: self.implementation})
+            self.assertEqual(resolveProxy(w3, proxy), self.implementation, kind)
+        self.assertIsNone(resolveProxy(w3, self.implementation))
+
+    def test_beacon(self):
+        # implementation() of the beacon returns the address: PUSH20 address, PUSH1 0, MSTORE, PUSH1 32, PUSH1 0, RETURN
+        beacon = _deploy(b"\x73" + bytes.fromhex(self.implementation[2:]) + bytes.fromhex("60005260206000f3"))
+        proxy = _deploy(storage={PROXY_SLOTS["eip1967_beacon"]: beacon})
+        self.assertEqual(resolveProxy(w3, proxy), self.implementation)
+
+    def test_reverting_beacon(self):
+        # implementation() reverts: PUSH1 0, DUP1, REVERT
+        beacon = _deploy(bytes.fromhex("600080fd"))
+        proxy = _deploy(storage={PROXY_SLOTS["eip1967_beacon"]: beacon})
+        self.assertIsNone(resolveProxy(w3, proxy))
+
+        async def run():
+            async with AsyncEngine() as engine:
+                return await resolveProxyAsync(engine.w3, proxy)
+
+        self.assertIsNone(asyncio.run(run()))
+
+    def test_proxy_chain(self):
+        inner = _deploy(storage={PROXY_SLOTS["eip1822"]: self.implementation})
+        outer = _deploy(storage={PROXY_SLOTS["eip1967"]: inner})
+        self.assertEqual(resolveProxy(w3, outer), self.implementation)
+        self.assertEqual(resolveProxy(w3, outer, max_depth=1), inner)
+
+        async def run():
+            async with AsyncEngine() as engine:
+                return await resolveProxyAsync(engine.w3, outer)
+
+        self.assertEqual(asyncio.run(run()), self.implementation)
+
+    @patch("w3off.observer.fetchABI.etherscanRequest")
+    def test_etherscan_fallback(self, mock_etherscanRequest):
+        proxy = _deploy(storage={PROXY_SLOTS["eip1967"]: self.implementation})
+        mock_etherscanRequest.return_value = {"status": "1", "result": [{"Proxy": "0", "Implementation": "", "ABI": "[]"}]}
+        with patch.object(cache, "store", CacheStore(":memory:")), patch.object(config, "cache", {}), patch.object(cache, "_dirty", set()):
+            self.assertEqual(implementationAddress(proxy), self.implementation)
+            mock_etherscanRequest.assert_not_called()
+            self.assertEqual(cache.checkImplementationCache(proxy), {"Proxy": "1", "Implementation": self.implementation})
+
+            self.assertEqual(implementationAddress(self.implementation), self.implementation)
+            mock_etherscanRequest.assert_called_once_with("contract", "getsourcecode", "post", address=self.implementation)
+
+
+class Test_warmCache(unittest.TestCase):
+    """Cache warm-up of the contracts in chains.yaml, with Etherscan and RPC replaced by fakes."""
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.store = CacheStore(os.path.join(tmp_dir.name, "cache.sqlite"))
+        self.addCleanup(self.store.close)
+        for patcher in (patch.object(cache, "store", self.store), patch.object(config, "cache", {}), patch.object(cache, "_dirty", set()), patch.object(cache, "_expires", {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.etherscan_calls = []
+
+    async def fakeEtherscanRequest(self, engine, module, action, **params):
+        self.etherscan_calls.append((engine.cache_chain_id, action, params["address"]))
+        contract = config.getContract(engine.cache_chain_id, address=params["address"]) or {}
+        if action == "getsourcecode":
+            implementation = contract.get("implementation", "") if contract.get("proxy") else ""
+            return {"status": "1", "result": [{"Proxy": "1" if implementation else "0", "Implementation": implementation, "ABI": "[]"}]}
+        return {"status": "1", "result": '[{"type": "function", "name": "implementation", "inputs": [], "outputs": []}]'}
+
+    def test_warmCache(self):
+        fake = lambda engine, *args, **params: self.fakeEtherscanRequest(engine, *args, **params)
+        with patch("w3off.observer.asyncEngine.makeAsyncWeb3", return_value=None), patch.object(AsyncEngine, "etherscanRequest", fake):
+            results = asyncio.run(warmCache.warmCache(rate=1000))
+            targets = warmCache.warmTargets()
+            self.assertEqual(len(results), len(targets))
+            self.assertFalse([result for _, result in results if isinstance(result, Exception)])
+            self.assertEqual({chain_name for chain_name, _ in results}, {chain_name for chain_name, _ in targets})
+            self.assertNotIn("debug", {chain_name for chain_name, _ in results})
+
+            usdc = config.getContract(8453, name="USDC")
+            self.assertIsNotNone(cache.store.get("abi", 8453, Web3.to_checksum_address(usdc["address"])))
+            self.assertEqual(cache.store.get("implementation", 8453, Web3.to_checksum_address(usdc["address"]))[0]["Proxy"], "1")
+
+            config.cache.clear()
+            calls = len(self.etherscan_calls)
+            asyncio.run(warmCache.warmCache(["base"], rate=1000))
+            self.assertEqual(len(self.etherscan_calls), calls)  # everything comes from the cache
+
+    def test_rateLimiter(self):
+        async def run():
+            limiter = TokenBucket(50)
+            start = time.monotonic()
+            await asyncio.gather(*(limiter.waitAsync() for _ in range(6)))
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.09)
+
+    def test_main_arguments(self):
+        self.assertEqual(warmCache.main([]), 1)
+        self.assertEqual(warmCache.main(["warm", "unknown_chain"]), 1)
+
+
+def _response(body: dict, status_code: int = 200):
+    return MagicMock(ok=status_code < 400, status_code=status_code, content=json.dumps(body).encode(), json=lambda: body)
+
+
+class _FakeAiohttpSession:
+    """Minimal aiohttp.ClientSession answering every GET with `body`, after `delay` seconds."""
+
+    def __init__(self, body: dict, delay: float = 0):
+        self.body, self.delay, self.calls = body, delay, 0
+
+    def get(self, url):
+        session = self
+
+        class Response:
+            status = 200
+
+            async def __aenter__(self):
+                session.calls += 1
+                await asyncio.sleep(session.delay)
+                return self
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+            async def read(self):
+                return json.dumps(session.body).encode()
+
+        return Response()
+
+
+class Test_etherscan(unittest.TestCase):
+    """Shared Etherscan client with a fake HTTP session."""
+
+    def setUp(self):
+        self.client = EtherscanClient(rate=1000, backoff=0)
+        self.session = MagicMock()
+        self.client._session = self.session
+        patcher = patch.object(config, "ethscan_api_key", "KEY")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_errors_are_raised(self):
+        self.session.request.return_value = _response({"status": "0", "message": "NOTOK", "result": "Contract source code not verified"})
+        with self.assertRaises(EtherscanError):
+            self.client.request(1, "contract", "getabi", address="0x0")
+        self.assertEqual(self.session.request.call_count, 1)  # not retried
+        self.session.request.return_value = _response({"status": "0", "message": "No transactions found", "result": []})
+        self.assertEqual(self.client.request(1, "account", "txlist", address="0x0")["result"], [])
+
+    @patch("w3off.observer.fetchABI.w3")
+    def test_errors_are_not_cached(self, mock_w3):
+        mock_w3.eth.chain_id = 1
+        mock_w3.to_checksum_address = Web3.to_checksum_address
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.session.request.return_value = _response({"status": "0", "message": "NOTOK", "result": "Contract source code not verified"})
+        address = "0x00000000000000000000000000000000000000aA"
+        with patch.object(etherscan, "client", self.client), patch.object(cache, "store", CacheStore(os.path.join(tmp_dir.name, "cache.sqlite"))), patch.object(
+            config, "cache", {}
+        ), patch.object(cache, "_dirty", set()):
+            self.assertIsNone(fetchABI(address))
+            self.assertIsNone(cache.checkABICache(address))
+            cache.store.close()
+
+    def test_retries(self):
+        rate_limited = _response({"status": "0", "message": "NOTOK", "result": "Max calls per sec rate limit reached (5/sec)"})
+        self.session.request.side_effect = [rate_limited, _response({}, 503), _response({"status": "1", "result": "[]"})]
+        self.assertEqual(self.client.request(1, "contract", "getabi", address="0x0")["result"], "[]")
+        self.assertEqual(self.session.request.call_count, 3)
+
+        self.session.request.side_effect = None
+        self.session.request.return_value = rate_limited
+        with self.assertRaises(EtherscanError):
+            self.client.request(1, "contract", "getabi", address="0x1")
+        self.assertEqual(self.session.request.call_count, 3 + self.client.retries + 1)
+
+    def test_inflight_requests_are_deduplicated(self):
+        def slow_response(*args, **kwargs):
+            time.sleep(0.1)
+            return _response({"status": "1", "result": "[]"})
+
+        self.session.request.side_effect = slow_response
+        calls = [(1, "contract", "getabi", {"address": "0x0"})] * 5 + [(10, "contract", "getabi", {"address": "0x0"})]
+        results = self.client.batch(calls)
+        self.assertEqual(self.session.request.call_count, 2)
+        self.assertEqual(results[:5], [{"status": "1", "result": "[]"}] * 5)
+
+    def test_async_requests(self):
+        session = _FakeAiohttpSession({"status": "1", "result": "[]"}, delay=0.05)
+
+        async def run():
+            return await asyncio.gather(*(self.client.requestAsync(session, 1, "contract", "getabi", address=address) for address in ("0x0", "0x0", "0x1")))
+
+        self.assertEqual(asyncio.run(run()), [{"status": "1", "result": "[]"}] * 3)
+        self.assertEqual(session.calls, 2)
+
+    def test_tokenBucket(self):
+        limiter = TokenBucket(50)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+def _fillCache(path: str, legacy_json_path: str, worker: int, count: int):
+    """Process of Test_cacheStore.test_processes: writes `count` entries and reads the ones of the others."""
+    store = CacheStore(path, legacy_json_path)
+    for i in range(count):
+        store.put("abi", 1, f"{worker}-{i}", f"[{i}]")
+        store.get("abi", 1, f"{(worker + 1) % 4}-{i}")
+    store.evict(10**6)
+    store.close()
+
+
+class Test_cacheStore(unittest.TestCase):
+    """SQLite backend of the application cache."""
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.store = CacheStore(os.path.join(self.tmp_dir, "cache.sqlite"), os.path.join(self.tmp_dir, "cache.json"))
+        self.addCleanup(self.store.close)
+        for patcher in (patch.object(cache, "store", self.store), patch.object(config, "cache", {}), patch.object(cache, "_dirty", set()), patch.object(cache, "_expires", {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.address = w3.to_checksum_address("0x00000000000000000000000000000000000000aa")
+        self.other = w3.to_checksum_address("0x00000000000000000000000000000000000000bb")
+
+    def test_migrate_json(self):
+        proxy = {"result": [{"Proxy": "1", "Implementation": self.other, "SourceCode": "contract Proxy {}"}]}
+        regular = {"result": [{"Proxy": "0", "Implementation": "", "SourceCode": "contract A {}", "ABI": "[2]"}]}
+        with open(self.store.legacy_json_path, "w") as f:
+            json.dump({"abi": {self.address: "[1]"}, "implementation": {self.address: regular, self.other: proxy}}, f)
+        self.assertEqual(cache.checkABICache(self.address, chain_id=LEGACY_CHAIN_ID), "[1]")  # cached ABI is kept
+        self.assertEqual(cache.checkImplementationCache(self.address, chain_id=LEGACY_CHAIN_ID), {"Proxy": "0", "Implementation": ""})
+        self.assertIsNone(cache.checkImplementationCache(self.other, chain_id=LEGACY_CHAIN_ID))  # proxies are revalidated
+        self.assertFalse(os.path.exists(self.store.legacy_json_path))
+        self.assertEqual(self.store.count(), 3)
+
+    def test_migrate_schema_1(self):
+        conn = sqlite3.connect(self.store.path)
+        conn.execute("CREATE TABLE entries (kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (kind, key))")
+        conn.execute("INSERT INTO entries VALUES ('abi', ?, '\"[]\"')", (self.address,))
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+        conn.close()
+        self.assertEqual(self.store.get("abi", LEGACY_CHAIN_ID, self.address), ("[]", None))
+
+    def test_persist_only_session_entries(self):
+        self.store.put("abi", 1, self.other, "[1]")
+        cache.setABICache(self.address.lower(), "[]", chain_id=1)
+        self.assertEqual(self.store.count(), 1)  # nothing is written before persist_cache
+        cache.persist_cache()
+        self.assertEqual(self.store.get("abi", 1, self.address), ("[]", None))
+        self.assertEqual(self.store.get("abi", 1, self.other), ("[1]", None))
+
+        cache.setABICache(self.address, "[2]", chain_id=1)
+        cache.persist_cache()
+        self.assertEqual(self.store.count("abi"), 2)
+        self.assertEqual(self.store.get("abi", 1, self.address), ("[2]", None))
+
+    def test_lookup_fills_session(self):
+        record = {"Proxy": "0", "Implementation": ""}
+        self.store.put("implementation", config.chain_id, self.address, record)
+        self.assertIsNone(cache.checkImplementationCache(self.other))
+        self.assertEqual(cache.checkImplementationCache(self.address), record)
+        self.assertIn(cache.cacheKey(self.address), config.cache["implementation"])
+        cache.persist_cache()  # lookups are not written back
+        self.assertEqual(self.store.count(), 1)
+
+    def test_chains(self):
+        cache.setABICache(self.address, "[1]", chain_id=1)
+        cache.setABICache(self.address, "[10]", chain_id=10)
+        cache.persist_cache()
+        config.cache.clear()
+        self.assertEqual(cache.checkABICache(self.address, chain_id=1), "[1]")
+        self.assertEqual(cache.checkABICache(self.address, chain_id=10), "[10]")
+        self.assertIsNone(cache.checkABICache(self.address, chain_id=56))
+
+    def test_proxy_ttl(self):
+        proxy = {"result": [{"Proxy": "1", "Implementation": self.other}]}
+        self.assertEqual(cache.setImplementationCache(self.address, proxy, chain_id=1), {"Proxy": "1", "Implementation": self.other})
+        cache.setImplementationCache(self.other, {"result": [{"Proxy": "0", "Implementation": ""}]}, chain_id=1)
+        cache.persist_cache()
+        self.assertEqual(cache.checkImplementationCache(self.address, chain_id=1)["Implementation"], self.other)
+        with patch("time.time", return_value=time.time() + cache.IMPLEMENTATION_TTL + 1):
+            self.assertIsNone(cache.checkImplementationCache(self.address, chain_id=1))
+            self.assertIsNotNone(cache.checkImplementationCache(self.other, chain_id=1))
+            self.assertEqual(self.store.evict(cache.MAX_ENTRIES), 1)
+
+    def test_source_code_is_trimmed(self):
+        response = {"status": "1", "result": [{"Proxy": "0", "Implementation": "", "SourceCode": "x" * 10000, "ABI": "[]"}]}
+        self.assertEqual(cache.setImplementationCache(self.address, response, chain_id=1), {"Proxy": "0", "Implementation": ""})
+        self.assertEqual(cache.checkABICache(self.address, chain_id=1), "[]")  # no need for getabi
+        self.assertIsNone(cache.setImplementationCache(self.other, {"status": "0", "result": "Invalid API Key"}, chain_id=1))
+        cache.persist_cache()
+        self.assertEqual(self.store.count(), 2)
+
+    def test_abis_are_deduplicated(self):
+        abi = json.dumps([{"type": "function", "name": f"f{i}", "inputs": [], "outputs": []} for i in range(100)])
+        for chain_id in (1, 10):
+            cache.setABICache(self.address, abi, chain_id=chain_id)
+            cache.setABICache(self.other, abi, ttl=cache.IMPLEMENTATION_TTL, chain_id=chain_id)
+        cache.persist_cache()
+        conn = sqlite3.connect(self.store.path)
+        self.addCleanup(conn.close)
+        (count, size), = conn.execute("SELECT COUNT(*), SUM(LENGTH(data)) FROM abis").fetchall()
+        self.assertEqual(count, 1)
+        self.assertLess(size, len(abi) / 10)
+        self.assertEqual(self.store.get("abi", 10, self.other)[0], abi)
+
+        cache.setABICache(self.address, "[]", chain_id=1)
+        cache.persist_cache()
+        with patch("time.time", return_value=time.time() + cache.IMPLEMENTATION_TTL + 1):
+            self.store.evict(cache.MAX_ENTRIES)  # only the entry on chain 10 still uses the ABI
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM abis").fetchone()[0], 2)
+        self.assertEqual(self.store.get("abi", 10, self.address)[0], abi)
+
+    def test_processes(self):
+        with open(self.store.legacy_json_path, "w") as f:
+            json.dump({"abi": {self.address: "[]"}}, f)
+        processes = [multiprocessing.Process(target=_fillCache, args=(self.store.path, self.store.legacy_json_path, worker, 50)) for worker in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(self.store.count(), 4 * 50 + 1)  # no lost entries, and cache.json is migrated only once
+        self.assertTrue(os.path.exists(f"{self.store.legacy_json_path}.migrated"))
+
+    def test_shared_between_stores(self):
+        other_store = CacheStore(self.store.path)
+        self.addCleanup(other_store.close)
+        cache.setABICache(self.address, "[1]", chain_id=1)
+        other_store.put("abi", 1, self.other, "[2]")
+        cache.persist_cache()
+        self.assertEqual(other_store.get("abi", 1, self.address), ("[1]", None))
+        self.assertEqual(cache.checkABICache(self.other, chain_id=1), "[2]")
+
+    def test_corrupted_file(self):
+        with open(self.store.path, "wb") as f:
+            f.write(b"\x00garbage" * 100)
+        self.assertIsNone(self.store.get("abi", 1, self.address))
+        self.store.put("abi", 1, self.address, "[]")
+        self.assertEqual(self.store.count(), 1)
+        self.assertEqual(len([name for name in os.listdir(self.tmp_dir) if ".corrupt-" in name]), 1)
+
+    def test_locked(self):
+        conn = sqlite3.connect(self.store.path, isolation_level=None)
+        self.addCleanup(conn.close)
+        self.store.count()  # creates the schema
+        conn.execute("BEGIN IMMEDIATE")  # another process is writing
+        cache.setABICache(self.address, "[]", chain_id=1)
+        with patch("w3off.observer.cacheStore.BUSY_TIMEOUT", 0.1):
+            self.store.close()
+            cache.persist_cache()
+        self.assertIn(("abi", (1, self.address)), cache._dirty)  # kept for the next time
+        conn.execute("ROLLBACK")
+        cache.persist_cache()
+        self.assertEqual(self.store.get("abi", 1, self.address), ("[]", None))
+
+    def test_migrate_schema_2(self):
+        conn = sqlite3.connect(self.store.path)
+        conn.execute(
+            "CREATE TABLE entries (kind TEXT NOT NULL, chain_id INTEGER NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, "
+            "accessed_at REAL NOT NULL, PRIMARY KEY (kind, chain_id, key))"
+        )
+        response = {"result": [{"Proxy": "0", "Implementation": "", "SourceCode": "x" * 10000, "ABI": "[]"}]}
+        conn.execute("INSERT INTO entries VALUES ('implementation', 10, ?, ?, NULL, 1)", (self.address, json.dumps(response)))
+        conn.execute("PRAGMA user_version = 2")
+        conn.commit()
+        conn.close()
+        self.assertEqual(self.store.get("implementation", 10, self.address), ({"Proxy": "0", "Implementation": ""}, None))
+        self.assertEqual(self.store.get("abi", 10, self.address), ("[]", None))
+
+    def test_lru_eviction(self):
+        addresses = [w3.to_checksum_address(f"0x{i:040x}") for i in range(1, 6)]
+        with patch("time.time", side_effect=range(100, 200)):
+            for address in addresses:
+                self.store.put("abi", 1, address, "[]")
+            self.store.get("abi", 1, addresses[0])  # recently used
+            self.assertEqual(self.store.evict(3), 2)
+        self.assertEqual(self.store.count(), 3)
+        self.assertIsNotNone(self.store.get("abi", 1, addresses[0]))
+        self.assertIsNone(self.store.get("abi", 1, addresses[1]))
+        self.assertIsNone(self.store.get("abi", 1, addresses[2]))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,428 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+import requests
+from web3 import EthereumTesterProvider, Web3
+from web3.exceptions import Web3RPCError
+
+import w3off.config as config
+from w3off.rpc import (
+    AsyncFailoverHTTPProvider,
+    FailoverHTTPProvider,
+    Fixture,
+    ResponseCacheMiddleware,
+    batchRead,
+    formatStats,
+    getCacheStats,
+    getStats,
+    handleStatsFlag,
+    resetCacheStats,
+    resetStats,
+    startRecording,
+    startReplay,
+    stopRecording,
+    stopReplay,
+    supportsBatching,
+)
+from w3off.w3provider import chain_contexts, change_chain, w3
+
+
+class FakeRpcNode:
+    """
+    Minimal local JSON-RPC node answering every request with `result` (or an HTTP `status` code) after `delay` seconds.
+    With `batches=False` it rejects batches with 400, like some public endpoints, and with `error` it answers with that JSON-RPC error.
+    """
+
+    def __init__(self, result="0x1", status=200, delay=0, batches=True, error=None):
+        self.result = result
+        self.error = error
+        self.status = status
+        self.delay = delay
+        self.batches = batches
+        self.calls = 0
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                node.calls += 1
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(node.delay)
+                answer = {"error": node.error} if node.error else {"result": node.result}
+                if isinstance(request, list):
+                    body = [{"jsonrpc": "2.0", "id": r["id"], **answer} for r in reversed(request)]
+                else:
+                    body = {"jsonrpc": "2.0", "id": request["id"], **answer}
+                payload = json.dumps(body).encode()
+                rejected = isinstance(request, list) and not node.batches
+                try:
+                    self.send_response(400 if rejected else node.status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client has already given up on this node (timeout or hedged request)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Test_FailoverHTTPProvider(unittest.TestCase):
+    def setUp(self):
+        self.nodes = []
+
+    def tearDown(self):
+        for node in self.nodes:
+            node.stop()
+
+    def node(self, **kwargs):
+        node = FakeRpcNode(**kwargs)
+        self.nodes.append(node)
+        return node
+
+    def test_failover_on_rate_limit(self):
+        limited, healthy = self.node(status=429), self.node(result="0x2a")
+        provider = FailoverHTTPProvider([limited.url, healthy.url], request_timeout=2)
+        self.assertEqual(provider.make_request("eth_chainId", [])["result"], "0x2a")
+        self.assertEqual(limited.calls, 1)
+        # Rate limited endpoint is on cooldown, so the next request goes straight to the healthy one
+        self.assertEqual(provider.endpoint_uri, healthy.url)
+        provider.make_request("eth_chainId", [])
+        self.assertEqual(limited.calls, 1)
+        self.assertEqual(healthy.calls, 2)
+
+    def test_no_failover_on_client_error(self):
+        for status in (400, 401):
+            rejecting, healthy = self.node(status=status), self.node(result="0x2a")
+            provider = FailoverHTTPProvider([rejecting.url, healthy.url], request_timeout=2)
+            with self.assertRaises(requests.HTTPError):
+                provider.make_request("eth_chainId", [])
+            self.assertEqual((rejecting.calls, healthy.calls), (1, 0))
+            self.assertEqual(provider.endpoint_uri, rejecting.url)  # not on cooldown
+
+    def test_failover_on_timeout(self):
+        stuck, healthy = self.node(delay=1), self.node(result="0x2a")
+        provider = FailoverHTTPProvider([stuck.url, healthy.url], request_timeout=0.2)
+        self.assertEqual(provider.make_request("eth_blockNumber", [])["result"], "0x2a")
+
+    def test_hedged_request(self):
+        slow, fast = self.node(result="0x1", delay=1), self.node(result="0x2")
+        provider = FailoverHTTPProvider([slow.url, fast.url], request_timeout=5, hedge_after=0.1)
+        start = time.monotonic()
+        self.assertEqual(provider.make_request("eth_gasPrice", [])["result"], "0x2")
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(slow.calls, 1)
+
+    def test_no_hedging_for_state_changing_calls(self):
+        slow, fast = self.node(result="0x1", delay=0.3), self.node(result="0x2")
+        provider = FailoverHTTPProvider([slow.url, fast.url], request_timeout=5, hedge_after=0.05)
+        self.assertEqual(provider.make_request("eth_sendRawTransaction", ["0x00"])["result"], "0x1")
+        self.assertEqual(fast.calls, 0)
+        responses = provider.make_batch_request([("eth_chainId", []), ("eth_sendRawTransaction", ["0x00"])])
+        self.assertEqual([r["result"] for r in responses], ["0x1", "0x1"])
+        self.assertEqual(fast.calls, 0)
+
+    def test_batch_request(self):
+        node = self.node(result="0x5")
+        provider = FailoverHTTPProvider([node.url])
+        responses = provider.make_batch_request([("eth_chainId", []), ("eth_gasPrice", [])])
+        self.assertEqual([r["result"] for r in responses], ["0x5", "0x5"])
+        self.assertLess(responses[0]["id"], responses[1]["id"])
+        self.assertEqual(node.calls, 1)
+
+
+class Test_AsyncFailoverHTTPProvider(unittest.TestCase):
+    def test_failover(self):
+        limited, rejecting, healthy = FakeRpcNode(status=503), FakeRpcNode(status=401), FakeRpcNode(result="0x2a")
+        for node in (limited, rejecting, healthy):
+            self.addCleanup(node.stop)
+        down = FakeRpcNode()
+        down.stop()  # connection refused
+
+        async def run(endpoint_uris):
+            provider = AsyncFailoverHTTPProvider(endpoint_uris, request_timeout=2)
+            try:
+                return await provider.make_request("eth_chainId", []), provider.endpoint_uri
+            finally:
+                await provider.disconnect()
+
+        response, endpoint_uri = asyncio.run(run([down.url, limited.url, healthy.url]))
+        self.assertEqual(response["result"], "0x2a")
+        self.assertEqual(endpoint_uri, healthy.url)  # the others are on cooldown
+        self.assertEqual((limited.calls, healthy.calls), (1, 1))
+        with self.assertRaises(aiohttp.ClientResponseError):
+            asyncio.run(run([rejecting.url, healthy.url]))
+        self.assertEqual(healthy.calls, 1)
+
+
+class Test_batchRead(unittest.TestCase):
+    def test_single_round_trip(self):
+        node = FakeRpcNode(result="0x5")
+        self.addCleanup(node.stop)
+        w3 = Web3(FailoverHTTPProvider([node.url]))
+        self.assertTrue(supportsBatching(w3))
+        results = batchRead(
+            w3,
+            {
+                "chain_id": lambda: w3.eth.chain_id,
+                "gas_price": lambda: w3.eth.gas_price,
+                "nonce": lambda: w3.eth.get_transaction_count("0x001d3F1ef827552Ae1114027BD3ECF1f086bA0F9"),
+            },
+        )
+        self.assertEqual(results, {"chain_id": 5, "gas_price": 5, "nonce": 5})
+        self.assertEqual(node.calls, 1)
+
+    def test_sequential_fallback(self):
+        w3 = Web3(EthereumTesterProvider())
+        self.assertFalse(supportsBatching(w3))
+        results = batchRead(
+            w3,
+            {"chain_id": lambda: w3.eth.chain_id, "missing": lambda: w3.eth.get_block(10**6)},
+            optional=("missing",),
+        )
+        self.assertEqual(results["chain_id"], w3.eth.chain_id)
+        self.assertIsNone(results["missing"])
+
+    def test_batches_rejected(self):
+        node = FakeRpcNode(result="0x5", batches=False)
+        self.addCleanup(node.stop)
+        w3 = Web3(FailoverHTTPProvider([node.url]))
+        self.assertEqual(batchRead(w3, {"chain_id": lambda: w3.eth.chain_id, "gas_price": lambda: w3.eth.gas_price}), {"chain_id": 5, "gas_price": 5})
+        self.assertEqual(node.calls, 3)  # rejected batch, then one by one
+
+    def test_errors_are_not_resent(self):
+        node = FakeRpcNode(error={"code": -32602, "message": "invalid argument 0"})
+        self.addCleanup(node.stop)
+        w3 = Web3(FailoverHTTPProvider([node.url]))
+        with self.assertRaisesRegex(Web3RPCError, "invalid argument"):
+            batchRead(w3, {"chain_id": lambda: w3.eth.chain_id, "gas_price": lambda: w3.eth.gas_price})
+        self.assertEqual(node.calls, 1)
+
+
+class Test_ResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.node = FakeRpcNode(result="0x5")
+        self.addCleanup(self.node.stop)
+        self.w3 = Web3(FailoverHTTPProvider([self.node.url]))
+        self.w3.middleware_onion.inject(ResponseCacheMiddleware, "response_cache", layer=0)
+        resetCacheStats()
+
+    def test_immutable(self):
+        self.assertEqual(self.w3.eth.chain_id, 5)
+        self.assertEqual(self.w3.eth.chain_id, 5)
+        self.assertEqual(self.node.calls, 1)
+        self.assertEqual(getCacheStats()["methods"]["eth_chainId"], {"hits": 1, "misses": 1})
+
+    def test_block_scoped(self):
+        address = "0x001d3F1ef827552Ae1114027BD3ECF1f086bA0F9"
+        self.assertEqual(self.w3.eth.gas_price, 5)  # head is fetched in the same round trip
+        self.assertEqual(self.node.calls, 1)
+        self.assertEqual(self.w3.eth.gas_price, 5)
+        self.assertEqual(self.w3.eth.block_number, 5)
+        self.assertEqual(self.node.calls, 1)
+
+        # Batch only sends requests which are not cached yet
+        results = batchRead(self.w3, {"gas_price": lambda: self.w3.eth.gas_price, "nonce": lambda: self.w3.eth.get_transaction_count(address)})
+        self.assertEqual(results, {"gas_price": 5, "nonce": 5})
+        self.assertEqual(self.node.calls, 2)
+        self.w3.eth.get_transaction_count(address)
+        self.assertEqual(self.node.calls, 2)
+        self.w3.eth.get_transaction_count(address, "pending")  # never cached
+        self.w3.eth.get_transaction_count(address, "pending")
+        self.assertEqual(self.node.calls, 4)
+
+    def test_batches_rejected(self):
+        node = FakeRpcNode(result="0x7", batches=False)
+        self.addCleanup(node.stop)
+        w3 = Web3(FailoverHTTPProvider([node.url]))
+        w3.middleware_onion.inject(ResponseCacheMiddleware, "response_cache", layer=0)
+        address = "0x001d3F1ef827552Ae1114027BD3ECF1f086bA0F9"
+        with patch("w3off.rpc.responseCache.HEAD_CHECK_INTERVAL", 0.2):
+            self.assertEqual(w3.eth.gas_price, 7)  # batch with the head is rejected, then the head and the request are sent alone
+            self.assertEqual(node.calls, 3)
+            self.assertEqual(w3.eth.gas_price, 7)
+            self.assertEqual(w3.eth.get_balance(address), 7)  # head is fresh, so no batch is tried again
+            self.assertEqual(node.calls, 4)
+            time.sleep(0.25)
+            self.assertEqual(w3.eth.gas_price, 7)  # same head after refreshing it, so the cached response is still valid
+            self.assertEqual(node.calls, 5)
+
+    def test_state_changing_call_invalidates(self):
+        self.w3.eth.gas_price
+        self.node.result = "0x" + "11" * 32
+        self.w3.eth.send_raw_transaction("0x00")
+        self.w3.eth.send_raw_transaction("0x00")
+        self.assertEqual(self.node.calls, 3)
+        self.w3.eth.gas_price
+        self.assertEqual(self.node.calls, 4)
+        self.assertEqual(getCacheStats()["hits"], 0)
+
+
+class Test_stats(unittest.TestCase):
+    def setUp(self):
+        resetStats()
+        self.addCleanup(resetStats)
+
+    def test_rpc_calls(self):
+        limited, healthy = FakeRpcNode(status=429), FakeRpcNode(result="0x2a")
+        self.addCleanup(limited.stop)
+        self.addCleanup(healthy.stop)
+        provider = FailoverHTTPProvider([limited.url + "/secret-key", healthy.url], request_timeout=2)
+        provider.make_request("eth_chainId", [])
+        provider.make_batch_request([("eth_chainId", []), ("eth_gasPrice", [])])
+
+        stats = {(row["endpoint"], row["method"]): row for row in getStats()}
+        limited_row = stats[(limited.url.split("://")[1], "eth_chainId")]  # path (API key) is not recorded
+        self.assertEqual((limited_row["count"], limited_row["errors"]), (1, 1))
+        healthy_row = stats[(healthy.url.split("://")[1], "eth_chainId")]
+        self.assertEqual((healthy_row["count"], healthy_row["errors"]), (2, 0))  # once alone, once in the batch
+        self.assertGreater(healthy_row["bytes_sent"], 0)
+        self.assertGreater(healthy_row["bytes_received"], 0)
+        self.assertEqual(sum(healthy_row["histogram"]), 2)
+        batch_row = stats[(healthy.url.split("://")[1], "batch")]
+        self.assertEqual(batch_row["count"], 1)
+        self.assertEqual(stats[(healthy.url.split("://")[1], "eth_gasPrice")]["bytes_sent"], batch_row["bytes_sent"] // 2)
+
+    def test_batch_members_through_cache(self):
+        node = FakeRpcNode(result="0x5")
+        self.addCleanup(node.stop)
+        w3 = Web3(FailoverHTTPProvider([node.url]))
+        w3.middleware_onion.inject(ResponseCacheMiddleware, "response_cache", layer=0)
+        address = "0x001d3F1ef827552Ae1114027BD3ECF1f086bA0F9"
+        batchRead(w3, {"balance": lambda: w3.eth.get_balance(address), "nonce": lambda: w3.eth.get_transaction_count(address)})
+        self.assertEqual(node.calls, 1)
+
+        counts = {row["method"]: row["count"] for row in getStats()}
+        self.assertEqual(counts, {"batch": 1, "eth_getBalance": 1, "eth_getTransactionCount": 1, "eth_blockNumber": 1})
+        self.assertIn("Total: 3 calls", formatStats())
+
+    @patch("w3off.observer.fetchABI.w3")
+    def test_etherscan_calls(self, mock_w3):
+        from w3off.observer import etherscan
+        from w3off.observer.fetchABI import etherscanRequest
+
+        mock_w3.eth.chain_id = 1
+        session = MagicMock()
+        session.request.return_value = MagicMock(ok=True, status_code=200, content=b'{"status":"1"}', json=lambda: {"status": "1"})
+        with patch.object(config, "ethscan_api_key", "KEY"), patch.object(etherscan.client, "_session", session):
+            etherscanRequest("contract", "getabi", address="0x0")
+        self.assertIn("chainid=1&module=contract&action=getabi&address=0x0", session.request.call_args[0][1])
+        row = getStats()[0]
+        self.assertEqual((row["kind"], row["endpoint"], row["method"], row["count"]), ("etherscan", "api.etherscan.io", "contract.getabi", 1))
+
+    def test_stats_flag(self):
+        import w3off.rpc.stats as stats
+
+        self.addCleanup(setattr, stats, "_print_at_exit", False)
+        argv = ["w3sender", "--stats", "0x00"]
+        with patch("atexit.register"):
+            self.assertTrue(handleStatsFlag(argv))
+        self.assertEqual(argv, ["w3sender", "0x00"])
+        self.assertFalse(handleStatsFlag(argv))
+
+
+class Test_recordReplay(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(stopReplay)
+
+    def test_record_and_replay(self):
+        tester_w3 = Web3(EthereumTesterProvider())
+        account = tester_w3.eth.accounts[0]
+        read = lambda w3: (w3.eth.chain_id, w3.eth.get_balance(account), w3.eth.get_block("latest")["hash"])
+
+        startRecording(tester_w3)
+        recorded = read(tester_w3)
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        stopRecording(tester_w3, path)
+        self.assertNotIn("recorder", tester_w3.middleware_onion)
+
+        replay_w3 = Web3(startReplay(path, latency=0.05))
+        start = time.monotonic()
+        self.assertEqual(read(replay_w3), recorded)
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        with self.assertRaises(Exception):
+            replay_w3.eth.get_balance(tester_w3.eth.accounts[1])  # not recorded
+
+    @patch("w3off.observer.fetchABI.w3")
+    def test_etherscan_replay(self, mock_w3):
+        from w3off.observer import etherscan
+        from w3off.observer.fetchABI import etherscanRequest
+
+        mock_w3.eth.chain_id = 1
+        url = "https://api.etherscan.io/v2/api?chainid=1&module=contract&action=getabi&address=0x0"
+        startReplay(Fixture(etherscan={url: [{"status_code": 200, "body": '{"result": "[]"}'}]}))
+        session = MagicMock()
+        with patch.object(config, "ethscan_api_key", "KEY"), patch.object(etherscan.client, "_session", session):
+            response_json = etherscanRequest("contract", "getabi", address="0x0")
+        self.assertEqual(response_json, {"result": "[]"})
+        session.request.assert_not_called()
+
+
+class Test_ChainContexts(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.initial_chain = config.chain_name
+        change_chain("debug")
+
+    @classmethod
+    def tearDownClass(cls):
+        change_chain(cls.initial_chain)
+
+    def test_switch_reuses_context(self):
+        debug_provider = w3.provider
+        block_number = w3.eth.block_number
+        default_amount = config.default_amount
+        self.addCleanup(setattr, config, "default_amount", default_amount)
+        config.default_amount = 42
+
+        # ETH context has been created at import, so switching to it does not touch the network
+        change_chain("eth")
+        self.assertIs(w3.provider, chain_contexts["eth"].provider)
+        self.assertEqual(config.chain_id, 1)
+        self.assertIn("0xdAC17F958D2ee523a2206206994597C13D831ec7", config.smart_contracts)
+        self.assertNotEqual(config.default_amount, 42)
+
+        change_chain("debug")
+        self.assertIs(w3.provider, debug_provider)
+        self.assertEqual(config.chain_name, "debug")
+        self.assertEqual(config.default_amount, 42)  # values changed while the chain was active are kept
+        self.assertEqual(w3.eth.block_number, block_number)  # test contracts are not deployed again
+
+
+class Test_LazyProvider(unittest.TestCase):
+    def test_import_does_no_network_io(self):
+        code = (
+            "import socket\n"
+            "def refuse(*args, **kwargs): raise AssertionError('network I/O at import')\n"
+            "socket.socket.connect = refuse\n"
+            "socket.create_connection = refuse\n"
+            "import w3off\n"
+            "from w3off.w3provider import LazyProvider, w3\n"
+            "assert isinstance(w3.provider, LazyProvider)\n"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
+import io
 import json
 import os
+import tempfile
 from pprint import pprint
 import unittest
 from unittest.mock import patch
@@ -13,7 +15,11 @@ from w3off.signer.vault import (
     get_pkey_from_keystore,
     get_pkey_from_prompt,
 )
-from w3off.signer.w3signer import dictToSignedTx, signTx, signedTxToDict
+from w3off.helpers.txHelpers import decodeRawTx
+from w3off.signer import signingPool
+from w3off.signer.signingPool import signTxsParallel
+from w3off.signer.w3signer import dictToSignedTx, main_batch, run_batch_signer, signTx, signedTxToDict
+from w3off.w3provider import w3
 
 
 class Test_Signer(unittest.TestCase):
@@ -85,5 +91,130 @@ class Test_Vault(unittest.TestCase):
         self.assertEqual(vault.pkey, pkey_input)
 
 
+class Test_BatchSigner(unittest.TestCase):
+    keystore_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "keystore-default.json")
+    sender = "0x001d3F1ef827552Ae1114027BD3ECF1f086bA0F9"  # address of keystore-default.json
+
+    def setUp(self):
+        import w3off.test.data.txTestAaveSupply as t
+
+        self.txs = [{**{key: value for key, value in t.txTest2.items() if key != "from"}, "nonce": nonce} for nonce in range(5)]
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.input_path = os.path.join(self.tmp.name, "unsigned.jsonl")
+        with open(self.input_path, "w") as f:
+            f.write("\n".join(json.dumps(tx) for tx in self.txs) + "\n\n")
+
+    def test_one_unlock(self):
+        output_path = os.path.join(self.tmp.name, "signed.jsonl")
+        pkeys_while_signing = []
+        sign_transaction = w3.eth.account.sign_transaction
+
+        def sign(tx, pkey):
+            pkeys_while_signing.append(vault.pkey)
+            return sign_transaction(tx, pkey)
+
+        with patch.object(w3.eth.account, "decrypt", wraps=w3.eth.account.decrypt) as mock_decrypt, patch.object(w3.eth.account, "sign_transaction", side_effect=sign):
+            count = run_batch_signer(self.input_path, output_path, keystore_file=self.keystore_file, keystore_pwd="test", ignoreNetworkCheckPrompt=True)
+        self.assertEqual(count, 5)
+        self.assertEqual(mock_decrypt.call_count, 1)  # keystore KDF runs once for the whole batch
+        self.assertTrue(all(isinstance(pkey, bytes) for pkey in pkeys_while_signing))  # stays encrypted in the vault
+        self.assertIsNone(vault.pkey)
+
+        with open(output_path) as f:
+            signed = [json.loads(line) for line in f]
+        self.assertEqual([decodeRawTx(record["raw_transaction"])["nonce"] for record in signed], list(range(5)))
+        self.assertEqual({decodeRawTx(record["raw_transaction"])["from"] for record in signed}, {self.sender})
+
+    def test_stdout(self):
+        stdout = io.StringIO()
+        with patch("sys.stdout", stdout), patch("sys.stderr", io.StringIO()):
+            run_batch_signer(self.input_path, pkey="f8f8a2f43c8376ccb0871305060d7b27b0554d2cc72bccf41b2705608452f315", ignoreNetworkCheckPrompt=True)
+        records = [json.loads(line) for line in stdout.getvalue().splitlines()]  # only signed transactions, messages go to stderr
+        self.assertEqual(len(records), 5)
+        self.assertEqual(dictToSignedTx(records[0]).hash.to_0x_hex(), records[0]["hash"])
+
+    def test_invalid_line(self):
+        with open(self.input_path, "a") as f:
+            f.write("not a transaction\n")
+        with patch("sys.stdout", io.StringIO()), self.assertRaisesRegex(ValueError, "Line 7"):
+            run_batch_signer(self.input_path, os.path.join(self.tmp.name, "signed.jsonl"), pkey="f8f8a2f43c8376ccb0871305060d7b27b0554d2cc72bccf41b2705608452f315", ignoreNetworkCheckPrompt=True)
+        self.assertIsNone(vault.pkey)
+
+
+class Test_SigningPool(unittest.TestCase):
+    pkey = "f8f8a2f43c8376ccb0871305060d7b27b0554d2cc72bccf41b2705608452f315"
+
+    def setUp(self):
+        import w3off.test.data.txTestAaveSupply as t
+
+        self.txs = [{**{key: value for key, value in t.txTest2.items() if key != "from"}, "nonce": nonce} for nonce in range(10)]
+        get_pkey_from_prompt(self.pkey)
+        self.addCleanup(vault.clear_pkey)
+
+    def test_order_and_progress(self):
+        expected = [signTx(tx, keep_pkey=True).raw_transaction for tx in self.txs]
+        reports = []
+        signed = list(signTxsParallel(iter(self.txs), workers=2, chunk_size=3, progress=lambda *report: reports.append(report)))
+        self.assertEqual([signed_tx.raw_transaction for signed_tx in signed], expected)  # signatures are deterministic, order is kept
+        self.assertEqual([total for _, _, total in reports], [3, 6, 9, 10])
+        per_worker = {}
+        for pid, worker_signed, _ in reports:
+            self.assertNotEqual(pid, os.getpid())
+            per_worker[pid] = worker_signed
+        self.assertEqual(sum(per_worker.values()), 10)
+        self.assertIsNotNone(vault.pkey)  # the caller removes it
+
+    def test_wipe(self):
+        buffers = bytearray(b"encrypted"), bytearray(b"key")
+        signingPool._wipe(*buffers)
+        self.assertEqual(buffers, (bytearray(9), bytearray(3)))
+
+    def test_batch_signer_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "unsigned.jsonl")
+            with open(input_path, "w") as f:
+                f.write("\n".join(json.dumps(tx) for tx in self.txs))
+            outputs = []
+            for workers in (1, 3):
+                output_path = os.path.join(tmp, f"signed-{workers}.jsonl")
+                with patch("sys.stdout", io.StringIO()):
+                    self.assertEqual(run_batch_signer(input_path, output_path, workers=workers, pkey=self.pkey, ignoreNetworkCheckPrompt=True), 10)
+                with open(output_path) as f:
+                    outputs.append(f.read())
+            self.assertEqual(outputs[0], outputs[1])
+            self.assertIsNone(vault.pkey)
+
+    def test_workers_argument(self):
+        for argv in (["unsigned.jsonl", "--workers"], ["unsigned.jsonl", "--workers", "many"], ["unsigned.jsonl", "--workers", "-2"]):
+            with patch("sys.stdout", io.StringIO()) as stdout, patch("w3off.signer.w3signer.run_batch_signer") as run:
+                self.assertEqual(main_batch(argv), 1)
+            self.assertIn("Usage:", stdout.getvalue())
+            run.assert_not_called()
+        with patch("w3off.signer.w3signer.run_batch_signer") as run:
+            self.assertEqual(main_batch(["--workers", "0", "unsigned.jsonl"]), 0)
+        run.assert_called_once_with("unsigned.jsonl", workers=0)
+
+    def test_pool_is_closed_when_writing_fails(self):
+        closed = []
+
+        def signTxsParallel(txs, workers, progress):
+            try:
+                yield from (signTx(tx, keep_pkey=True) for tx in txs)
+            finally:
+                closed.append(vault.pkey is not None)  # before the pkey is removed
+
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "unsigned.jsonl")
+            with open(input_path, "w") as f:
+                f.write("\n".join(json.dumps(tx) for tx in self.txs))
+            with patch("sys.stdout", io.StringIO()), patch("w3off.signer.w3signer.signTxsParallel", signTxsParallel), patch(
+                "w3off.signer.w3signer.signedTxToDict", side_effect=OSError("disk full")
+            ), self.assertRaises(OSError):
+                run_batch_signer(input_path, os.path.join(tmp, "signed.jsonl"), workers=2, pkey=self.pkey, ignoreNetworkCheckPrompt=True)
+        self.assertEqual(closed, [True])
+        self.assertIsNone(vault.pkey)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,12 +1,20 @@
 #!/usr/bin/env python
+import sys
+
 import w3off.cli.prompts as cli_prompts
 from w3off.observer.w3observer import run_observer
 from w3off.sender.w3sender import run_sender
 from w3off.signer.w3signer import run_signer
+from w3off.rpc import handleStatsFlag
 from w3off.w3provider import estimateBaseFee, w3
 
 
 def main():
+    handleStatsFlag()  # --stats prints network call summary at exit
+    if sys.argv[1:2] == ["cache"]:  # w3off cache warm ...
+        from w3off.observer.warmCache import main as cache_main
+
+        sys.exit(cache_main(sys.argv[2:]))
     # Check stability & prerequisites
 
     # ---------------------------------------------------------
@@ -2,36 +2,107 @@
 # from eth_utils import keccak
 import os
 import re
-from eth_tester import EthereumTester
+from dataclasses import dataclass
 from web3 import Web3, EthereumTesterProvider
+from web3.providers.base import BaseProvider, JSONBaseProvider
 
 import w3off.config as config
 from w3off.cli.helpers import bcolors
-from w3off.config import getChainName, getDefault
-from w3off.test.ethTesterEnv import setEthTesterEnv
+from w3off.config import getChainName, getDefault, getRpcProviders, getSmartContracts
+from w3off.rpc import FailoverHTTPProvider, ResponseCacheMiddleware
 
 
 w3 = None  # Instance of web3 (singleton)
 eth_tester = None  # Instance of eth_tester (singleton)
 t_initial = None  # Snapshot of eth_tester, if one has been initialized (for easy revert in tests)
 
+# Config values which depend on the chain. They are saved and restored from the chain context on every chain switch.
+CHAIN_SCOPED_VALUES = (
+    "chain_id",
+    "chain_name",
+    "web3_provider_url",
+    "default_amount",
+    "default_maxgas",
+    "gas_leeway_coef",
+    "default_pkey_mode",
+    "default_keystore_file",
+    "default_sender",
+    "default_destination",
+    "smart_contracts_by_name",
+    "smart_contracts",
+    "default_erc20",
+    "default_contract",
+    "default_abi",
+)
+
+
+@dataclass
+class ChainContext:
+    """Connection to one chain together with its resolved provider URL, defaults and smart contracts, created once per chain."""
+
+    name: str
+    chain_id: int
+    provider: BaseProvider
+    provider_url: str
+    values: dict  # chain-scoped config values, see CHAIN_SCOPED_VALUES
+    status: bool = None  # result of the last connection check
+
+
+chain_contexts = {}  # chain name -> ChainContext
+initial_chain_values = {}  # chain-scoped config values as loaded from config (ETH defaults)
+
+
+class LazyProvider(JSONBaseProvider):
+    """
+    Placeholder provider of `w3` until its first request. Importing w3off creates `w3` with this provider, so it does no network I/O
+    (nor prompts for RPC provider environment variables). The first request connects to the current chain (see connect()).
+    """
+
+    def make_request(self, method, params):
+        return connect().provider.make_request(method, params)
+
+    def make_batch_request(self, batch_requests):
+        return connect().provider.make_batch_request(batch_requests)
+
+    def is_connected(self, show_traceback: bool = False):
+        return connect().provider.is_connected(show_traceback)
+
 
 def initialize_provider():
     global w3, eth_tester
     if config.DEBUG:
+        from eth_tester import EthereumTester
+
         eth_tester = EthereumTester()
         provider = EthereumTesterProvider(eth_tester)
     else:
-        # adapter = requests.adapters.HTTPAdapter()
-        # session = requests.Session()
-        # session.mount('https://', adapter)
-        provider = Web3.HTTPProvider(config.web3_provider_url)
+        provider = LazyProvider()
 
     w3 = Web3(provider)
+    # Innermost layer, so that it caches raw node responses of whichever provider is active (chain switches keep it)
+    w3.middleware_onion.inject(ResponseCacheMiddleware, "response_cache", layer=0)
     if config.DEBUG:
         w3.eth_tester = eth_tester
 
 
+def connect():
+    """Connects `w3` to the current chain unless it is already connected. Returns the chain context. No network calls are made."""
+    context = chain_contexts.get(config.chain_name)
+    if context is None:
+        provider, config.web3_provider_url = make_provider(config.chain_name)
+        w3.provider = provider
+        context = register_chain_context(config.chain_name, provider)
+    return context
+
+
+def warm_up():
+    """Connects `w3` to the current chain (if not connected yet), checks the connection once and prints its status."""
+    context = connect()
+    if context.status is None:
+        context.status = show_provider_status()
+    return context.status
+
+
 def show_provider_status():
     status = w3.is_connected()
     status_str = f"{bcolors.OKGREEN}{status}{bcolors.ENDC}" if status else f"{bcolors.FAIL}{status}{bcolors.ENDC}"
@@ -58,6 +129,43 @@ def insert_rpc_placeholder(full_str, matched_str):
     return result
 
 
+def resolve_rpc_url(rpc_string: str, prompt: bool = True):
+    """Substitutes {ENV_VAR} placeholders in RPC provider string. Returns None if a variable is missing and `prompt` is False."""
+    pattern = r"\{(.*?)\}"
+    if not prompt and any(not os.environ.get(name) for name in re.findall(pattern, rpc_string)):
+        return None
+    return re.sub(
+        pattern,
+        lambda match: f'{insert_rpc_placeholder(rpc_string, f"{match.group(1)}")}',
+        rpc_string,
+    )
+
+
+def resolve_rpc_urls(chosen_chain: str, provider_url: str = None, prompt: bool = True):
+    """
+    Resolved RPC provider URLs of the chain, primary (or `provider_url`) first. Only the primary provider prompts for missing
+    environment variables (if `prompt`), fallbacks without them are skipped. Empty if the primary cannot be resolved.
+    """
+    rpc_strings = getRpcProviders(chosen_chain)
+    primary = provider_url or resolve_rpc_url(rpc_strings[0], prompt)
+    if not primary:
+        return []
+    return [primary] + [url for url in (resolve_rpc_url(rpc_string, prompt=False) for rpc_string in rpc_strings[1:]) if url]
+
+
+def make_provider(chosen_chain: str, provider_url: str = None):
+    """Creates pooled failover provider for the chain. Returns the provider and its primary (resolved) URL."""
+    provider_urls = resolve_rpc_urls(chosen_chain, provider_url)
+    provider = FailoverHTTPProvider(
+        provider_urls,
+        request_timeout=config.rpc_timeout,
+        hedge_after=config.rpc_hedge_after,
+        cooldown=config.rpc_cooldown,
+        pool_maxsize=config.rpc_pool_maxsize,
+    )
+    return provider, provider_urls[0]
+
+
 def update_default_values(chosen_chain: str = None):
     """Updates some default values based on user chain selection"""
     chosen_chain = chosen_chain or getChainName(config.chain_id)
@@ -72,10 +180,8 @@ def update_default_values(chosen_chain: str = None):
     config.default_sender = getDefault(chosen_chain, "sender") or config.default_sender
     config.default_destination = getDefault(chosen_chain, "destination") or config.default_destination
 
-    config.smart_contracts_by_name = config.chains[chosen_chain].get("smart_contracts",{})
-    for key in config.smart_contracts_by_name:
-        config.smart_contracts_by_name[key]["name"] = key
-    config.smart_contracts = {v["address"]: {"name": k, **v} for k, v in config.smart_contracts_by_name.items()}
+    # Prebuilt views of the contract registry, nothing is rebuilt on chain switches
+    config.smart_contracts_by_name, config.smart_contracts = getSmartContracts(chosen_chain)
 
     config.default_erc20 = config.smart_contracts_by_name.get(getDefault(chosen_chain, "erc20"), {}).get("address", False) or config.default_erc20
     config.default_contract = (
@@ -84,46 +190,87 @@ def update_default_values(chosen_chain: str = None):
     config.default_abi = config.smart_contracts.get(config.default_contract, {}).get("abi") or config.default_abi
 
 
-def change_chain(chosen_chain):
-    global w3, eth_tester
-    # Use environment variable for API key in provider URL
-    status = None
-    pattern = r"\{(.*?)\}"
-    rpc_string = config.chains[chosen_chain]["rpc_provider"]
-    provider_url = re.sub(
-        pattern,
-        lambda match: f'{insert_rpc_placeholder(rpc_string, f"{match.group(1)}")}',
-        rpc_string,
+def snapshot_chain_values():
+    """Chain-scoped config values (see CHAIN_SCOPED_VALUES) currently set in `config`."""
+    return {key: getattr(config, key) for key in CHAIN_SCOPED_VALUES}
+
+
+def apply_chain_values(values: dict):
+    for key, value in values.items():
+        setattr(config, key, value)
+
+
+def register_chain_context(chosen_chain: str, provider, status: bool = None):
+    """Stores current provider and config values as a ready-to-use context of `chosen_chain`."""
+    chain_contexts[chosen_chain] = ChainContext(
+        name=chosen_chain,
+        chain_id=config.chain_id,
+        provider=provider,
+        provider_url=config.web3_provider_url,
+        values=snapshot_chain_values(),
+        status=status,
     )
-    if config.web3_provider_url.lower() != provider_url.lower():
-        if chosen_chain == "debug":
-            if not eth_tester:
-                eth_tester = EthereumTester()
-                # eth_tester.t_initial = eth_tester.take_snapshot()
-            w3.provider = EthereumTesterProvider(eth_tester)
-            w3.eth_tester = eth_tester
-            config.web3_provider_url = "debug"
-        else:
-            w3.provider = Web3.HTTPProvider(provider_url)
-
-        config.chain_id = w3.eth.chain_id
-        config.chain_name = getChainName(config.chain_id)
-        config.web3_provider_url = provider_url
-        status = show_provider_status()
-        update_default_values(chosen_chain)
-        if chosen_chain == "debug":
-            setEthTesterEnv(w3, w3.eth_tester)
-
-    status = status or w3.is_connected()
+    return chain_contexts[chosen_chain]
+
+
+def create_chain_context(chosen_chain: str):
+    """Connects to `chosen_chain` and computes its default values (only done once per chain, see change_chain)."""
+    global eth_tester
+    if chosen_chain == "debug":
+        from eth_tester import EthereumTester
+
+        if not eth_tester:
+            eth_tester = EthereumTester()
+        provider, provider_url = EthereumTesterProvider(eth_tester), "debug"
+        w3.eth_tester = eth_tester
+    else:
+        provider, provider_url = make_provider(chosen_chain)
+    w3.provider = provider
+
+    # Defaults of every chain fall back to the initial (ETH) ones, so the result does not depend on previously visited chains
+    apply_chain_values(initial_chain_values)
+    config.chain_id = w3.eth.chain_id
+    config.chain_name = getChainName(config.chain_id)
+    config.web3_provider_url = provider_url
+    status = show_provider_status()
+    update_default_values(chosen_chain)
+    if chosen_chain == "debug":
+        from w3off.test.ethTesterEnv import setEthTesterEnv
+
+        setEthTesterEnv(w3, w3.eth_tester)
+    return register_chain_context(chosen_chain, provider, status)
+
+
+def use_provider(provider, status: bool = True):
+    """Makes `provider` the connection of the current chain, e.g. a replay of recorded responses (see w3off.rpc.recordReplay)."""
+    w3.provider = provider
+    return register_chain_context(config.chain_name, provider, status)
+
+
+def change_chain(chosen_chain):
+    """Switches `w3` and chain-scoped config values to `chosen_chain`. Connection and defaults are created on the first switch and reused afterwards."""
+    current = connect()
+    if current.name == chosen_chain and w3.provider is current.provider:
+        return warm_up()
+    current.values = snapshot_chain_values()  # keep changes made while the chain was active (e.g. fetched ERC20 info)
+
+    context = chain_contexts.get(chosen_chain)
+    if context is None:
+        context = create_chain_context(chosen_chain)
+    else:
+        w3.provider = context.provider
+        apply_chain_values(context.values)
+
     assert chosen_chain == getChainName(
         config.chain_id
     ), "Mismatch between chain name in transaction and the one in the provider after its initialization."
-    return status
+    return context.status
 
 
-def estimateBaseFee():
+def estimateBaseFee(block: dict = None):
+    """Base fee of the latest block. Pass the latest `block` if it has already been fetched (e.g. via batchRead) to save a round trip."""
     try:
-        base_fee = w3.eth.get_block("latest").get("baseFeePerGas")
+        base_fee = (block or w3.eth.get_block("latest")).get("baseFeePerGas")
     except Exception as e:
         print("Note: could not estimate base fee from the latest block - using gas_price RPC call instead (this is ok)")
         base_fee = w3.eth.gas_price
@@ -133,14 +280,18 @@ def estimateBaseFee():
 # --------------------------
 # ----- INITIALIZATION -----
 # --------------------------
+# No network calls here: the provider connects on first use of `w3` (or explicitly via warm_up())
 initialize_provider()
-show_provider_status()
+initial_chain_values = snapshot_chain_values()
 
 if config.DEBUG:
     # Deploy some smart contracts and addresses for use in tests
     # from test.ethTesterContracts import usdt_ethtester, aave_v3_ethtester
+    from w3off.test.ethTesterEnv import setEthTesterEnv
+
     w3 = setEthTesterEnv(w3, eth_tester)
     eth_tester = w3.eth_tester
+    register_chain_context(config.chain_name, w3.provider, True)
 
 
 def resetEthTester():